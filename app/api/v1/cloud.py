@@ -0,0 +1,252 @@
+import asyncio
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+from app.api.v1.web import require_authenticated_user
+from app.crud.artifact import get_artifact
+from app.crud.experiment import get_experiment_by_id
+from app.core.config import settings
+from app.utils.artifacts import load_cartesian
+from app.utils.cloud_store import cloud_store, layer_slice, rounded, source_key
+from app.utils.formats import EXPORT_FORMATS, iter_export, export_size
+from app.utils.geometry import bounding_box
+from app.utils.jobs import job_manager
+from app.utils.meshing import MESH_HEADER_SIZE, mesh_path, mesh_status
+from app.utils.tiles import MAX_OCTREE_DEPTH, parse_tile, select_points, tile_orders
+
+router = APIRouter()
+
+
+def load_cloud(experiment_id: int, source: str) -> dict:
+    """Колонки облака, декартовы координаты и границы (из артефактов, если готовы)"""
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+
+    phi, theta, r = cloud_store.load(experiment_id, source)
+    xyz = load_cartesian(experiment_id, source)
+
+    artifact = get_artifact(experiment_id, source)
+    if artifact and artifact.status == "ready" and artifact.points_count == len(r):
+        bbox = {
+            "min": [artifact.min_x, artifact.min_y, artifact.min_z],
+            "max": [artifact.max_x, artifact.max_y, artifact.max_z],
+        }
+    else:
+        bbox = bounding_box(xyz)
+    return {"phi": phi, "theta": theta, "r": r, "xyz": xyz, "bbox": bbox}
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/tiles")
+async def get_tiles_api(
+    experiment_id: int,
+    source: str,
+    depth: int = Query(3, ge=0, le=MAX_OCTREE_DEPTH),
+    user=Depends(require_authenticated_user)
+):
+    """Непустые узлы октодерева облака на заданной глубине"""
+    source = source_key(source)
+    cloud = await asyncio.to_thread(load_cloud, experiment_id, source)
+    tile_order = await asyncio.to_thread(tile_orders.get, experiment_id, source, depth, cloud["xyz"], cloud["bbox"])
+    tiles = tile_order.tiles()
+    return JSONResponse(content={"ok": True, "depth": depth, "bbox": cloud["bbox"], "tiles": tiles})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/layers")
+async def get_layers_api(
+    experiment_id: int,
+    source: str,
+    user=Depends(require_authenticated_user)
+):
+    """
+    Таблица слоёв облака из кеша: theta, начало и число точек серии, min/max/среднее r.
+    contiguous — облако хранится слоями подряд, и слой отдаётся /chunk срезом.
+    """
+    source = source_key(source)
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+    table = await asyncio.to_thread(cloud_store.layers, experiment_id, source)
+    layers = [
+        {"theta": t, "start": start, "count": count, "r_min": r_min, "r_max": r_max, "r_mean": r_mean}
+        for t, start, count, r_min, r_max, r_mean in table.tolist()
+    ]
+    return JSONResponse(content={"ok": True, "contiguous": layer_slice(table) is not None, "layers": layers})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/chunk")
+async def get_chunk_api(
+    experiment_id: int,
+    source: str,
+    theta_min: float | None = None,
+    theta_max: float | None = None,
+    phi_min: float | None = None,
+    phi_max: float | None = None,
+    tile: str | None = None,
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    format: str = Query("bin", pattern="^(json|bin)$"),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Часть облака: диапазон слоёв theta, сектор phi и/или тайл октодерева ('depth/x/y/z').
+    offset/limit позволяют забирать большую выборку по частям.
+    format=bin — float32 x, y, z подряд; format=json — сферические координаты.
+    """
+    source = source_key(source)
+    cloud = await asyncio.to_thread(load_cloud, experiment_id, source)
+    # Только диапазон слоёв у облака, хранящегося слоями подряд, — срез без маски по всем точкам
+    idx = None
+    if phi_min is None and phi_max is None and not tile:
+        table = await asyncio.to_thread(cloud_store.layers, experiment_id, source)
+        idx = layer_slice(table, theta_min, theta_max)
+    # Только тайл — точки узла октодерева из кешированного порядка по тайлам (вьювер грузит узлами)
+    if tile and theta_min is None and theta_max is None and phi_min is None and phi_max is None:
+        try:
+            depth, cell = parse_tile(tile)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        tile_order = await asyncio.to_thread(
+            tile_orders.get, experiment_id, source, depth, cloud["xyz"], cloud["bbox"],
+        )
+        idx = tile_order.indices(cell)
+    if idx is None:
+        try:
+            idx = await asyncio.to_thread(
+                select_points,
+                cloud["phi"], cloud["theta"], cloud["xyz"], cloud["bbox"],
+                theta_min, theta_max, phi_min, phi_max, tile,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if isinstance(idx, slice):
+        rows = range(idx.start, idx.stop)
+        total = len(rows)
+        rows = rows[offset:offset + limit if limit else None]
+        idx, count = slice(rows.start, rows.stop), len(rows)
+    else:
+        total = len(idx)
+        idx = idx[offset:offset + limit if limit else None]
+        count = len(idx)
+    headers = {"X-Total-Count": str(total), "X-Points-Count": str(count)}
+
+    if format == "bin":
+        data = np.ascontiguousarray(cloud["xyz"][idx], dtype="<f4").tobytes()
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+    coordinates = [
+        {'phi': p, 'r': d, 'theta': t}
+        for p, d, t in zip(
+            rounded(cloud["phi"][idx]),
+            rounded(cloud["r"][idx]),
+            rounded(cloud["theta"][idx]),
+        )
+    ]
+    return JSONResponse(
+        content={"ok": True, "total": total, "count": len(coordinates), "coordinates": coordinates},
+        headers=headers,
+    )
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/export")
+async def export_experiment_api(
+    experiment_id: int,
+    source: str,
+    fmt: str = Query("ply", pattern="^(ply|pcd|las)$"),
+    user=Depends(require_authenticated_user)
+):
+    """Потоковая выгрузка эксперимента в PLY / PCD / LAS (оси отчёта, метры)"""
+    source = source_key(source)
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+
+    phi, theta, r = await asyncio.to_thread(cloud_store.load, experiment_id, source)
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        iter_export(fmt, phi, theta, r),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="experiment_{source}_{experiment_id}.{extension}"',
+            "Content-Length": str(export_size(fmt, len(r))),
+        },
+    )
+
+
+def _mesh_params(phi_step: float | None, max_edge: float | None) -> tuple[float, float]:
+    return phi_step or settings.MESH_PHI_STEP, max_edge or settings.MESH_MAX_EDGE
+
+
+def _mesh_state(experiment_id: int, source: str, phi_step: float, max_edge: float) -> dict:
+    params = {"phi_step": phi_step, "max_edge": max_edge}
+    job = job_manager.latest("mesh", experiment_id, source, params)
+    return mesh_status(experiment_id, source, phi_step, max_edge, job)
+
+
+@router.post("/{user_id}/api/experiments/{experiment_id}/mesh")
+async def build_mesh_api(
+    experiment_id: int,
+    source: str,
+    phi_step: float | None = Query(None, gt=0, le=10),
+    max_edge: float | None = Query(None, gt=0, le=10),
+    user=Depends(require_authenticated_user)
+):
+    """Постановка построения поверхности в очередь задач (если актуальной ещё нет)"""
+    source = source_key(source)
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+
+    phi_step, max_edge = _mesh_params(phi_step, max_edge)
+    state = await asyncio.to_thread(_mesh_state, experiment_id, source, phi_step, max_edge)
+    if state["status"] in ("ready", "pending"):
+        return JSONResponse(content={"ok": True, **state})
+
+    job = await asyncio.to_thread(
+        job_manager.submit, "mesh", experiment_id, source,
+        {"phi_step": phi_step, "max_edge": max_edge}, 0, user.id,
+    )
+    state = await asyncio.to_thread(mesh_status, experiment_id, source, phi_step, max_edge, job)
+    return JSONResponse(content={"ok": True, **state})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/mesh/status")
+async def get_mesh_status_api(
+    experiment_id: int,
+    source: str,
+    phi_step: float | None = Query(None, gt=0, le=10),
+    max_edge: float | None = Query(None, gt=0, le=10),
+    user=Depends(require_authenticated_user)
+):
+    source = source_key(source)
+    phi_step, max_edge = _mesh_params(phi_step, max_edge)
+    state = await asyncio.to_thread(_mesh_state, experiment_id, source, phi_step, max_edge)
+    return JSONResponse(content={"ok": True, **state})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/mesh")
+async def get_mesh_api(
+    experiment_id: int,
+    source: str,
+    phi_step: float | None = Query(None, gt=0, le=10),
+    max_edge: float | None = Query(None, gt=0, le=10),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Готовая поверхность одним бинарным файлом: заголовок X-Header-Size байт,
+    затем float32 позиции и нормали (по X-Vertices-Count * 3) и uint32 индексы (X-Triangles-Count * 3).
+    """
+    source = source_key(source)
+    phi_step, max_edge = _mesh_params(phi_step, max_edge)
+    state = await asyncio.to_thread(_mesh_state, experiment_id, source, phi_step, max_edge)
+    if state["status"] != "ready":
+        raise HTTPException(status_code=409, detail=f"Поверхность не готова: {state['status']}")
+
+    return FileResponse(
+        mesh_path(experiment_id, source),
+        media_type="application/octet-stream",
+        headers={
+            "X-Header-Size": str(MESH_HEADER_SIZE),
+            "X-Vertices-Count": str(state["vertices"]),
+            "X-Triangles-Count": str(state["triangles"]),
+        },
+    )
@@ -0,0 +1,91 @@
+import asyncio
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from app.api.v1.web import require_authenticated_user
+from app.crud.experiment import get_experiment_by_id
+from app.schemas.filter import FilterParams
+from app.utils.artifacts import load_cartesian
+from app.utils.cloud_store import cloud_store, source_key
+from app.utils.filtering import filter_path, read_filtered
+from app.utils.formats import EXPORT_FORMATS, iter_export, export_size
+from app.utils.jobs import JobError, job_manager
+
+router = APIRouter()
+
+
+async def run_filter(experiment_id: int, source: str, params: FilterParams, user_id: int):
+    """
+    Индексы точек после фильтрации и сводка: из кеша или задачей в пуле процессов
+    (цикл событий не блокируется, пока идёт расчёт)
+    """
+    if not await asyncio.to_thread(get_experiment_by_id, experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+    try:
+        await job_manager.run("filter", experiment_id, source, params.model_dump(), user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    path = await asyncio.to_thread(filter_path, experiment_id, source, params)
+    return await asyncio.to_thread(read_filtered, path)
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/filter")
+async def filter_summary_api(
+    experiment_id: int,
+    source: str,
+    params: FilterParams = Depends(),
+    user=Depends(require_authenticated_user)
+):
+    """Сводка фильтрации: сколько точек осталось и сколько убрал каждый этап"""
+    source = source_key(source)
+    _, stats = await run_filter(experiment_id, source, params, user.id)
+    return JSONResponse(content={"ok": True, "params": params.model_dump(), **stats})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/filtered")
+async def filtered_cloud_api(
+    experiment_id: int,
+    source: str,
+    params: FilterParams = Depends(),
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    user=Depends(require_authenticated_user)
+):
+    """Очищенное облако: float32 x, y, z подряд (оси вьювера, как /cartesian)"""
+    source = source_key(source)
+    idx, stats = await run_filter(experiment_id, source, params, user.id)
+    idx = idx[offset:offset + limit if limit else None]
+    xyz = await asyncio.to_thread(load_cartesian, experiment_id, source)
+    data = np.ascontiguousarray(xyz[idx], dtype="<f4").tobytes()
+    return Response(content=data, media_type="application/octet-stream", headers={
+        "X-Total-Count": str(stats["kept"]),
+        "X-Points-Count": str(len(idx)),
+        "X-Removed-Count": str(stats["total"] - stats["kept"]),
+    })
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/filtered/export")
+async def export_filtered_api(
+    experiment_id: int,
+    source: str,
+    params: FilterParams = Depends(),
+    fmt: str = Query("ply", pattern="^(ply|pcd|las)$"),
+    user=Depends(require_authenticated_user)
+):
+    """Потоковая выгрузка очищенного облака в PLY / PCD / LAS"""
+    source = source_key(source)
+    idx, _ = await run_filter(experiment_id, source, params, user.id)
+    phi, theta, r = await asyncio.to_thread(cloud_store.load, experiment_id, source)
+    media_type, extension = EXPORT_FORMATS[fmt]
+    return StreamingResponse(
+        iter_export(fmt, phi[idx], theta[idx], r[idx]),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="experiment_{source}_{experiment_id}_filtered.{extension}"',
+            "Content-Length": str(export_size(fmt, len(idx))),
+        },
+    )
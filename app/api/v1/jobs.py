@@ -0,0 +1,86 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.api.v1.web import require_authenticated_user
+from app.crud.experiment import get_experiment_by_id
+from app.crud.job import get_job, get_jobs_by_user
+from app.schemas.job import JobCreate
+from app.utils.cloud_store import source_key
+from app.utils.formats import EXPORT_FORMATS
+from app.utils.jobs import job_manager, job_to_dict, result_path
+
+router = APIRouter()
+
+# Задачи, результат которых отдаётся файлом
+FILE_RESULTS = {"export", "downsample"}
+
+
+async def _own_job(job_id: int, user_id: int):
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+@router.post("/{user_id}/api/jobs")
+async def submit_job_api(payload: JobCreate, user=Depends(require_authenticated_user)):
+    """
+    Постановка задачи в пул процессов: artifacts, mesh, filter, export, downsample.
+    Если такая же задача уже идёт или её результат готов — возвращается она.
+    """
+    source = source_key(payload.source)
+    if not await asyncio.to_thread(get_experiment_by_id, experiment_id=payload.experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+    try:
+        job = await asyncio.to_thread(
+            job_manager.submit, payload.kind, payload.experiment_id, source,
+            payload.params, payload.priority, user.id,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"ok": False, "message": str(e)})
+    return JSONResponse(content={"ok": True, "job": job})
+
+
+@router.get("/{user_id}/api/jobs")
+async def list_jobs_api(
+    limit: int = Query(50, ge=1, le=500),
+    user=Depends(require_authenticated_user)
+):
+    jobs = await asyncio.to_thread(get_jobs_by_user, user.id, limit)
+    return JSONResponse(content={"ok": True, "jobs": [job_to_dict(job) for job in jobs]})
+
+
+@router.get("/{user_id}/api/jobs/{job_id}")
+async def get_job_api(job_id: int, user=Depends(require_authenticated_user)):
+    job = await _own_job(job_id, user.id)
+    return JSONResponse(content={"ok": True, "job": job_to_dict(job)})
+
+
+@router.delete("/{user_id}/api/jobs/{job_id}")
+async def cancel_job_api(job_id: int, user=Depends(require_authenticated_user)):
+    """Отмена задачи из очереди или выполняющейся (на ближайшей контрольной точке)"""
+    await _own_job(job_id, user.id)
+    job = await asyncio.to_thread(job_manager.cancel, job_id)
+    return JSONResponse(content={"ok": True, "job": job})
+
+
+@router.get("/{user_id}/api/jobs/{job_id}/result")
+async def get_job_result_api(job_id: int, user=Depends(require_authenticated_user)):
+    """Файл результата: выгрузка (PLY / PCD / LAS) или прореженное облако (float32 x, y, z)"""
+    job = await _own_job(job_id, user.id)
+    if job.kind not in FILE_RESULTS:
+        raise HTTPException(status_code=400, detail="У задачи нет файла результата")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Задача не выполнена: {job.status}")
+
+    path = result_path(job.kind, job.experiment_id, job.source, job.params, job.cache_key)
+    if not path.exists():
+        raise HTTPException(status_code=410, detail="Результат удалён, поставьте задачу заново")
+    if job.kind == "export":
+        media_type, extension = EXPORT_FORMATS[job.params["fmt"]]
+        filename = f"experiment_{job.source}_{job.experiment_id}.{extension}"
+        return FileResponse(path, media_type=media_type, filename=filename)
+    return FileResponse(path, media_type="application/octet-stream",
+                        headers={"X-Points-Count": str(path.stat().st_size // 12)})
@@ -3,143 +3,321 @@ import asyncio
 import threading
 import uuid
 import os
+import shlex
 import time
+from contextlib import aclosing
+from datetime import datetime
+from pathlib import Path
 from typing import Dict, Any
 
-import paramiko
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Body
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Body, Query, Request
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
 from starlette.responses import FileResponse, JSONResponse
 
+from app.api.v1.web import require_logged_in_user
 from app.core.config import settings
+from app.core.metrics import SSH_COMMAND_SECONDS, LIDAR_TASKS_ACTIVE, LIDAR_SCAN_QUEUE, record_ingest
+from app.core.security import request_user_id
+from app.crud.device import create_device, delete_device, get_device, get_devices, update_device
+from app.crud.experiment import insert_experiment
+from app.crud.measurement import bulk_insert_measurements
+from app.db.session import SessionLocal
+from app.schemas.device import DeviceCreate, DeviceUpdate
+from app.schemas.experiment import ExperimentCreate
+from app.utils.formats import read_point_cloud
+from app.utils.jobs import job_manager
+from app.utils.lidar_fleet import DeviceConfig, ScanRequest, ScanScheduler, device_pools
+from app.utils.scan_parser import ScanParseError
+from app.utils.task_state import task_backend
 
 router = APIRouter()
 
-# tasks: task_id -> dict { queue: asyncio.Queue, stop: dict, thread: Thread, channel, ssh, filename, done }
+# Ресурсы выполняющихся команд этого процесса: task_id -> dict { stop: bool, channel, device_id, done }.
+# Флаг остановки, завершение и журнал, общие для всех процессов, — в task_backend
 tasks: Dict[str, Dict[str, Any]] = {}
 tasks_lock = threading.Lock()
 
+# Как часто поток команды проверяет остановку, запрошенную через task_backend, с
+STOP_CHECK_INTERVAL = 0.25
+
+LIDAR_TASKS_ACTIVE.set_function(lambda: sum(not task.get("done") for task in list(tasks.values())))
+
+
+def _device_to_dict(device, queued: int = 0) -> dict:
+    if not device.enabled:
+        status = "disabled"
+    elif device.active_task_id:
+        status = "busy"
+    else:
+        status = "idle"
+    return {
+        "id": device.id,
+        "name": device.name,
+        "host": device.host,
+        "port": device.port,
+        "username": device.username,
+        "remote_path": device.remote_path,
+        "enabled": device.enabled,
+        "status": status,
+        "active_task_id": device.active_task_id,
+        "active_since": device.active_since_dt.isoformat() if device.active_since_dt else None,
+        "queued": queued,
+        "last_seen": device.last_seen_dt.isoformat() if device.last_seen_dt else None,
+        "last_error": device.last_error,
+    }
+
+
+async def _resolve_device(device_id: int | None) -> DeviceConfig:
+    """Установка по id; без id — первая включённая (одна установка, как до реестра)"""
+    if device_id is None:
+        devices = await asyncio.to_thread(get_devices, True)
+        device = devices[0] if devices else None
+    else:
+        device = await asyncio.to_thread(get_device, device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="device not found")
+    return DeviceConfig.from_model(device)
+
+
+def _device_id(payload: dict | None) -> int | None:
+    value = (payload or {}).get("device_id")
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="device_id must be an integer")
+
 
-def _ssh_connect():
-    """Соединение paramiko (использует настройки из settings)."""
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(settings.LIDAR_HOST, username=settings.LIDAR_USER, password=settings.LIDAR_PASS, timeout=10)
-    return ssh
+def _exec_status(ssh, command: str, name: str) -> int:
+    """Короткая команда на установке: код завершения и время в метриках"""
+    started = time.perf_counter()
+    stdin, stdout, stderr = ssh.exec_command(command)
+    rc = stdout.channel.recv_exit_status()
+    SSH_COMMAND_SECONDS.labels(name, "ok" if rc == 0 else "failed").observe(time.perf_counter() - started)
+    return rc
 
 
-def _start_ssh_command_in_thread(task_id: str, cmd: str, loop: asyncio.AbstractEventLoop):
+def _publish(task_id: str, *messages: dict):
+    """Сообщения в журнал команды; ошибка хранилища не должна обрывать поток"""
+    try:
+        task_backend.publish(task_id, list(messages))
+    except Exception:
+        pass
+
+
+def _run_ssh_command(request: ScanRequest, device: DeviceConfig, release):
     """
-    Запускается в отдельном thread: выполняет команду через ssh, пушит строки в queue.
+    Выполняется в потоке планировщика, когда установка занята под команду:
+    выполняет её через ssh и пишет вывод в журнал task_backend.
+    request.kind — метка команды в метриках (test / engine_test / scan).
+    release() освобождает установку до загрузки скана в БД.
     """
-    q: asyncio.Queue = tasks[task_id]["queue"]
-    stop_holder = tasks[task_id]["stop"]
+    task_id = request.task_id
+    with tasks_lock:
+        local = tasks[task_id] = {"stop": False, "done": False, "device_id": device.id}
+    started = time.perf_counter()
+    status = "error"
+    next_stop_check = 0.0
+    _publish(task_id, {"type": "info", "text": f"[*] Установка: {device.name}"})
     try:
-        ssh = _ssh_connect()
-        transport = ssh.get_transport()
-        chan = transport.open_session()
-        full_cmd = f"cd {settings.LIDAR_REMOTE_PATH} && source .venv/bin/activate && {cmd}"
-        chan.exec_command(full_cmd)
-
+        task_backend.update_meta(task_id, {"device_id": device.id})
+    except Exception:
+        pass
+    try:
+        with device_pools.get(device).client() as ssh:
+            chan = ssh.get_transport().open_session()
+            full_cmd = f"cd {shlex.quote(device.remote_path)} && source .venv/bin/activate && {request.cmd}"
+            chan.exec_command(full_cmd)
+
+            with tasks_lock:
+                local["channel"] = chan
+
+            while True:
+                batch = []
+                if chan.recv_ready():
+                    batch.append({"type": "out", "text": chan.recv(4096).decode("utf-8", errors="replace")})
+                if chan.recv_stderr_ready():
+                    batch.append({"type": "err", "text": chan.recv_stderr(4096).decode("utf-8", errors="replace")})
+                if batch:
+                    _publish(task_id, *batch)
+                if chan.exit_status_ready():
+                    break
+                # /stop мог прийти в другой процесс сервера
+                if time.monotonic() >= next_stop_check:
+                    next_stop_check = time.monotonic() + STOP_CHECK_INTERVAL
+                    try:
+                        if task_backend.stop_requested(task_id):
+                            local["stop"] = True
+                    except Exception:
+                        pass
+                if local["stop"]:
+                    try:
+                        chan.close()
+                    except Exception:
+                        pass
+                    _publish(task_id, {"type": "info", "text": "[!] Прервано пользователем"})
+                    status = "stopped"
+                    break
+                time.sleep(0.05)
+
+            code = None
+            try:
+                code = chan.recv_exit_status()
+            except Exception:
+                pass
+            chan.close()
+        if status != "stopped":
+            status = "ok" if code == 0 else "failed"
+        _publish(task_id, {"type": "info", "text": f"[+] Команда завершена (exit={code})"})
+        if status == "ok" and request.experiment is not None:
+            _ingest_scan(request, device, release)
+    except Exception as e:
+        _publish(task_id, {"type": "err", "text": f"[!] Ошибка: {e}"})
+    finally:
+        SSH_COMMAND_SECONDS.labels(request.kind, status).observe(time.perf_counter() - started)
         with tasks_lock:
-            tasks[task_id]["channel"] = chan
-            tasks[task_id]["ssh"] = ssh
-
-        while True:
-            if chan.recv_ready():
-                out = chan.recv(4096).decode("utf-8", errors="replace")
-                loop.call_soon_threadsafe(q.put_nowait, {"type": "out", "text": out})
-            if chan.recv_stderr_ready():
-                err = chan.recv_stderr(4096).decode("utf-8", errors="replace")
-                loop.call_soon_threadsafe(q.put_nowait, {"type": "err", "text": err})
-            if chan.exit_status_ready():
-                break
-            if stop_holder.get("stop"):
-                try:
-                    chan.close()
-                except Exception:
-                    pass
-                loop.call_soon_threadsafe(q.put_nowait, {"type": "info", "text": "[!] Прервано пользователем"})
-                break
-            time.sleep(0.05)
-
-        code = None
+            tasks.pop(task_id, None)
+            local["done"] = True
         try:
-            code = chan.recv_exit_status()
+            task_backend.finish(task_id)
         except Exception:
             pass
-        loop.call_soon_threadsafe(q.put_nowait, {"type": "info", "text": f"[+] Команда завершена (exit={code})"})
+
+
+def _fetch_scan(device: DeviceConfig, filename: str) -> Path:
+    """Файл скана с установки в каталог scans/ сервера"""
+    scans_dir = Path(settings.SCANS_DIR)
+    scans_dir.mkdir(parents=True, exist_ok=True)
+    local_path = scans_dir / filename
+    started = time.perf_counter()
+    try:
+        with device_pools.get(device).client() as ssh:
+            sftp = ssh.open_sftp()
+            try:
+                sftp.get(f"{device.remote_path}/scans/{filename}", str(local_path))
+            finally:
+                sftp.close()
+    except Exception:
+        SSH_COMMAND_SECONDS.labels("download", "error").observe(time.perf_counter() - started)
+        raise
+    SSH_COMMAND_SECONDS.labels("download", "ok").observe(time.perf_counter() - started)
+    return local_path
+
+
+def _ingest_scan(request: ScanRequest, device: DeviceConfig, release):
+    """
+    После успешного скана: файл с установки, разбор на сервере и массовая вставка
+    эксперимента — без передачи облака через браузер. Установка освобождается сразу
+    после скачивания файла: разбор и вставка не задерживают следующий скан.
+    Ошибка пишется в журнал команды, файл остаётся в scans/ и на установке.
+    """
+    task_id = request.task_id
+    _publish(task_id, {"type": "info", "text": "[*] Загрузка скана в базу данных..."})
+    try:
+        try:
+            local_path = _fetch_scan(device, request.filename)
+        finally:
+            release()
+        started = time.perf_counter()
+        phi, theta, r = read_point_cloud(request.filename, local_path)
+        if len(r) == 0:
+            raise ValueError("Файл не содержит действительных данных")
+        parsed = time.perf_counter()
+        with SessionLocal() as db:
+            try:
+                experiment_id = insert_experiment(db=db, experiment=request.experiment)
+                bulk_insert_measurements(db, experiment_id, phi, theta, r)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+        record_ingest("scan", len(r), parsed - started, time.perf_counter() - parsed)
+        job_manager.submit("artifacts", experiment_id, "local", None, 0, request.experiment.user_id)
+    except ScanParseError as e:
+        details = "; ".join(f"строка {item['line']}: {item['message']}" for item in e.errors[:3])
+        _publish(task_id, {"type": "err", "text": f"[!] Скан не загружен: {e}" + (f" ({details})" if details else "")})
+        return
     except Exception as e:
-        loop.call_soon_threadsafe(q.put_nowait, {"type": "err", "text": f"[!] Ошибка: {e}"})
-    finally:
-        with tasks_lock:
-            tasks[task_id]["done"] = True
-        # не закрываем ssh тут — сохранён если нужен для SFTP
+        _publish(task_id, {"type": "err", "text": f"[!] Скан не загружен: {e}"})
+        return
+    try:
+        task_backend.update_meta(task_id, {"experiment_id": experiment_id})
+    except Exception:
+        pass
+    _publish(task_id, {"type": "info", "text": f"[+] Эксперимент {experiment_id} сохранён ({len(r)} точек)"})
+
+
+scheduler = ScanScheduler(_run_ssh_command)
+LIDAR_SCAN_QUEUE.set_function(scheduler.queued_count)
+
+
+async def _start_task(kind: str, cmd: str, device_id: int | None, meta: dict | None = None,
+                      task_id: str | None = None, experiment: ExperimentCreate | None = None) -> dict:
+    """Регистрирует команду в task_backend и ставит её в очередь установки"""
+    if device_id is not None:
+        await _resolve_device(device_id)
+    task_id = task_id or uuid.uuid4().hex
+    await asyncio.to_thread(task_backend.cleanup)
+    await task_backend.create(task_id, kind, {**(meta or {}), "device_id": device_id})
+
+    filename = (meta or {}).get("filename")
+    ahead = scheduler.submit(ScanRequest(task_id, kind, cmd, device_id, filename, experiment))
+    if ahead:
+        _publish(task_id, {"type": "info", "text": f"[*] Команда в очереди, впереди: {ahead}"})
+    return {"task_id": task_id, "device_id": device_id, "queued": ahead}
+
+
+def _check_remote_path(device: DeviceConfig, command: str, name: str) -> int:
+    with device_pools.get(device).client() as ssh:
+        return _exec_status(ssh, f"cd {shlex.quote(device.remote_path)} && {command}", name)
 
 
 @router.post("/ping")
-async def ping():
+async def ping(payload: dict | None = Body(None)):
+    device = await _resolve_device(_device_id(payload))
     try:
-        ssh = _ssh_connect()
         # просто проверить доступность каталога
-        stdin, stdout, stderr = ssh.exec_command(f"cd {settings.LIDAR_REMOTE_PATH} && echo ok")
-        if stdout.channel.recv_exit_status() == 0:
-            ssh.close()
-            return {"ok": True}
-        ssh.close()
+        if await asyncio.to_thread(_check_remote_path, device, "echo ok", "ping") == 0:
+            return {"ok": True, "device_id": device.id}
         raise HTTPException(status_code=500, detail="Remote path check failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/connect")
-async def connect():
-    # Мы не храним соединение "навсегда" на сервере — просто проверяем, что можно подключиться.
+async def connect(payload: dict | None = Body(None)):
+    # Соединение остаётся в пуле установки — следующие команды его переиспользуют
+    device = await _resolve_device(_device_id(payload))
     try:
-        ssh = _ssh_connect()
-        stdin, stdout, stderr = ssh.exec_command(f"cd {settings.LIDAR_REMOTE_PATH} && pwd")
-        rc = stdout.channel.recv_exit_status()
-        ssh.close()
+        rc = await asyncio.to_thread(_check_remote_path, device, "pwd", "connect")
         if rc == 0:
-            return {"ok": True}
+            return {"ok": True, "device_id": device.id}
         raise HTTPException(status_code=500, detail="Remote path not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/test")
-async def test_lidar():
-    # Запускаем короткую команду и возвращаем task_id для websocket логов
-    loop = asyncio.get_event_loop()
-    task_id = uuid.uuid4().hex
-    q: asyncio.Queue = asyncio.Queue()
-    tasks[task_id] = {"queue": q, "stop": {"stop": False}, "done": False}
-
-    cmd = "python lidar.py"
-    t = threading.Thread(target=_start_ssh_command_in_thread, args=(task_id, cmd, loop), daemon=True)
-    tasks[task_id]["thread"] = t
-    t.start()
-    return {"task_id": task_id}
+async def test_lidar(payload: dict | None = Body(None)):
+    # Ставим короткую команду в очередь установки и возвращаем task_id для websocket логов
+    return await _start_task("test", "python lidar.py", _device_id(payload))
 
 
 @router.post("/engine_test")
-async def test_engine():
-    loop = asyncio.get_event_loop()
-    task_id = uuid.uuid4().hex
-    q: asyncio.Queue = asyncio.Queue()
-    tasks[task_id] = {"queue": q, "stop": {"stop": False}, "done": False}
-
-    cmd = "python engine.py"
-    t = threading.Thread(target=_start_ssh_command_in_thread, args=(task_id, cmd, loop), daemon=True)
-    tasks[task_id]["thread"] = t
-    t.start()
-    return {"task_id": task_id}
+async def test_engine(payload: dict | None = Body(None)):
+    return await _start_task("engine_test", "python engine.py", _device_id(payload))
 
 
 @router.post("/start")
-async def start_scan(payload: dict = Body(...)):
+async def start_scan(request: Request, payload: dict = Body(...)):
     """
-    payload ожидает: scan_range, scan_step, lidar_duration, pulse_delay
-    возвращает task_id
+    payload ожидает: scan_range, scan_step, lidar_duration, pulse_delay;
+    device_id — необязательно (без него скан уйдёт на первую свободную установку);
+    experiment — необязательно: {room_description, address, object_description, date?} —
+    после успешного скана файл сам загрузится в БД экспериментом вошедшего пользователя
+    возвращает task_id, filename и число команд впереди в очереди
     """
     scan_range = payload.get("scan_range")
     scan_step = payload.get("scan_step")
@@ -149,82 +327,150 @@ async def start_scan(payload: dict = Body(...)):
     if not all([scan_range, scan_step, lidar_duration, pulse_delay]):
         raise HTTPException(status_code=400, detail="Missing parameters")
 
-    loop = asyncio.get_event_loop()
+    experiment = None
+    if payload.get("experiment"):
+        user_id = request_user_id(request)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="login required to save the scan")
+        fields = payload["experiment"]
+        if not isinstance(fields, dict):
+            raise HTTPException(status_code=422, detail="experiment must be an object")
+        try:
+            experiment = ExperimentCreate(
+                exp_dt=fields.get("date") or datetime.now(),
+                room_description=fields.get("room_description"),
+                address=fields.get("address"),
+                object_description=fields.get("object_description"),
+                user_id=user_id,
+            )
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+    # Сканы с разных установок в одну секунду не должны совпасть по имени
     task_id = uuid.uuid4().hex
-    q: asyncio.Queue = asyncio.Queue()
-    tasks[task_id] = {"queue": q, "stop": {"stop": False}, "done": False, "filename": None}
-
     timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"scan_{timestamp}.txt"
-    tasks[task_id]["filename"] = filename
+    filename = f"scan_{timestamp}_{task_id[:6]}.txt"
 
+    # Значения из запроса идут в командную строку установки — только в кавычках shell
     cmd = (
-        f"python scan.py --scan_range {scan_range} --scan_step {scan_step} "
-        f"--lidar_duration {lidar_duration} --pulse_delay {pulse_delay} "
+        f"python scan.py --scan_range {shlex.quote(str(scan_range))} --scan_step {shlex.quote(str(scan_step))} "
+        f"--lidar_duration {shlex.quote(str(lidar_duration))} --pulse_delay {shlex.quote(str(pulse_delay))} "
         f"--filename scans/{filename}"
     )
 
-    t = threading.Thread(target=_start_ssh_command_in_thread, args=(task_id, cmd, loop), daemon=True)
-    tasks[task_id]["thread"] = t
-    t.start()
-    return {"task_id": task_id, "filename": filename}
+    task = await _start_task("scan", cmd, _device_id(payload), {"filename": filename}, task_id, experiment)
+    return {**task, "filename": filename}
 
 
 @router.post("/stop")
 async def stop_scan(payload: dict = Body(...)):
     task_id = payload.get("task_id")
-    if not task_id or task_id not in tasks:
+    if not task_id or not await task_backend.request_stop(task_id):
         raise HTTPException(status_code=404, detail="task not found")
-    with tasks_lock:
-        tasks[task_id]["stop"]["stop"] = True
-        # если есть открытый канал — попробуем закрыть
-        ch = tasks[task_id].get("channel")
-        try:
-            if ch:
-                ch.close()
-        except Exception:
-            pass
+    # Ещё в очереди этого процесса — просто убираем
+    if scheduler.cancel(task_id):
+        return {"ok": True, "cancelled": True}
+    # Команда этого процесса останавливается сразу, чужая — при следующей проверке флага
+    local = tasks.get(task_id)
+    if local is not None:
+        with tasks_lock:
+            local["stop"] = True
+            # если есть открытый канал — попробуем закрыть
+            ch = local.get("channel")
+            try:
+                if ch:
+                    ch.close()
+            except Exception:
+                pass
     return {"ok": True}
 
 
 @router.get("/download")
-async def download(filename: str):
-    # папка scans в корне проекта (два уровня вверх от этого файла)
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-    scans_dir = os.path.join(project_root, "scans")
-    os.makedirs(scans_dir, exist_ok=True)  # на всякий случай создаём, если нет
-
-    remote_path = f"{settings.LIDAR_REMOTE_PATH}/scans/{filename}"
-    local_path = os.path.join(scans_dir, filename)
-
+async def download(filename: str | None = None, device_id: int | None = None, task_id: str | None = None):
+    """Файл скана с установки: по filename и device_id или по task_id скана"""
+    if task_id:
+        meta = await task_backend.meta(task_id)
+        if not meta or not meta.get("filename"):
+            raise HTTPException(status_code=404, detail="scan task not found")
+        filename, device_id = meta["filename"], meta.get("device_id")
+    if not filename or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=400, detail="filename required")
+    # Скан, уже загруженный в БД после съёмки, лежит в scans/ — второй раз не качаем
+    local_path = Path(settings.SCANS_DIR) / filename
+    if task_id and local_path.exists():
+        return FileResponse(local_path, filename=filename)
+    device = await _resolve_device(device_id)
     try:
-        ssh = _ssh_connect()
-        sftp = ssh.open_sftp()
-        sftp.get(remote_path, local_path)
-        sftp.close()
-        ssh.close()
+        local_path = await asyncio.to_thread(_fetch_scan, device, filename)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"SFTP failed: {e}")
 
     return FileResponse(local_path, filename=filename)
 
 
+@router.get("/devices")
+async def list_devices(user=Depends(require_logged_in_user)):
+    """Установки с состоянием: idle / busy / disabled, текущая команда и очередь этого процесса"""
+    devices = await asyncio.to_thread(get_devices)
+    queued = scheduler.queued_by_device()
+    return {
+        "devices": [_device_to_dict(device, queued.get(device.id, 0)) for device in devices],
+        "queued_any": queued.get(None, 0),
+    }
+
+
+@router.post("/devices")
+async def add_device(payload: DeviceCreate, user=Depends(require_logged_in_user)):
+    try:
+        device = await asyncio.to_thread(create_device, **payload.model_dump())
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="device name already exists")
+    return _device_to_dict(device)
+
+
+@router.patch("/devices/{device_id}")
+async def edit_device(device_id: int, payload: DeviceUpdate, user=Depends(require_logged_in_user)):
+    fields = payload.model_dump(exclude_unset=True)
+    try:
+        device = await asyncio.to_thread(update_device, device_id, **fields)
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="device name already exists")
+    if device is None:
+        raise HTTPException(status_code=404, detail="device not found")
+    # Параметры подключения могли измениться — старые соединения закрываем
+    device_pools.drop(device_id)
+    return _device_to_dict(device)
+
+
+@router.delete("/devices/{device_id}")
+async def remove_device(device_id: int, user=Depends(require_logged_in_user)):
+    device = await asyncio.to_thread(get_device, device_id)
+    if device is None:
+        raise HTTPException(status_code=404, detail="device not found")
+    if device.active_task_id:
+        raise HTTPException(status_code=409, detail="device is busy")
+    await asyncio.to_thread(delete_device, device_id)
+    device_pools.drop(device_id)
+    return {"ok": True}
+
+
 @router.websocket("/ws/{task_id}")
-async def websocket_logs(websocket: WebSocket, task_id: str):
+async def websocket_logs(websocket: WebSocket, task_id: str, after: int = Query(0, ge=0)):
+    """
+    Журнал команды: сообщения {seq, type, text} с seq больше after.
+    После обрыва клиент переподключается с after = последний полученный seq.
+    """
     await websocket.accept()
-    if task_id not in tasks:
+    if not await task_backend.exists(task_id):
         await websocket.send_json({"type": "err", "text": "task not found"})
         await websocket.close()
         return
 
-    q: asyncio.Queue = tasks[task_id]["queue"]
     try:
-        while True:
-            msg = await q.get()
-            await websocket.send_json(msg)
-            # если задача помечена done и очередь пуста — закрываем
-            if tasks[task_id].get("done") and q.empty():
-                break
+        # журнал идёт до завершения команды, затем закрываем
+        async with aclosing(task_backend.subscribe(task_id, after)) as messages:
+            async for msg in messages:
+                await websocket.send_json(msg)
     except WebSocketDisconnect:
         # клиент отключился — просто выходим
         pass
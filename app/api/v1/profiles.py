@@ -0,0 +1,45 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.api.v1.web import require_authenticated_user
+from app.core.profiling import list_profiles, load_profile, profile_paths
+
+router = APIRouter()
+
+PROFILE_ID = Path(..., pattern=r"^\d{8}_\d{6}_[0-9a-f]{8}$")
+
+
+async def _own_profile(profile_id: str, user_id: int) -> dict:
+    report = await asyncio.to_thread(load_profile, profile_id)
+    if report is None or report.get("user_id") not in (user_id, None):
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return report
+
+
+@router.get("/{user_id}/api/profiles")
+async def list_profiles_api(
+    limit: int = Query(50, ge=1, le=500),
+    user=Depends(require_authenticated_user)
+):
+    """Сохранённые профили запросов: свои и выборочные, новые первыми"""
+    profiles = await asyncio.to_thread(list_profiles, user.id, limit)
+    return JSONResponse(content={"ok": True, "profiles": profiles})
+
+
+@router.get("/{user_id}/api/profiles/{profile_id}")
+async def get_profile_api(profile_id: str = PROFILE_ID, user=Depends(require_authenticated_user)):
+    """Профиль запроса: сводка, SQL-запросы с временем и самые дорогие функции"""
+    report = await _own_profile(profile_id, user.id)
+    return JSONResponse(content={"ok": True, "profile": report})
+
+
+@router.get("/{user_id}/api/profiles/{profile_id}/download")
+async def download_profile_api(profile_id: str = PROFILE_ID, user=Depends(require_authenticated_user)):
+    """Дамп pstats (cProfile) для snakeviz / python -m pstats"""
+    await _own_profile(profile_id, user.id)
+    _, path = profile_paths(profile_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
@@ -0,0 +1,169 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+from app.api.v1.web import require_authenticated_user
+from app.core.config import settings
+from app.crud.experiment import get_experiment_by_id
+from app.crud.registration import get_registration
+from app.schemas.registration import RegistrationRequest
+from app.utils.change_detection import compare_experiments, difference_cloud
+from app.utils.cloud_store import source_key
+from app.utils.registration import build_merged_cloud, register_experiment, registration_to_dict
+
+router = APIRouter()
+
+
+def parse_experiment_ref(value: str) -> tuple[int, str]:
+    """'local:12' / 'chd:7' / '12' -> (12, 'local')"""
+    source, _, experiment_id = value.rpartition(":")
+    try:
+        return int(experiment_id), source_key(source or "local")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Неверная ссылка на эксперимент: {value}")
+
+
+def _require_experiment(experiment_id: int, source: str):
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail=f"Эксперимент {source}:{experiment_id} не найден")
+
+
+@router.post("/{user_id}/api/experiments/{experiment_id}/register")
+async def register_api(
+    experiment_id: int,
+    payload: RegistrationRequest,
+    user=Depends(require_authenticated_user)
+):
+    """
+    Совмещение эксперимента с опорным (ICP точка-плоскость). Начальное приближение —
+    по парам точек correspondences (не меньше трёх) или по главным осям облаков.
+    """
+    source = source_key(payload.source)
+    reference_source = source_key(payload.reference_source)
+    if (experiment_id, source) == (payload.reference_id, reference_source):
+        raise HTTPException(status_code=400, detail="Эксперимент совпадает с опорным")
+    await asyncio.to_thread(_require_experiment, experiment_id, source)
+    await asyncio.to_thread(_require_experiment, payload.reference_id, reference_source)
+
+    pairs = [(c.source, c.target) for c in payload.correspondences] if payload.correspondences else None
+    try:
+        registration = await asyncio.to_thread(
+            register_experiment, experiment_id, source, payload.reference_id, reference_source,
+            pairs, payload.max_distance,
+        )
+    except ValueError as e:
+        return JSONResponse(content={"ok": False, "message": str(e)})
+    return JSONResponse(content={"ok": True, "registration": registration_to_dict(registration)})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/register")
+async def get_registration_api(
+    experiment_id: int,
+    source: str,
+    reference_id: int,
+    reference_source: str = "local",
+    user=Depends(require_authenticated_user)
+):
+    registration = await asyncio.to_thread(
+        get_registration, experiment_id, source_key(source), reference_id, source_key(reference_source)
+    )
+    if registration is None:
+        raise HTTPException(status_code=404, detail="Совмещение не найдено")
+    return JSONResponse(content={"ok": True, "registration": registration_to_dict(registration)})
+
+
+@router.get("/{user_id}/api/merged")
+async def merged_cloud_api(
+    reference: str,
+    experiments: str,
+    voxel: float | None = Query(None, gt=0, le=1),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Объединённое облако в системе опорного эксперимента: float32 x, y, z (оси вьювера),
+    по одной точке на воксель. experiments — список 'local:12,chd:7', каждый
+    должен быть предварительно совмещён с reference.
+    """
+    reference_ref = parse_experiment_ref(reference)
+    others = [parse_experiment_ref(v) for v in experiments.split(",") if v.strip()]
+    others = [ref for ref in dict.fromkeys(others) if ref != reference_ref]
+    for experiment_id, source in [reference_ref] + others:
+        await asyncio.to_thread(_require_experiment, experiment_id, source)
+
+    try:
+        path = await asyncio.to_thread(
+            build_merged_cloud, reference_ref, others, voxel or settings.MERGE_VOXEL_SIZE
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        headers={"X-Points-Count": str(path.stat().st_size // 12)},
+    )
+
+
+async def _compare(experiment_id: int, source: str, reference: str, max_distance: float | None,
+                   threshold: float | None):
+    experiment_ref = (experiment_id, source_key(source))
+    reference_ref = parse_experiment_ref(reference)
+    if experiment_ref == reference_ref:
+        raise HTTPException(status_code=400, detail="Эксперимент совпадает с опорным")
+    for ref in (experiment_ref, reference_ref):
+        await asyncio.to_thread(_require_experiment, *ref)
+
+    max_distance = max_distance or settings.DIFF_MAX_DISTANCE
+    threshold = threshold or settings.DIFF_THRESHOLD
+    try:
+        distances, stats = await asyncio.to_thread(
+            compare_experiments, experiment_ref, reference_ref, max_distance, threshold
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return experiment_ref, reference_ref, distances, stats
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/diff/summary")
+async def diff_summary_api(
+    experiment_id: int,
+    source: str,
+    reference: str,
+    max_distance: float | None = Query(None, gt=0, le=10),
+    threshold: float | None = Query(None, gt=0, le=10),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Изменения относительно опорного эксперимента (должен быть совмещён с ним):
+    статистика расстояний облако-облако, доля изменённых точек и пропавшие
+    точки опорного облака. Результат кешируется.
+    """
+    _, _, _, stats = await _compare(experiment_id, source, reference, max_distance, threshold)
+    return JSONResponse(content={"ok": True, **stats})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/diff")
+async def diff_cloud_api(
+    experiment_id: int,
+    source: str,
+    reference: str,
+    max_distance: float | None = Query(None, gt=0, le=10),
+    threshold: float | None = Query(None, gt=0, le=10),
+    color_max: float | None = Query(None, gt=0, le=10),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Облако разности в системе опорного эксперимента: float32 x, y, z подряд
+    (оси вьювера), затем uint8 r, g, b (синий — без изменений, красный —
+    расстояние color_max и больше или нет пары).
+    """
+    experiment_ref, reference_ref, distances, stats = await _compare(
+        experiment_id, source, reference, max_distance, threshold
+    )
+    color_max = color_max or stats["max_distance"]
+    data = await asyncio.to_thread(difference_cloud, experiment_ref, reference_ref, distances, color_max)
+    return Response(content=data, media_type="application/octet-stream", headers={
+        "X-Points-Count": str(len(distances)),
+        "X-Colors-Offset": str(len(distances) * 12),
+        "X-Changed-Count": str(stats["changed"]),
+    })
@@ -0,0 +1,141 @@
+import asyncio
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, Response
+
+from app.api.v1.web import require_authenticated_user
+from app.crud.experiment import get_experiment_by_id
+from app.utils.cloud_store import source_key
+from app.utils.spatial_index import spatial_indexes
+
+router = APIRouter()
+
+# Ограничения на размер ответа JSON
+MAX_NEIGHBORS = 1000
+MAX_RESULT_POINTS = 100_000
+
+
+async def get_index(experiment_id: int, source: str):
+    """Пространственный индекс эксперимента (строится при первом обращении)"""
+    source = source_key(source)
+    if not await asyncio.to_thread(get_experiment_by_id, experiment_id=experiment_id, source=source):
+        raise HTTPException(status_code=404, detail="Эксперимент не найден")
+    return await asyncio.to_thread(spatial_indexes.get, experiment_id, source)
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/nearest")
+async def nearest_api(
+    experiment_id: int,
+    source: str,
+    x: float,
+    y: float,
+    z: float,
+    k: int = Query(1, ge=1, le=MAX_NEIGHBORS),
+    max_distance: float | None = Query(None, gt=0),
+    user=Depends(require_authenticated_user)
+):
+    """k ближайших точек к (x, y, z) в осях отчёта, м"""
+    index = await get_index(experiment_id, source)
+    idx, distances = await asyncio.to_thread(index.nearest, (x, y, z), k, max_distance or np.inf)
+    return JSONResponse(content={"ok": True, "points": index.points(idx, distances)})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/radius")
+async def radius_api(
+    experiment_id: int,
+    source: str,
+    x: float,
+    y: float,
+    z: float,
+    radius: float = Query(..., gt=0),
+    limit: int = Query(1000, ge=1, le=MAX_RESULT_POINTS),
+    user=Depends(require_authenticated_user)
+):
+    """Точки в шаре радиуса radius вокруг (x, y, z), ближние первыми"""
+    index = await get_index(experiment_id, source)
+    idx, distances = await asyncio.to_thread(index.radius, (x, y, z), radius)
+    return JSONResponse(content={
+        "ok": True,
+        "total": len(idx),
+        "points": index.points(idx[:limit], distances[:limit]),
+    })
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/box")
+async def box_api(
+    experiment_id: int,
+    source: str,
+    x_min: float,
+    y_min: float,
+    z_min: float,
+    x_max: float,
+    y_max: float,
+    z_max: float,
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    format: str = Query("bin", pattern="^(json|bin)$"),
+    user=Depends(require_authenticated_user)
+):
+    """
+    Вырезка облака параллелепипедом (оси отчёта, м).
+    format=bin — float32 x, y, z подряд; format=json — точки с исходными измерениями.
+    """
+    if x_min > x_max or y_min > y_max or z_min > z_max:
+        raise HTTPException(status_code=400, detail="Неверные границы области")
+    index = await get_index(experiment_id, source)
+    idx = await asyncio.to_thread(index.box, (x_min, y_min, z_min), (x_max, y_max, z_max))
+
+    total = len(idx)
+    idx = idx[offset:offset + limit if limit else None]
+    headers = {"X-Total-Count": str(total), "X-Points-Count": str(len(idx))}
+    if format == "bin":
+        data = np.ascontiguousarray(index.xyz[idx], dtype="<f4").tobytes()
+        return Response(content=data, media_type="application/octet-stream", headers=headers)
+
+    if len(idx) > MAX_RESULT_POINTS:
+        raise HTTPException(status_code=400, detail="Слишком много точек для JSON, используйте limit или format=bin")
+    return JSONResponse(content={"ok": True, "total": total, "points": index.points(idx)}, headers=headers)
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/pick")
+async def pick_api(
+    experiment_id: int,
+    source: str,
+    ox: float,
+    oy: float,
+    oz: float,
+    dx: float,
+    dy: float,
+    dz: float,
+    radius: float = Query(0.05, gt=0, le=5),
+    user=Depends(require_authenticated_user)
+):
+    """Выбор точки лучом из камеры: ближайшая к камере точка не дальше radius от луча"""
+    index = await get_index(experiment_id, source)
+    hit = await asyncio.to_thread(index.pick, (ox, oy, oz), (dx, dy, dz), radius)
+    if hit is None:
+        return JSONResponse(content={"ok": True, "point": None})
+    i, distance = hit
+    return JSONResponse(content={"ok": True, "point": index.points([i], [distance])[0]})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/distance")
+async def distance_api(
+    experiment_id: int,
+    source: str,
+    a: int = Query(..., ge=0),
+    b: int = Query(..., ge=0),
+    user=Depends(require_authenticated_user)
+):
+    """Расстояние между двумя точками облака по их индексам (из pick / nearest)"""
+    index = await get_index(experiment_id, source)
+    if max(a, b) >= len(index.xyz):
+        raise HTTPException(status_code=404, detail="Точка не найдена")
+    delta = index.xyz[b] - index.xyz[a]
+    return JSONResponse(content={
+        "ok": True,
+        "points": index.points([a, b]),
+        "distance": round(float(np.linalg.norm(delta)), 4),
+        "delta": [round(float(v), 4) for v in delta],
+    })
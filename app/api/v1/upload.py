@@ -0,0 +1,135 @@
+import asyncio
+from pathlib import Path
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, Header, HTTPException, Query, Request
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.api.v1.web import require_authenticated_user, ingest_cloud_file
+from app.db.session import get_db
+from app.schemas.experiment import ExperimentCreate
+from app.schemas.upload import UploadInit
+from app.utils.formats import read_point_cloud
+from app.utils.scan_parser import ScanParseError, scan_summary
+from app.utils.uploads import UploadError, upload_store
+
+router = APIRouter()
+
+
+async def _call(func, *args):
+    """Файловые операции хранилища — в потоке; ошибки протокола -> HTTP-коды"""
+    try:
+        return await asyncio.to_thread(func, *args)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+def _read_upload(upload_id: str, user_id: int) -> tuple[str, Path]:
+    # Файл не читаем целиком: read_point_cloud отображает его в память
+    path, filename = upload_store.complete_path(upload_id, user_id)
+    return filename, path
+
+
+@router.post("/{user_id}/create/uploads")
+async def init_upload(payload: UploadInit, user=Depends(require_authenticated_user)):
+    """
+    Начало загрузки по частям. Клиент отправляет части PUT-запросами по смещениям
+    (размер части — chunk_size), при обрыве узнаёт недостающие диапазоны через GET.
+    """
+    upload = await _call(upload_store.create, user.id, payload.filename, payload.size, payload.sha256)
+    return {"ok": True, **upload}
+
+
+@router.put("/{user_id}/create/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    chunk_sha256: str | None = Header(None, alias="X-Chunk-SHA256"),
+    user=Depends(require_authenticated_user),
+):
+    """Часть файла в теле запроса; X-Chunk-SHA256 — контрольная сумма части"""
+    # Лишнее не буферизуем: сначала Content-Length, затем ограничение при чтении потока
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > upload_store.chunk_size:
+        raise HTTPException(status_code=413, detail="Часть больше допустимого размера")
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > upload_store.chunk_size:
+            raise HTTPException(status_code=413, detail="Часть больше допустимого размера")
+    data = bytes(data)
+    upload = await _call(upload_store.write_chunk, upload_id, user.id, offset, data, chunk_sha256)
+    return {"ok": True, **upload}
+
+
+@router.get("/{user_id}/create/uploads/{upload_id}")
+async def get_upload_status(upload_id: str, user=Depends(require_authenticated_user)):
+    upload = await _call(upload_store.status, upload_id, user.id)
+    return {"ok": True, **upload}
+
+
+@router.get("/{user_id}/create/uploads/{upload_id}/preview")
+async def preview_upload(upload_id: str, user=Depends(require_authenticated_user)):
+    """Проверка загруженного файла: то же, что /create/parse, но без повторной передачи"""
+    filename, content = await _call(_read_upload, upload_id, user.id)
+    try:
+        phi, theta, r = await asyncio.to_thread(read_point_cloud, filename, content)
+        summary = await asyncio.to_thread(scan_summary, phi, theta, r)
+    except ScanParseError as e:
+        return {"ok": False, "message": str(e), "errors": e.errors}
+    except ValueError as e:
+        return {"ok": False, "message": str(e), "errors": []}
+    return {"ok": True, **summary}
+
+
+@router.post("/{user_id}/create/uploads/{upload_id}/finalize")
+async def finalize_upload(
+        upload_id: str,
+        background_tasks: BackgroundTasks,
+        date: str = Form(...),
+        room_description: str = Form(...),
+        address: str = Form(...),
+        object_description: str = Form(...),
+        user=Depends(require_authenticated_user),
+        db=Depends(get_db),
+):
+    """
+    Сборка завершена: создаём эксперимент и массово вставляем измерения.
+    Повторный запрос (клиент не дождался ответа) не создаёт второй эксперимент:
+    пока сборка идёт — 409, после — тот же ответ.
+    """
+    saved = await _call(upload_store.begin_finalize, upload_id, user.id)
+    if saved is not None:
+        return saved
+    finished = False
+    try:
+        filename, content = await _call(_read_upload, upload_id, user.id)
+        experiment = ExperimentCreate(exp_dt=date,
+                                      room_description=room_description,
+                                      address=address,
+                                      object_description=object_description,
+                                      user_id=user.id)
+        result = await ingest_cloud_file(db, background_tasks, experiment, filename, content)
+        # Эксперимент уже в базе — маркер сборки не снимаем, даже если ответ не сохранится
+        finished = True
+        await asyncio.to_thread(upload_store.finish_finalize, upload_id, result)
+        return result
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+    except ScanParseError as e:
+        db.rollback()
+        return {"status": "error", "message": str(e), "errors": e.errors}
+    except ValueError as e:
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        if not finished:
+            await asyncio.to_thread(upload_store.abort_finalize, upload_id)
+        db.close()
+
+
+@router.delete("/{user_id}/create/uploads/{upload_id}")
+async def discard_upload(upload_id: str, user=Depends(require_authenticated_user)):
+    await _call(upload_store.discard, upload_id, user.id)
+    return {"ok": True}
@@ -1,24 +1,37 @@
+import asyncio
 import pathlib
+import time
+from typing import BinaryIO
 
 from pydantic import ValidationError
 from fastapi import (
     APIRouter, Request, Depends, Form, Cookie, HTTPException, Header, Path, UploadFile, File, Query,
+    BackgroundTasks,
 )
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
 from fastapi.templating import Jinja2Templates
 from starlette import status
 
 from app.crud.user import (
-    get_user_by_name, get_user_by_id, get_user_by_email, create_user
+    get_user_by_name, get_cached_user, get_user_by_email, create_user, update_user_password
 )
 from app.crud.experiment import insert_experiment, get_all_experiments_async, get_experiment_by_id, insert_local_experiments_to_chd
-from app.crud.measurement import insert_measurements, get_measurements_by_experiment_id
+from app.crud.measurement import insert_measurements, bulk_insert_measurements
+from app.crud.artifact import get_artifact
 from app.schemas.user import UserCreate
 from app.schemas.experiment import ExperimentCreate
 from app.schemas.measurement import MeasurementCreate, MeasurementData
-from app.core.security import verify_password, create_access_token, decode_access_token
+from app.core.security import (
+    create_access_token, decode_access_token, password_hasher, password_needs_rehash, PasswordHasherBusy,
+)
 from app.db.session import get_db, get_chd
 from app.core.config import settings
+from app.core.metrics import MEASUREMENTS_SERVED_BYTES, MEASUREMENTS_SERVED_POINTS, record_ingest
+from app.utils.cloud_store import cloud_store, rounded, source_key, HEADER_SIZE as CLOUD_HEADER_SIZE, COLUMNS as CLOUD_COLUMNS
+from app.utils.formats import read_point_cloud
+from app.utils.scan_parser import ScanParseError, scan_summary
+from app.utils.artifacts import artifact_to_dict, cartesian_path, preview_path
+from app.utils.jobs import job_manager
 from sqlalchemy.exc import SQLAlchemyError
 import json
 
@@ -33,6 +46,18 @@ DOCS_DIR = pathlib.Path(__file__).resolve().parents[3] / "docs"
 TEMPLATES_DIR = pathlib.Path(__file__).resolve().parents[3] / "templates"
 templates = Jinja2Templates(str(TEMPLATES_DIR))
 
+# Через сколько секунд повторить вход/регистрацию, если очередь bcrypt заполнена
+PASSWORD_RETRY_AFTER = 2
+BUSY_MESSAGE = "Сервер перегружен, повторите через несколько секунд"
+
+
+def busy_response(request: Request, template: str):
+    return templates.TemplateResponse(
+        template, {"request": request, "error": BUSY_MESSAGE},
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(PASSWORD_RETRY_AFTER)},
+    )
+
 
 def get_token(
     authorization_header: str | None = Header(None, alias="Authorization"),
@@ -53,6 +78,7 @@ def require_authenticated_user(
     """
     Зависимость для защищённых эндпоинтов.
     Проверяет JWT, сравнивает sub с user_id и загружает пользователя из БД.
+    Проверенные токены и пользователи кешируются (AUTH_*_CACHE_SECONDS).
     """
     try:
         payload = decode_access_token(token)
@@ -62,12 +88,25 @@ def require_authenticated_user(
     if int(payload.get("sub", 0)) != user_id:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
 
-    user = get_user_by_id(db, user_id)
+    user = get_cached_user(db, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     return user
 
 
+def require_logged_in_user(token: str = Depends(get_token), db=Depends(get_db)):
+    """Зависимость для эндпоинтов без user_id в пути (/api/lidar): любой вошедший пользователь"""
+    try:
+        user_id = int(decode_access_token(token).get("sub", 0))
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+    user = get_cached_user(db, user_id) if user_id else None
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    return user
+
+
 @router.get("/", response_class=HTMLResponse)
 async def home_anon(request: Request):
     return templates.TemplateResponse("home.html", {"request": request})
@@ -106,7 +145,11 @@ async def registration_web(
             errs = ve.errors()
             error = "Неверный формат email" if errs and errs[0]["loc"] == ("email",) else "Некорректные данные"
         else:
-            create_user(db, user_in)
+            try:
+                password_hash = await password_hasher.hash(password)
+            except PasswordHasherBusy:
+                return busy_response(request, "registration.html")
+            create_user(db, user_in, password_hash)
             return RedirectResponse("/login", status_code=status.HTTP_303_SEE_OTHER)
 
     return templates.TemplateResponse(
@@ -127,11 +170,22 @@ async def login_web(
     db=Depends(get_db),
 ):
     user = get_user_by_name(db, username)
-    if not user or not verify_password(password, user.user_password):
+    try:
+        valid = bool(user) and await password_hasher.verify(password, user.user_password)
+    except PasswordHasherBusy:
+        return busy_response(request, "login.html")
+    if not valid:
         return templates.TemplateResponse(
             "login.html", {"request": request, "error": "Неправильные учётные данные"}
         )
 
+    # Стоимость bcrypt изменилась — пересчитываем хеш, пока знаем пароль
+    if password_needs_rehash(user.user_password):
+        try:
+            update_user_password(db, user, await password_hasher.hash(password))
+        except PasswordHasherBusy:
+            pass
+
     token = create_access_token({"sub": str(user.id)})
     resp = RedirectResponse(f"/{user.id}", status_code=status.HTTP_303_SEE_OTHER)
     resp.set_cookie(
@@ -274,31 +328,50 @@ async def view_chd_cloud(
 async def get_measurements_api(
     experiment_id: int, 
     source: str,
+    format: str = Query("json", pattern="^(json|bin)$"),
     user=Depends(require_authenticated_user)
 ):
-    """API для получения измерений эксперимента в сферических координатах"""
+    """
+    API для получения измерений эксперимента в сферических координатах.
+    Измерения читаются из локального кеша облаков (scans/cache), а не из БД;
+    format=bin отдаёт сам файл кеша (заголовок + колонки float32 + таблица слоёв) с поддержкой Range.
+    """
 
     try:
         experiment = get_experiment_by_id(experiment_id=experiment_id, source=source)
 
         if not experiment:
             raise HTTPException(status_code=404, detail="Эксперимент не найден")
+
+        if format == "bin":
+            path, header = await asyncio.to_thread(cloud_store.ensure_header, experiment_id, source_key(source))
+            # Клиент может запросить лишь часть файла через Range — считаем полный объём
+            size = path.stat().st_size
+            MEASUREMENTS_SERVED_BYTES.labels("bin").inc(size)
+            MEASUREMENTS_SERVED_POINTS.labels("bin").inc(header["count"])
+            return FileResponse(
+                path,
+                media_type="application/octet-stream",
+                headers={
+                    "X-Header-Size": str(CLOUD_HEADER_SIZE), "X-Columns": ",".join(CLOUD_COLUMNS),
+                    "X-Points-Count": str(header["count"]), "X-Layers-Count": str(header["layers"]),
+                },
+            )
+
+        phi, theta, r = await asyncio.to_thread(cloud_store.load, experiment_id, source_key(source))
         
-        measurements = get_measurements_by_experiment_id(experiment_id, source=source)
-        
-        if not measurements:
+        if len(r) == 0:
             raise HTTPException(status_code=404, detail="Измерения не найдены")
         
-        # Преобразуем в список координат
-        coordinates = []
-        for m in measurements:
-            coordinates.append({
-                'phi': m.phi,
-                'r': m.r,
-                'theta': m.theta
-            })
+        # Преобразуем в список координат (в файле точность float32 — округляем как в исходном скане)
+        coordinates = [
+            {'phi': p, 'r': d, 'theta': t}
+            for p, d, t in zip(rounded(phi), rounded(r), rounded(theta))
+        ]
         
-        return JSONResponse(content={
+        artifact = get_artifact(experiment_id, source_key(source))
+
+        response = JSONResponse(content={
             "ok": True,
             "experiment": {
                 "id": experiment.id,
@@ -307,17 +380,58 @@ async def get_measurements_api(
                 "address": experiment.address,
                 "object_description": experiment.object_description
             },
-            "measurements_count": len(measurements),
+            "measurements_count": len(coordinates),
+            "summary": artifact_to_dict(artifact) if artifact else None,
             "coordinates": coordinates
             })
+        MEASUREMENTS_SERVED_BYTES.labels("json").inc(len(response.body))
+        MEASUREMENTS_SERVED_POINTS.labels("json").inc(len(coordinates))
+        return response
     except Exception as e:
         return JSONResponse(content={
             "ok": False, 
             "message": str(e)})
 
 
+@router.get("/{user_id}/api/experiments/{experiment_id}/summary")
+async def get_summary_api(
+    experiment_id: int,
+    source: str,
+    background_tasks: BackgroundTasks,
+    user=Depends(require_authenticated_user)
+):
+    """Предрассчитанная сводка эксперимента: количество точек, границы, слои"""
+    source = source_key(source)
+    artifact = get_artifact(experiment_id, source)
+    if artifact:
+        return JSONResponse(content={"ok": True, "summary": artifact_to_dict(artifact)})
+
+    # Эксперименты, сохранённые до появления артефактов (и ЦХД), считаем по первому запросу
+    if not get_experiment_by_id(experiment_id=experiment_id, source=source):
+        return JSONResponse(status_code=404, content={"ok": False, "message": "Эксперимент не найден"})
+    background_tasks.add_task(job_manager.submit, "artifacts", experiment_id, source, None, 0, user.id)
+    return JSONResponse(content={"ok": True, "summary": {"status": "pending"}})
+
+
+@router.get("/{user_id}/api/experiments/{experiment_id}/cartesian")
+async def get_cartesian_api(
+    experiment_id: int,
+    source: str,
+    preview: bool = False,
+    user=Depends(require_authenticated_user)
+):
+    """Декартово облако (или прореженное превью) бинарным float32 x, y, z"""
+    source = source_key(source)
+    artifact = get_artifact(experiment_id, source)
+    path = (preview_path if preview else cartesian_path)(experiment_id, source)
+    if not artifact or artifact.status != "ready" or not path.exists():
+        raise HTTPException(status_code=404, detail="Артефакты эксперимента не готовы")
+    return FileResponse(path, media_type="application/octet-stream")
+
+
 @router.post("/{user_id}/create/save")
 async def insert_data(
+        background_tasks: BackgroundTasks,
         date: str = Form(...),
         room_description: str = Form(...),
         address: str = Form(...),
@@ -338,9 +452,13 @@ async def insert_data(
         measurement_create = MeasurementCreate(
             measurements=[MeasurementData(**item) for item in measurements_dict["measurements"]]
         )
+        started = time.perf_counter()
         insert_measurements(db=db, measurement_data=measurement_create, experiment_id=exp_id)
         db.commit()
-        return {"status": "success", "message": "Data inserted"}
+        record_ingest("json", len(measurement_create.measurements), None, time.perf_counter() - started)
+        # Производные артефакты считаем задачей в пуле процессов, чтобы не задерживать ответ
+        background_tasks.add_task(job_manager.submit, "artifacts", exp_id, "local", None, 0, user.id)
+        return {"status": "success", "message": "Data inserted", "experiment_id": exp_id}
     except SQLAlchemyError as e:
         db.rollback()
         return {"status": "error", "message": f"Database error: {str(e)}"}
@@ -350,6 +468,87 @@ async def insert_data(
         db.close()
 
 
+def _upload_file(cloud_file: UploadFile) -> BinaryIO:
+    """Файл из формы без чтения в память: read_point_cloud отображает его в память"""
+    if cloud_file.size is not None and cloud_file.size > settings.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Файл слишком большой")
+    return cloud_file.file
+
+
+@router.post("/{user_id}/create/parse")
+async def parse_cloud_file(
+        cloud_file: UploadFile = File(...),
+        user=Depends(require_authenticated_user),
+):
+    """
+    Проверка файла облака без сохранения: сводка, первые строки для предпросмотра
+    и список ошибочных строк. Файл может быть сжат gzip.
+    """
+    content = _upload_file(cloud_file)
+    try:
+        phi, theta, r = await asyncio.to_thread(read_point_cloud, cloud_file.filename or "", content)
+        summary = await asyncio.to_thread(scan_summary, phi, theta, r)
+    except ScanParseError as e:
+        return {"ok": False, "message": str(e), "errors": e.errors}
+    except ValueError as e:
+        return {"ok": False, "message": str(e), "errors": []}
+    return {"ok": True, **summary}
+
+
+async def ingest_cloud_file(db, background_tasks: BackgroundTasks, experiment: ExperimentCreate,
+                            filename: str, content: bytes | pathlib.Path | BinaryIO) -> dict:
+    """Разбор файла облака, создание эксперимента и массовая вставка измерений"""
+    started = time.perf_counter()
+    phi, theta, r = await asyncio.to_thread(read_point_cloud, filename, content)
+    if len(r) == 0:
+        raise ValueError("Файл не содержит действительных данных")
+    parsed = time.perf_counter()
+
+    exp_id = insert_experiment(db=db, experiment=experiment)
+    await asyncio.to_thread(bulk_insert_measurements, db, exp_id, phi, theta, r)
+    db.commit()
+    record_ingest("file", len(r), parsed - started, time.perf_counter() - parsed)
+    background_tasks.add_task(job_manager.submit, "artifacts", exp_id, "local", None, 0, experiment.user_id)
+    return {"status": "success", "message": "Data inserted", "experiment_id": exp_id,
+            "measurements_count": len(r)}
+
+
+@router.post("/{user_id}/create/import")
+async def import_data(
+        background_tasks: BackgroundTasks,
+        date: str = Form(...),
+        room_description: str = Form(...),
+        address: str = Form(...),
+        object_description: str = Form(...),
+        cloud_file: UploadFile = File(...),
+        user=Depends(require_authenticated_user),
+        db=Depends(get_db),
+):
+    """
+    Загрузка облака из файла (скан установки .txt, PLY, PCD, LAS; можно .gz) с разбором на сервере
+    и массовой вставкой измерений.
+    """
+    try:
+        content = _upload_file(cloud_file)
+        experiment = ExperimentCreate(exp_dt=date,
+                                      room_description=room_description,
+                                      address=address,
+                                      object_description=object_description,
+                                      user_id=user.id)
+        return await ingest_cloud_file(db, background_tasks, experiment, cloud_file.filename or "", content)
+    except SQLAlchemyError as e:
+        db.rollback()
+        return {"status": "error", "message": f"Database error: {str(e)}"}
+    except ScanParseError as e:
+        db.rollback()
+        return {"status": "error", "message": str(e), "errors": e.errors}
+    except ValueError as e:
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    finally:
+        db.close()
+
+
 @router.post("/{user_id}/connect/save")
 async def synchronize_local_with_global_db(
         user=Depends(require_authenticated_user)
@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.metrics import AUTH_CACHE_REQUESTS
+
+
+class TTLCache:
+    """
+    Небольшой кеш в памяти процесса: записи живут ttl секунд (или до своего
+    срока expires_at, если он раньше), при переполнении вытесняются давно
+    не использованные. ttl = 0 отключает кеш.
+    """
+
+    def __init__(self, name: str, ttl: float, max_items: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] <= now:
+                del self._items[key]
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+        AUTH_CACHE_REQUESTS.labels(self.name, "miss" if item is None else "hit").inc()
+        return None if item is None else item[0]
+
+    def put(self, key, value, expires_at: float | None = None):
+        if self.ttl <= 0:
+            return
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._items[key] = (value, deadline)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
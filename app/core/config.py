@@ -14,12 +14,71 @@ class Settings(BaseSettings):
     JWT_PRIVATE_KEY_PATH: str = str(BASE_DIR / "certs" / "jwt-private.pem")
     JWT_PUBLIC_KEY_PATH:  str = str(BASE_DIR / "certs" / "jwt-public.pem")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # Подпись токенов: RS256, ES256 (ключ P-256) или EdDSA (ключ Ed25519); ключи в certs/ должны совпадать
+    JWT_ALGORITHM: str = "RS256"
+    # Кеши проверки входа: проверенные токены и записи пользователей, с (0 — без кеша)
+    AUTH_TOKEN_CACHE_SECONDS: int = 300
+    AUTH_USER_CACHE_SECONDS: int = 30
+    AUTH_CACHE_MAX_ITEMS: int = 10_000
+    # bcrypt: стоимость новых хешей (старые пересчитываются при входе), потоки и очередь сверх них
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE: int = 16
 
-    # Lidar SSH
+    # Lidar SSH: установка по умолчанию, которой заполняется пустой реестр lidar_devices
     LIDAR_HOST: str = "192.168.0.101"
+    LIDAR_PORT: int = 22
     LIDAR_USER: str = "vr"
     LIDAR_PASS: str = "vr"
     LIDAR_REMOTE_PATH: str = "/home/vr/Desktop/lidar"
+    # Свободных SSH-соединений на установку в пуле
+    LIDAR_SSH_POOL_SIZE: int = 2
+    # Состояние команд установки и журналы: memory — один процесс сервера,
+    # db — общая БД (для uvicorn --workers N; на PostgreSQL с LISTEN/NOTIFY)
+    TASK_BACKEND: str = "memory"
+    TASK_TTL_HOURS: int = 24
+    # Журналы команд (memory): сообщений в памяти на команду, сколько дней хранить файлы
+    TASK_LOG_BUFFER: int = 2000
+    TASK_LOG_KEEP_DAYS: int = 30
+
+    # Локальное файловое хранилище сканов и производных артефактов
+    SCANS_DIR: str = str(BASE_DIR / "scans")
+    PREVIEW_MAX_POINTS: int = 50_000
+    PREVIEW_VOXEL_SIZE: float = 0.05
+    CLOUD_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+
+    # Построение поверхности по сетке скана phi x theta
+    MESH_PHI_STEP: float = 0.5
+    MESH_MAX_EDGE: float = 0.3
+
+    # Пул процессов для тяжёлых задач по облакам (0 — по числу ядер)
+    JOB_WORKERS: int = 0
+
+    # KD-деревья облаков в памяти процесса
+    SPATIAL_INDEX_MAX_BYTES: int = 1024 ** 3
+    # Порядок точек по тайлам октодерева (для /tiles и /chunk?tile=) в памяти процесса
+    TILE_INDEX_MAX_BYTES: int = 512 * 1024 ** 2
+
+    # Совмещение сканов (ICP точка-плоскость) и объединение облаков
+    REGISTRATION_VOXEL_SIZE: float = 0.05
+    REGISTRATION_MAX_POINTS: int = 200_000
+    REGISTRATION_MAX_DISTANCE: float = 0.1
+    REGISTRATION_ICP_ITERATIONS: int = 40
+    MERGE_VOXEL_SIZE: float = 0.01
+
+    # Сравнение совмещённых сканов: расстояния облако-облако, м
+    DIFF_MAX_DISTANCE: float = 0.5
+    DIFF_THRESHOLD: float = 0.05
+
+    # Загрузка больших сканов частями
+    UPLOAD_CHUNK_SIZE: int = 8 * 1024 ** 2
+    UPLOAD_MAX_BYTES: int = 8 * 1024 ** 3
+    UPLOAD_TTL_HOURS: int = 48
+
+    # Профилирование запросов: доля запросов для выборки (0 — только по запросу), хранение
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_KEEP: int = 200
+    PROFILE_SQL_LIMIT: int = 1000
 
     DATABASE_URL: str
     
@@ -30,6 +89,26 @@ class Settings(BaseSettings):
     CHD_NAME: str
 
 
+    @property
+    def ARTIFACTS_DIR(self) -> Path:
+        return Path(self.SCANS_DIR) / "artifacts"
+
+    @property
+    def UPLOADS_DIR(self) -> Path:
+        return Path(self.SCANS_DIR) / "uploads"
+
+    @property
+    def JOBS_DIR(self) -> Path:
+        return Path(self.SCANS_DIR) / "jobs"
+
+    @property
+    def TASK_LOGS_DIR(self) -> Path:
+        return Path(self.SCANS_DIR) / "logs"
+
+    @property
+    def PROFILES_DIR(self) -> Path:
+        return Path(self.SCANS_DIR) / "profiles"
+
     @property
     def CHD_URL(self) -> str:
         encoded_pass = self.CHD_PASS
@@ -0,0 +1,116 @@
+import time
+from functools import wraps
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Границы интервалов времени, с: от быстрых запросов к БД до долгих выгрузок
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Команды установки (скан, тест двигателя) идут минутами
+SSH_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+SYNC_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "lidar_http_request_duration_seconds", "Время обработки HTTP-запроса до ответа",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "lidar_http_requests_in_progress", "HTTP-запросы в обработке", ["method"],
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "lidar_db_query_duration_seconds", "Время выполнения функций CRUD",
+    ["function"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "lidar_db_query_errors_total", "Исключения в функциях CRUD", ["function"],
+)
+
+MEASUREMENTS_SERVED_BYTES = Counter(
+    "lidar_measurements_served_bytes_total", "Байт отдано API измерений", ["format"],
+)
+MEASUREMENTS_SERVED_POINTS = Counter(
+    "lidar_measurements_served_points_total", "Точек отдано API измерений", ["format"],
+)
+
+INGESTED_POINTS = Counter(
+    "lidar_ingested_points_total", "Точек сохранено при загрузке экспериментов", ["method"],
+)
+INGEST_SECONDS = Histogram(
+    "lidar_ingest_duration_seconds", "Время этапов загрузки эксперимента",
+    ["method", "stage"], buckets=LATENCY_BUCKETS,
+)
+INGEST_POINTS_PER_SECOND = Gauge(
+    "lidar_ingest_points_per_second", "Скорость последней загрузки, точек в секунду", ["method"],
+)
+
+SSH_CONNECT_SECONDS = Histogram(
+    "lidar_ssh_connect_duration_seconds", "Время подключения к установке по SSH",
+    ["status"], buckets=SSH_BUCKETS,
+)
+SSH_COMMAND_SECONDS = Histogram(
+    "lidar_ssh_command_duration_seconds", "Время выполнения команды на установке",
+    ["command", "status"], buckets=SSH_BUCKETS,
+)
+LIDAR_TASKS_ACTIVE = Gauge(
+    "lidar_ssh_tasks_active", "Незавершённые команды установки (tasks в lidar.py)",
+)
+LIDAR_SCAN_QUEUE = Gauge(
+    "lidar_scan_queue_length", "Команды, ждущие свободную установку в этом процессе",
+)
+
+CHD_SYNC_SECONDS = Histogram(
+    "lidar_chd_sync_duration_seconds", "Время синхронизации локальной БД с ЦХД",
+    ["status"], buckets=SYNC_BUCKETS,
+)
+CHD_SYNC_EXPERIMENTS = Counter(
+    "lidar_chd_sync_experiments_total", "Эксперименты при синхронизации с ЦХД", ["result"],
+)
+CHD_SYNC_POINTS = Counter(
+    "lidar_chd_sync_points_total", "Точек скопировано в ЦХД",
+)
+
+AUTH_CACHE_REQUESTS = Counter(
+    "lidar_auth_cache_requests_total", "Обращения к кешам проверки входа", ["cache", "result"],
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "lidar_password_hash_duration_seconds", "Время bcrypt с ожиданием в очереди пула",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "lidar_password_hash_rejected_total", "Отклонено при заполненной очереди bcrypt (429)", ["operation"],
+)
+
+JOB_SECONDS = Histogram(
+    "lidar_job_duration_seconds", "Время выполнения задач пула процессов",
+    ["kind", "status"], buckets=LATENCY_BUCKETS + (300.0, 900.0),
+)
+
+
+def timed_query(func):
+    """Декоратор функций CRUD: время выполнения и число исключений по имени функции"""
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            DB_QUERY_ERRORS.labels(name).inc()
+            raise
+        finally:
+            DB_QUERY_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def record_ingest(method: str, points: int, parse_seconds: float | None, insert_seconds: float):
+    """Сохранённая загрузка: точки, время разбора и вставки, скорость"""
+    INGESTED_POINTS.labels(method).inc(points)
+    if parse_seconds is not None:
+        INGEST_SECONDS.labels(method, "parse").observe(parse_seconds)
+    INGEST_SECONDS.labels(method, "insert").observe(insert_seconds)
+    total = (parse_seconds or 0.0) + insert_seconds
+    if total > 0:
+        INGEST_POINTS_PER_SECOND.labels(method).set(points / total)
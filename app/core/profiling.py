@@ -0,0 +1,224 @@
+import asyncio
+import cProfile
+import io
+import json
+import pstats
+import random
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.security import request_user_id
+
+# Запрос профилирования: заголовок X-Profile: 1 или параметр ?profile=1
+PROFILE_HEADER = "x-profile"
+PROFILE_PARAM = "profile"
+# Пути, которые не профилируем даже при выборке
+SKIP_PREFIXES = ("/static", "/docs", "/metrics", "/favicon.ico")
+# Сколько функций в каждом списке сводки cProfile сохраняем в JSON
+TOP_FUNCTIONS = 60
+
+_current: ContextVar["ProfileRun | None"] = ContextVar("profile_run", default=None)
+# cProfile один на поток: профилируем не больше одного запроса одновременно
+_busy = False
+
+
+class ProfileRun:
+    """
+    Профиль одного запроса: cProfile потока цикла событий и SQL-запросы из любых потоков.
+    Работа в asyncio.to_thread видна в профиле как ожидание; её SQL попадает в список
+    запросов, так как контекст (ContextVar) переходит в поток.
+    """
+
+    def __init__(self, request, user_id: int | None, reason: str):
+        self.id = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+        self.method = request.method
+        self.path = request.url.path
+        self.query = request.url.query
+        self.user_id = user_id
+        self.reason = reason
+        self.started_dt = datetime.now()
+        self.started = time.perf_counter()
+        self.status = None
+        self.finished: float | None = None
+        self.sql: list[dict] = []
+        self.profiler = cProfile.Profile()
+
+    def add_statement(self, statement: str, seconds: float, rows: int):
+        if len(self.sql) < settings.PROFILE_SQL_LIMIT:
+            self.sql.append({"statement": statement, "seconds": round(seconds, 6), "rows": rows})
+
+    def summary(self) -> dict:
+        sql_seconds = sum(item["seconds"] for item in self.sql)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "user_id": self.user_id,
+            "reason": self.reason,
+            "started_dt": self.started_dt.isoformat(timespec="seconds"),
+            "seconds": round((self.finished or time.perf_counter()) - self.started, 6),
+            "sql_count": len(self.sql),
+            "sql_seconds": round(sql_seconds, 6),
+        }
+
+
+def profile_paths(profile_id: str) -> tuple[Path, Path]:
+    """(сводка JSON, дамп pstats для snakeviz / python -m pstats)"""
+    return settings.PROFILES_DIR / f"{profile_id}.json", settings.PROFILES_DIR / f"{profile_id}.prof"
+
+
+def _top_functions(profiler: cProfile.Profile) -> tuple[list[dict], list[dict]]:
+    """Самые дорогие функции: по времени с вложенными вызовами и по собственному времени"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (calls, primitive, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": f"{filename}:{line}({name})",
+            "calls": calls,
+            "primitive_calls": primitive,
+            "own_seconds": round(own, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    cumulative = sorted(rows, key=lambda row: row["cumulative_seconds"], reverse=True)
+    own = sorted(rows, key=lambda row: row["own_seconds"], reverse=True)
+    return cumulative[:TOP_FUNCTIONS], own[:TOP_FUNCTIONS]
+
+
+def save_profile(run: ProfileRun):
+    """Сохраняет профиль и удаляет самые старые сверх PROFILE_KEEP"""
+    settings.PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    json_path, prof_path = profile_paths(run.id)
+    run.profiler.dump_stats(prof_path)
+    cumulative, own = _top_functions(run.profiler)
+    report = {**run.summary(), "sql": run.sql, "functions": cumulative, "hot_functions": own}
+    json_path.write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+
+    saved = sorted(settings.PROFILES_DIR.glob("*.json"))
+    for old in saved[:max(len(saved) - settings.PROFILE_KEEP, 0)]:
+        for path in profile_paths(old.stem):
+            path.unlink(missing_ok=True)
+
+
+def list_profiles(user_id: int, limit: int) -> list[dict]:
+    """Последние профили пользователя и выборочные профили без пользователя"""
+    result = []
+    for path in sorted(settings.PROFILES_DIR.glob("*.json"), reverse=True):
+        try:
+            report = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        if report.get("user_id") in (user_id, None):
+            for key in ("sql", "functions", "hot_functions"):
+                report.pop(key, None)
+            result.append(report)
+            if len(result) >= limit:
+                break
+    return result
+
+
+def load_profile(profile_id: str) -> dict | None:
+    json_path, _ = profile_paths(profile_id)
+    try:
+        return json.loads(json_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def start_profile(request) -> ProfileRun | None:
+    """
+    Решает, профилировать ли запрос: по явной просьбе — только вошедшему
+    пользователю, иначе — с вероятностью PROFILE_SAMPLE_RATE
+    """
+    global _busy
+    if _busy or request.url.path.startswith(SKIP_PREFIXES):
+        return None
+    asked = request.headers.get(PROFILE_HEADER) == "1" or request.query_params.get(PROFILE_PARAM) == "1"
+    user_id = request_user_id(request) if asked or settings.PROFILE_SAMPLE_RATE > 0 else None
+    if asked and user_id is not None:
+        reason = "requested"
+    elif settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        reason = "sampled"
+    else:
+        return None
+
+    _busy = True
+    run = ProfileRun(request, user_id, reason)
+    _current.set(run)
+    run.profiler.enable()
+    return run
+
+
+def finish_profile(run: ProfileRun, status: int | None):
+    """Остановка профиля в потоке цикла событий; сохранение — store_profile в отдельном потоке"""
+    global _busy
+    run.profiler.disable()
+    run.status = status
+    run.finished = time.perf_counter()
+    _busy = False
+
+
+def store_profile(run: ProfileRun):
+    try:
+        save_profile(run)
+    except OSError as e:
+        print(f"Не удалось сохранить профиль {run.id}: {e}")
+
+
+class ProfileMiddleware:
+    """
+    Профиль запроса по X-Profile: 1 / ?profile=1 или по выборке PROFILE_SAMPLE_RATE.
+    Чистый ASGI: профиль закрывается в finally вокруг всего запроса — когда отдано
+    всё тело ответа (потоковые выгрузки тоже), при ошибке и при обрыве связи,
+    даже если тело ответа так и не начали отдавать
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        run = start_profile(Request(scope)) if scope["type"] == "http" else None
+        if run is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_profiled(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", run.id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            finish_profile(run, status)
+            # dump_stats, разбор pstats и ротация файлов — не в цикле событий; без await,
+            # чтобы сохранение не сорвалось при отмене запроса (обрыв связи клиентом)
+            asyncio.get_running_loop().run_in_executor(None, store_profile, run)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    run = _current.get()
+    started = conn.info.get("profile_started")
+    if run is not None and started:
+        run.add_statement(statement, time.perf_counter() - started.pop(), cursor.rowcount)
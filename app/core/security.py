@@ -1,38 +1,112 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_SECONDS, PASSWORD_HASH_REJECTED
 from jwt import PyJWTError, ExpiredSignatureError
+from jwt.algorithms import get_default_algorithms
+
+JWT_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+if settings.JWT_ALGORITHM not in JWT_ALGORITHMS:
+    raise ValueError(f"JWT_ALGORITHM должен быть одним из {', '.join(JWT_ALGORITHMS)}")
 
-# Читаем ключи единожды
+# Читаем и разбираем ключи единожды: иначе PyJWT разбирает PEM на каждом вызове
+_algorithm = get_default_algorithms()[settings.JWT_ALGORITHM]
 with open(settings.JWT_PRIVATE_KEY_PATH, "rb") as f:
-    PRIVATE_KEY = f.read()
+    PRIVATE_KEY = _algorithm.prepare_key(f.read())
 with open(settings.JWT_PUBLIC_KEY_PATH, "rb") as f:
-    PUBLIC_KEY = f.read()
+    PUBLIC_KEY = _algorithm.prepare_key(f.read())
+
+# Проверенные токены по sha256 токена; запись живёт не дольше самого токена
+token_cache = TTLCache("token", settings.AUTH_TOKEN_CACHE_SECONDS, settings.AUTH_CACHE_MAX_ITEMS)
 
 def hash_password(plain_password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     return bcrypt.hashpw(plain_password.encode(), salt).decode()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Хеш сделан с другой стоимостью, чем BCRYPT_ROUNDS ($2b$<rounds>$...)"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Очередь хеширования паролей заполнена — запрос нужно повторить позже"""
+
+
+class PasswordHasher:
+    """
+    bcrypt в отдельном пуле потоков, чтобы вход и регистрация не блокировали
+    цикл событий (bcrypt отпускает GIL). Сверх workers + queue_limit
+    одновременных вызовов новые сразу отклоняются PasswordHasherBusy.
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.limit = workers + queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        # Счётчик меняется только в цикле событий, блокировка не нужна
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _run(self, operation: str, func, *args):
+        if self._pending >= self.limit:
+            PASSWORD_HASH_REJECTED.labels(operation).inc()
+            raise PasswordHasherBusy(operation)
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+            PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    async def hash(self, plain_password: str) -> str:
+        return await self._run("hash", hash_password, plain_password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, PRIVATE_KEY, algorithm="RS256")
+    return jwt.encode(to_encode, PRIVATE_KEY, algorithm=settings.JWT_ALGORITHM)
 
 def decode_access_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(
             token,
             PUBLIC_KEY,
-            algorithms=["RS256"],
+            algorithms=[settings.JWT_ALGORITHM],
             options={"verify_exp": True}  # Явная проверка срока действия
         )
-        return payload
+        token_cache.put(key, payload, expires_at=payload.get("exp"))
+        return dict(payload)
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -42,4 +116,15 @@ def decode_access_token(token: str) -> dict:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token"
-        )
\ No newline at end of file
+        )
+
+
+def request_user_id(request) -> int | None:
+    """id пользователя из Bearer-токена (заголовок или кука), без обращения к БД"""
+    raw = request.headers.get("authorization") or request.cookies.get("Authorization")
+    if not raw or not raw.startswith("Bearer "):
+        return None
+    try:
+        return int(decode_access_token(raw.split(" ", 1)[1]).get("sub", 0)) or None
+    except Exception:
+        return None
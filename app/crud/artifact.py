@@ -0,0 +1,36 @@
+from datetime import datetime
+from app.db.session import SessionLocal
+from app.models.artifact import ExperimentArtifact
+from app.core.metrics import timed_query
+
+
+@timed_query
+def get_artifact(experiment_id: int, source: str):
+    """Артефакты эксперимента (хранятся в локальной БД для обоих источников)"""
+    with SessionLocal() as db:
+        return db.query(ExperimentArtifact).filter(
+            ExperimentArtifact.experiment_id == experiment_id,
+            ExperimentArtifact.source == source
+        ).first()
+
+
+@timed_query
+def save_artifact(experiment_id: int, source: str, **fields):
+    """Создать или обновить запись артефактов эксперимента"""
+    with SessionLocal() as db:
+        artifact = db.query(ExperimentArtifact).filter(
+            ExperimentArtifact.experiment_id == experiment_id,
+            ExperimentArtifact.source == source
+        ).first()
+        if not artifact:
+            artifact = ExperimentArtifact(experiment_id=experiment_id, source=source)
+            db.add(artifact)
+
+        for key, value in fields.items():
+            setattr(artifact, key, value)
+        artifact.updated_dt = datetime.now()
+
+        db.commit()
+        db.refresh(artifact)
+        return artifact
+
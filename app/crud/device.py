@@ -0,0 +1,117 @@
+from datetime import datetime
+
+from app.db.session import SessionLocal
+from app.models.device import LidarDevice
+from app.core.config import settings
+from app.core.metrics import timed_query
+
+
+@timed_query
+def get_devices(enabled_only: bool = False) -> list[LidarDevice]:
+    with SessionLocal() as db:
+        query = db.query(LidarDevice)
+        if enabled_only:
+            query = query.filter(LidarDevice.enabled.is_(True))
+        return query.order_by(LidarDevice.id).all()
+
+
+@timed_query
+def get_device(device_id: int):
+    with SessionLocal() as db:
+        return db.query(LidarDevice).filter(LidarDevice.id == device_id).first()
+
+
+@timed_query
+def create_device(**fields):
+    with SessionLocal() as db:
+        device = LidarDevice(**fields)
+        db.add(device)
+        db.commit()
+        db.refresh(device)
+        return device
+
+
+@timed_query
+def update_device(device_id: int, **fields):
+    with SessionLocal() as db:
+        device = db.query(LidarDevice).filter(LidarDevice.id == device_id).first()
+        if not device:
+            return None
+        for key, value in fields.items():
+            setattr(device, key, value)
+        db.commit()
+        db.refresh(device)
+        return device
+
+
+@timed_query
+def delete_device(device_id: int) -> bool:
+    with SessionLocal() as db:
+        count = db.query(LidarDevice).filter(LidarDevice.id == device_id).delete(synchronize_session=False)
+        db.commit()
+        return count > 0
+
+
+@timed_query
+def ensure_default_device():
+    """Пустой реестр заполняем установкой из настроек LIDAR_* (как было до реестра)"""
+    with SessionLocal() as db:
+        if db.query(LidarDevice.id).first() is not None:
+            return
+        db.add(LidarDevice(
+            name="default", host=settings.LIDAR_HOST, port=settings.LIDAR_PORT, username=settings.LIDAR_USER,
+            password=settings.LIDAR_PASS, remote_path=settings.LIDAR_REMOTE_PATH, enabled=True,
+        ))
+        db.commit()
+
+
+@timed_query
+def claim_device(device_id: int, task_id: str, owner: str) -> bool:
+    """Занять установку под команду; False — на ней уже идёт другая (в любом процессе сервера)"""
+    with SessionLocal() as db:
+        count = db.query(LidarDevice).filter(
+            LidarDevice.id == device_id,
+            LidarDevice.enabled.is_(True),
+            LidarDevice.active_task_id.is_(None),
+        ).update(
+            {"active_task_id": task_id, "active_owner": owner, "active_since_dt": datetime.now()},
+            synchronize_session=False,
+        )
+        db.commit()
+        return count > 0
+
+
+@timed_query
+def release_device(device_id: int, task_id: str):
+    with SessionLocal() as db:
+        db.query(LidarDevice).filter(
+            LidarDevice.id == device_id, LidarDevice.active_task_id == task_id,
+        ).update(
+            {"active_task_id": None, "active_owner": None, "active_since_dt": None},
+            synchronize_session=False,
+        )
+        db.commit()
+
+
+@timed_query
+def release_devices_of(owners: list[str]) -> int:
+    """Снять занятость, оставшуюся от завершившихся процессов сервера"""
+    if not owners:
+        return 0
+    with SessionLocal() as db:
+        count = db.query(LidarDevice).filter(LidarDevice.active_owner.in_(owners)).update(
+            {"active_task_id": None, "active_owner": None, "active_since_dt": None},
+            synchronize_session=False,
+        )
+        db.commit()
+        return count
+
+
+@timed_query
+def mark_device_seen(device_id: int, error: str | None = None):
+    with SessionLocal() as db:
+        fields = {"last_error": error[:300] if error else None}
+        if error is None:
+            fields["last_seen_dt"] = datetime.now()
+        db.query(LidarDevice).filter(LidarDevice.id == device_id).update(fields, synchronize_session=False)
+        db.commit()
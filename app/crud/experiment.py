@@ -1,4 +1,5 @@
 from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from app.models.experiment import Experiment, ExperimentChd
 from app.models.user import User
@@ -6,10 +7,13 @@ from app.models.measurement import Measurement
 from app.schemas.experiment import ExperimentCreate
 from datetime import datetime
 import asyncio
+import time
 from typing import List
 from app.db.session import SessionLocal, SessionChd 
+from app.core.metrics import timed_query, CHD_SYNC_SECONDS, CHD_SYNC_EXPERIMENTS, CHD_SYNC_POINTS
 
 
+@timed_query
 def insert_experiment(db: Session, experiment: ExperimentCreate):
     result = db.execute(
         insert(Experiment).values(
@@ -30,6 +34,9 @@ def insert_local_experiments_sync():
     """
     print("Начало синхронизации...")
     chd_loaded_dt = datetime.now()
+    started = time.perf_counter()
+    status = "error"
+    copied = skipped = points = 0
     
     with SessionLocal() as local_db, SessionChd() as global_db:
         try:
@@ -61,6 +68,7 @@ def insert_local_experiments_sync():
 
                 if not global_user_id:
                     print(f"Skipping experiment {l_exp.id}: User not found.")
+                    skipped += 1
                     continue
                 exists_identical = global_db.query(ExperimentChd).filter(
                     ExperimentChd.exp_dt == l_exp.exp_dt,
@@ -71,6 +79,7 @@ def insert_local_experiments_sync():
                 ).first()
                 if exists_identical:
                     print(f"Эксперимент {l_exp.id} уже есть в ЦХД, продолжаем")
+                    skipped += 1
                     continue
                 
                 g_exp = ExperimentChd(
@@ -100,9 +109,15 @@ def insert_local_experiments_sync():
                 ]
                 if mappings:
                     global_db.bulk_insert_mappings(Measurement, mappings)
+                copied += 1
+                points += len(mappings)
             
             global_db.commit()
-            print("Синхронизация успешно завершена.")
+            status = "success"
+            CHD_SYNC_EXPERIMENTS.labels("copied").inc(copied)
+            CHD_SYNC_EXPERIMENTS.labels("skipped").inc(skipped)
+            CHD_SYNC_POINTS.inc(points)
+            print(f"Синхронизация успешно завершена за {time.perf_counter() - started:.1f} с.")
 
         except TimeoutError as e:
             global_db.rollback()
@@ -119,6 +134,9 @@ def insert_local_experiments_sync():
             print(f"Неизвестная ошибка: {str(e)}")
             raise e
 
+        finally:
+            CHD_SYNC_SECONDS.labels(status).observe(time.perf_counter() - started)
+
 
 async def insert_local_experiments_to_chd():
     """
@@ -135,6 +153,7 @@ async def insert_local_experiments_to_chd():
         raise TimeoutError("Время ожидания истекло. Не удалось синхронизировать БД.")
 
 
+@timed_query
 def get_mapped_global_user_id(local_user_id: int, global_session: Session) -> int | None:
     """
     Находит ID пользователя в глобальной БД, соответствующего локальному пользователю.
@@ -153,6 +172,7 @@ def get_mapped_global_user_id(local_user_id: int, global_session: Session) -> in
     return g_user.id if g_user else None
 
 
+@timed_query
 def get_all_experiments(user_id: int | None = None, is_global_db: bool = False):
     if is_global_db:
         SessionFactory = SessionChd
@@ -191,6 +211,7 @@ async def get_all_experiments_async(user_id: int=None, is_global_db: bool=False)
 
 
 
+@timed_query
 def get_experiment_by_id(experiment_id: int, source: str):
     """Получить эксперимент по ID"""
     if source == "chd":
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from sqlalchemy import or_
+
+from app.db.session import SessionLocal
+from app.models.job import Job
+from app.core.metrics import timed_query
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+@timed_query
+def create_job(**fields):
+    with SessionLocal() as db:
+        job = Job(**{"status": "queued", "created_dt": datetime.now(), **fields})
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+
+@timed_query
+def get_job(job_id: int):
+    with SessionLocal() as db:
+        return db.query(Job).filter(Job.id == job_id).first()
+
+
+@timed_query
+def update_job(job_id: int, **fields):
+    with SessionLocal() as db:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        if not job:
+            return None
+        for key, value in fields.items():
+            setattr(job, key, value)
+        db.commit()
+        db.refresh(job)
+        return job
+
+
+@timed_query
+def get_latest_job(cache_key: str, **filters):
+    """Последняя задача с тем же ключом (тип, параметры, версия облака); filters — user_id, status"""
+    with SessionLocal() as db:
+        return (db.query(Job).filter(Job.cache_key == cache_key).filter_by(**filters)
+                .order_by(Job.id.desc()).first())
+
+
+@timed_query
+def get_jobs_by_user(user_id: int, limit: int = 50):
+    with SessionLocal() as db:
+        return db.query(Job).filter(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit).all()
+
+
+@timed_query
+def get_active_job_owners() -> list:
+    with SessionLocal() as db:
+        rows = db.query(Job.owner).filter(Job.status.in_(ACTIVE_STATUSES)).distinct().all()
+        return [row.owner for row in rows]
+
+
+@timed_query
+def fail_jobs_of(owners: list, include_unowned: bool = False) -> int:
+    """
+    Задачи, прерванные завершением процесса сервера: пул процессов живёт только в его памяти.
+    include_unowned — ещё и задачи без владельца (поставленные до появления колонки owner)
+    """
+    condition = Job.owner.in_(owners)
+    if include_unowned:
+        condition = or_(condition, Job.owner.is_(None))
+    with SessionLocal() as db:
+        count = db.query(Job).filter(Job.status.in_(ACTIVE_STATUSES), condition).update(
+            {"status": "error", "message": "Прервано перезапуском сервера", "finished_dt": datetime.now()},
+            synchronize_session=False,
+        )
+        db.commit()
+        return count
@@ -1,9 +1,16 @@
+import io
+
+import numpy as np
+from sqlalchemy import select, func, insert
 from app.db.session import SessionLocal, SessionChd 
 from sqlalchemy.orm import Session
 from app.models.measurement import Measurement
 from app.schemas.measurement import MeasurementCreate
+from app.core.metrics import timed_query
+from app.utils.geometry import layer_order
 
 
+@timed_query
 def insert_measurements(db: Session, measurement_data: MeasurementCreate, experiment_id: int):
     measurements = [
         Measurement(
@@ -19,6 +26,64 @@ def insert_measurements(db: Session, measurement_data: MeasurementCreate, experi
     db.bulk_save_objects(measurements)
 
 
+# Бинарный формат COPY PostgreSQL: заголовок, кортежи (число полей, длина + значение
+# каждого поля в big-endian), завершающий -1
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\0" + b"\0\0\0\0" + b"\0\0\0\0"
+_PGCOPY_TRAILER = b"\xff\xff"
+_PGCOPY_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("experiment_id_len", ">i4"), ("experiment_id", ">i4"),
+    ("phi_len", ">i4"), ("phi", ">f8"),
+    ("theta_len", ">i4"), ("theta", ">f8"),
+    ("r_len", ">i4"), ("r", ">f8"),
+])
+BULK_INSERT_BATCH = 1_000_000
+
+
+def _pgcopy_payload(experiment_id: int, phi, theta, r) -> bytes:
+    rows = np.empty(len(r), dtype=_PGCOPY_ROW)
+    rows["fields"] = 4
+    rows["experiment_id_len"] = 4
+    rows["experiment_id"] = experiment_id
+    rows["phi_len"] = rows["theta_len"] = rows["r_len"] = 8
+    rows["phi"], rows["theta"], rows["r"] = phi, theta, r
+    return _PGCOPY_HEADER + rows.tobytes() + _PGCOPY_TRAILER
+
+
+@timed_query
+def bulk_insert_measurements(db: Session, experiment_id: int, phi, theta, r):
+    """
+    Массовая вставка измерений из колонок numpy в текущей транзакции сессии.
+    Для PostgreSQL — бинарный COPY, собранный векторно; для остальных СУБД — executemany.
+    Точки пишутся слоями подряд по возрастанию theta: в порядке id слой — непрерывный
+    диапазон, и кеш облаков (app/utils/cloud_store.py) отдаёт его срезом.
+    """
+    order = layer_order(theta)
+    if order is not None:
+        phi, theta, r = np.asarray(phi)[order], np.asarray(theta)[order], np.asarray(r)[order]
+
+    if db.get_bind().dialect.name == "postgresql":
+        cursor = db.connection().connection.cursor()
+        try:
+            for start in range(0, len(r), BULK_INSERT_BATCH):
+                sl = slice(start, start + BULK_INSERT_BATCH)
+                cursor.copy_expert(
+                    "COPY measurements (experiment_id, phi, theta, r) FROM STDIN WITH (FORMAT binary)",
+                    io.BytesIO(_pgcopy_payload(experiment_id, phi[sl], theta[sl], r[sl])),
+                )
+        finally:
+            cursor.close()
+        return
+
+    for start in range(0, len(r), BULK_INSERT_BATCH):
+        sl = slice(start, start + BULK_INSERT_BATCH)
+        db.execute(insert(Measurement), [
+            {"experiment_id": experiment_id, "phi": p, "theta": t, "r": d}
+            for p, t, d in zip(np.asarray(phi[sl]).tolist(), np.asarray(theta[sl]).tolist(), np.asarray(r[sl]).tolist())
+        ])
+
+
+@timed_query
 def get_measurements_by_experiment_id(experiment_id: int, source: str):
     if source == "chd":
         SessionFactory = SessionChd
@@ -28,3 +93,41 @@ def get_measurements_by_experiment_id(experiment_id: int, source: str):
     with SessionFactory() as db:
         measurements = db.query(Measurement).filter(Measurement.experiment_id == experiment_id).all()
         return measurements
+
+
+@timed_query
+def get_measurement_arrays(experiment_id: int, source: str):
+    """
+    Измерения эксперимента колонками numpy (phi, theta, r) в порядке вставки.
+    Без создания ORM-объектов на каждую точку.
+    """
+    if source == "chd":
+        SessionFactory = SessionChd
+    else:
+        SessionFactory = SessionLocal
+
+    with SessionFactory() as db:
+        rows = db.execute(
+            select(Measurement.phi, Measurement.theta, Measurement.r)
+            .where(Measurement.experiment_id == experiment_id)
+            .order_by(Measurement.id)
+        ).all()
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+@timed_query
+def get_measurements_fingerprint(experiment_id: int, source: str) -> tuple[int, int]:
+    """Количество измерений эксперимента и max(id) — для сверки локального кеша с БД"""
+    if source == "chd":
+        SessionFactory = SessionChd
+    else:
+        SessionFactory = SessionLocal
+
+    with SessionFactory() as db:
+        count, max_id = db.execute(
+            select(func.count(Measurement.id), func.max(Measurement.id))
+            .where(Measurement.experiment_id == experiment_id)
+        ).one()
+    return count, max_id or 0
@@ -0,0 +1,41 @@
+from datetime import datetime
+from app.db.session import SessionLocal
+from app.models.registration import ExperimentRegistration
+from app.core.metrics import timed_query
+
+
+def _query(db, experiment_id: int, source: str, reference_id: int, reference_source: str):
+    return db.query(ExperimentRegistration).filter(
+        ExperimentRegistration.experiment_id == experiment_id,
+        ExperimentRegistration.source == source,
+        ExperimentRegistration.reference_id == reference_id,
+        ExperimentRegistration.reference_source == reference_source
+    )
+
+
+@timed_query
+def get_registration(experiment_id: int, source: str, reference_id: int, reference_source: str):
+    """Сохранённое совмещение эксперимента с опорным"""
+    with SessionLocal() as db:
+        return _query(db, experiment_id, source, reference_id, reference_source).first()
+
+
+@timed_query
+def save_registration(experiment_id: int, source: str, reference_id: int, reference_source: str, **fields):
+    """Создать или обновить совмещение пары экспериментов"""
+    with SessionLocal() as db:
+        registration = _query(db, experiment_id, source, reference_id, reference_source).first()
+        if not registration:
+            registration = ExperimentRegistration(
+                experiment_id=experiment_id, source=source,
+                reference_id=reference_id, reference_source=reference_source
+            )
+            db.add(registration)
+
+        for key, value in fields.items():
+            setattr(registration, key, value)
+        registration.updated_dt = datetime.now()
+
+        db.commit()
+        db.refresh(registration)
+        return registration
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.db.session import SessionLocal
+from app.models.task import LidarTask, LidarTaskLog
+from app.core.metrics import timed_query
+
+# Канал Postgres NOTIFY: полезная нагрузка — task_id с новыми сообщениями
+NOTIFY_CHANNEL = "lidar_task_logs"
+
+
+def _notify(db, task_id: str):
+    # Уведомление уходит при commit; на других СУБД подписчики опрашивают таблицу
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :task_id)"), {"channel": NOTIFY_CHANNEL, "task_id": task_id})
+
+
+@timed_query
+def create_task(task_id: str, kind: str, meta: dict | None, owner: str):
+    with SessionLocal() as db:
+        db.add(LidarTask(id=task_id, kind=kind, meta=meta, owner=owner, created_dt=datetime.now()))
+        db.commit()
+
+
+@timed_query
+def get_task(task_id: str):
+    with SessionLocal() as db:
+        return db.query(LidarTask).filter(LidarTask.id == task_id).first()
+
+
+@timed_query
+def add_task_logs(task_id: str, messages: list[dict]):
+    with SessionLocal() as db:
+        db.add_all(LidarTaskLog(task_id=task_id, type=m["type"], text=m["text"]) for m in messages)
+        _notify(db, task_id)
+        db.commit()
+
+
+@timed_query
+def get_task_logs(task_id: str, after_id: int = 0, limit: int = 1000) -> list[LidarTaskLog]:
+    with SessionLocal() as db:
+        return (
+            db.query(LidarTaskLog)
+            .filter(LidarTaskLog.task_id == task_id, LidarTaskLog.id > after_id)
+            .order_by(LidarTaskLog.id)
+            .limit(limit)
+            .all()
+        )
+
+
+@timed_query
+def update_task(task_id: str, **fields) -> bool:
+    with SessionLocal() as db:
+        count = db.query(LidarTask).filter(LidarTask.id == task_id).update(fields, synchronize_session=False)
+        if fields.get("done"):
+            _notify(db, task_id)
+        db.commit()
+        return count > 0
+
+
+@timed_query
+def delete_old_tasks(hours: int) -> int:
+    """
+    Команды, завершённые больше hours часов назад, вместе с журналами.
+    Идущие команды не трогаем, сколько бы они ни длились (как MemoryTaskBackend.cleanup)
+    """
+    deadline = datetime.now() - timedelta(hours=hours)
+    with SessionLocal() as db:
+        ids = [row.id for row in db.query(LidarTask.id).filter(
+            LidarTask.done.is_(True), LidarTask.finished_dt < deadline,
+        )]
+        if ids:
+            db.query(LidarTaskLog).filter(LidarTaskLog.task_id.in_(ids)).delete(synchronize_session=False)
+            db.query(LidarTask).filter(LidarTask.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        return len(ids)
@@ -1,24 +1,68 @@
+from dataclasses import dataclass
+
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.schemas.user import UserCreate
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.security import hash_password
+from app.core.metrics import timed_query
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Снимок записи пользователя для защищённых эндпоинтов (без хеша пароля)"""
+    id: int
+    user_name: str
+    email: str | None
+
+
+# Пользователи по id для require_authenticated_user; после изменения записи — invalidate_user
+user_cache = TTLCache("user", settings.AUTH_USER_CACHE_SECONDS, settings.AUTH_CACHE_MAX_ITEMS)
 
+
+@timed_query
 def get_user_by_name(db: Session, user_name: str):
     return db.query(User).filter(User.user_name == user_name).first()
 
+@timed_query
 def get_user_by_id(db, user_id: int):
     return db.query(User).filter(User.id == user_id).first()
 
+def get_cached_user(db, user_id: int) -> CachedUser | None:
+    user = user_cache.get(user_id)
+    if user is None:
+        record = get_user_by_id(db, user_id)
+        if record is None:
+            return None
+        user = CachedUser(id=record.id, user_name=record.user_name, email=record.email)
+        user_cache.put(user_id, user)
+    return user
+
+def invalidate_user(user_id: int):
+    user_cache.pop(user_id)
+
+@timed_query
 def get_user_by_email(db: Session, email: str):
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, user_in: UserCreate):
+@timed_query
+def create_user(db: Session, user_in: UserCreate, password_hash: str | None = None):
+    """password_hash — уже посчитанный хеш (password_hasher в обработчике), иначе считаем здесь"""
     user = User(
         user_name = user_in.user_name,
-        user_password = hash_password(user_in.password),
+        user_password = password_hash or hash_password(user_in.password),
         email = user_in.email,
     )
     db.add(user)
     db.commit()
     db.refresh(user)
-    return user
\ No newline at end of file
+    # id мог принадлежать удалённому пользователю, чья запись ещё в кеше
+    invalidate_user(user.id)
+    return user
+
+@timed_query
+def update_user_password(db: Session, user: User, password_hash: str):
+    user.user_password = password_hash
+    db.commit()
+    invalidate_user(user.id)
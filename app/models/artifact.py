@@ -0,0 +1,66 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, UniqueConstraint
+from app.db.base import Base
+
+
+class ExperimentArtifact(Base):
+    __tablename__ = "experiment_artifacts"
+
+    __table_args__ = (
+        UniqueConstraint("experiment_id", "source", name="uq_artifact_experiment_source"),
+    )
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        index=True,
+        comment="Уникальный идентификатор артефакта"
+    )
+    experiment_id = Column(
+        Integer,
+        nullable=False,
+        comment="ID эксперимента (в локальной БД или в ЦХД)"
+    )
+    source = Column(
+        String(10),
+        nullable=False,
+        default="local",
+        comment="Источник эксперимента: local или chd"
+    )
+    status = Column(
+        String(20),
+        nullable=False,
+        default="pending",
+        comment="Состояние расчёта: pending, ready, error"
+    )
+    message = Column(
+        String(300),
+        nullable=True,
+        comment="Текст ошибки расчёта"
+    )
+    points_count = Column(
+        Integer,
+        nullable=True,
+        comment="Количество точек"
+    )
+    min_x = Column(Float, nullable=True, comment="Граница облака, мин. X, м")
+    min_y = Column(Float, nullable=True, comment="Граница облака, мин. Y, м")
+    min_z = Column(Float, nullable=True, comment="Граница облака, мин. Z, м")
+    max_x = Column(Float, nullable=True, comment="Граница облака, макс. X, м")
+    max_y = Column(Float, nullable=True, comment="Граница облака, макс. Y, м")
+    max_z = Column(Float, nullable=True, comment="Граница облака, макс. Z, м")
+    layers = Column(
+        JSON,
+        nullable=True,
+        comment="Статистика по слоям theta"
+    )
+    preview_count = Column(
+        Integer,
+        nullable=True,
+        comment="Количество точек в прореженном облаке"
+    )
+    updated_dt = Column(
+        DateTime,
+        nullable=True,
+        comment="Время последнего расчёта"
+    )
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from app.db.base import Base
+
+
+class LidarDevice(Base):
+    """Сканирующая установка (Raspberry Pi с лидаром), доступная по SSH"""
+    __tablename__ = "lidar_devices"
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        index=True,
+        comment="Уникальный идентификатор установки"
+    )
+    name = Column(
+        String(50),
+        nullable=False,
+        unique=True,
+        comment="Название установки"
+    )
+    host = Column(String(100), nullable=False, comment="Адрес SSH")
+    port = Column(Integer, nullable=False, default=22, comment="Порт SSH")
+    username = Column(String(50), nullable=False, comment="Пользователь SSH")
+    password = Column(String(100), nullable=False, comment="Пароль SSH")
+    remote_path = Column(
+        String(200),
+        nullable=False,
+        comment="Каталог скриптов установки (lidar.py, engine.py, scan.py)"
+    )
+    enabled = Column(
+        Boolean,
+        nullable=False,
+        default=True,
+        comment="Участвует в планировании сканов"
+    )
+    active_task_id = Column(
+        String(32),
+        nullable=True,
+        comment="Выполняющаяся команда: на установке не больше одной"
+    )
+    active_owner = Column(
+        String(100),
+        nullable=True,
+        comment="Процесс сервера, выполняющий команду (host:pid)"
+    )
+    active_since_dt = Column(DateTime, nullable=True, comment="Начало выполняющейся команды")
+    last_seen_dt = Column(DateTime, nullable=True, comment="Последнее успешное подключение")
+    last_error = Column(String(300), nullable=True, comment="Последняя ошибка подключения")
@@ -45,11 +45,11 @@ class ExperimentChd(Base):
     __tablename__ = "experiments"
 
     __table_args__ = {'extend_existing': True}
+    # Индекс по id уже объявлен в Experiment — та же таблица
     id = Column(
         Integer,
         primary_key=True,
         autoincrement=True,
-        index=True,
         comment="Уникальный идентификатор эксперимента"
     )
     exp_dt = Column(
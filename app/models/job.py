@@ -0,0 +1,76 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from app.db.base import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        index=True,
+        comment="Уникальный идентификатор задачи"
+    )
+    kind = Column(
+        String(20),
+        nullable=False,
+        comment="Тип задачи: artifacts, mesh, filter, export, downsample"
+    )
+    experiment_id = Column(
+        Integer,
+        nullable=False,
+        comment="ID эксперимента"
+    )
+    source = Column(
+        String(10),
+        nullable=False,
+        default="local",
+        comment="Источник эксперимента: local или chd"
+    )
+    user_id = Column(
+        Integer,
+        nullable=True,
+        comment="Пользователь, поставивший задачу"
+    )
+    params = Column(
+        JSON,
+        nullable=False,
+        comment="Параметры задачи"
+    )
+    cache_key = Column(
+        String(40),
+        nullable=False,
+        index=True,
+        comment="Хеш типа, параметров и версии облака: одинаковые задачи не считаются дважды"
+    )
+    priority = Column(
+        Integer,
+        nullable=False,
+        default=0,
+        comment="Приоритет: большие значения выполняются раньше"
+    )
+    status = Column(
+        String(20),
+        nullable=False,
+        default="queued",
+        comment="Состояние: queued, running, done, error, cancelled"
+    )
+    message = Column(
+        String(300),
+        nullable=True,
+        comment="Текст ошибки"
+    )
+    result = Column(
+        JSON,
+        nullable=True,
+        comment="Результат задачи (сводка, путь к файлу)"
+    )
+    owner = Column(
+        String(100),
+        nullable=True,
+        comment="Процесс сервера, в пуле которого выполняется задача (host:pid)"
+    )
+    created_dt = Column(DateTime, nullable=True, comment="Время постановки в очередь")
+    started_dt = Column(DateTime, nullable=True, comment="Время запуска")
+    finished_dt = Column(DateTime, nullable=True, comment="Время завершения")
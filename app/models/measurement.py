@@ -17,6 +17,7 @@ class Measurement(Base):
         Integer,
         ForeignKey("experiments.id", ondelete="CASCADE"),
         nullable=False,
+        index=True,
         comment="Ссылка на эксперимент"
     )
     phi = Column(
@@ -0,0 +1,68 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, UniqueConstraint
+from app.db.base import Base
+
+
+class ExperimentRegistration(Base):
+    __tablename__ = "experiment_registrations"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "experiment_id", "source", "reference_id", "reference_source",
+            name="uq_registration_pair"
+        ),
+    )
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        index=True,
+        comment="Уникальный идентификатор совмещения"
+    )
+    experiment_id = Column(
+        Integer,
+        nullable=False,
+        comment="ID совмещаемого эксперимента"
+    )
+    source = Column(
+        String(10),
+        nullable=False,
+        default="local",
+        comment="Источник совмещаемого эксперимента: local или chd"
+    )
+    reference_id = Column(
+        Integer,
+        nullable=False,
+        comment="ID опорного эксперимента"
+    )
+    reference_source = Column(
+        String(10),
+        nullable=False,
+        default="local",
+        comment="Источник опорного эксперимента: local или chd"
+    )
+    transform = Column(
+        JSON,
+        nullable=False,
+        comment="Матрица 4x4 перехода в систему опорного эксперимента (оси отчёта, м)"
+    )
+    method = Column(
+        String(20),
+        nullable=False,
+        comment="Грубое совмещение: correspondences или pca"
+    )
+    rmse = Column(
+        Float,
+        nullable=True,
+        comment="СКО расстояний точка-плоскость после ICP, м"
+    )
+    fitness = Column(
+        Float,
+        nullable=True,
+        comment="Доля точек, нашедших пару в опорном облаке"
+    )
+    updated_dt = Column(
+        DateTime,
+        nullable=True,
+        comment="Время последнего совмещения"
+    )
@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON
+from app.db.base import Base
+
+
+class LidarTask(Base):
+    """Команда установки (скан, тесты): общее состояние для всех процессов сервера"""
+    __tablename__ = "lidar_tasks"
+
+    id = Column(
+        String(32),
+        primary_key=True,
+        comment="task_id (uuid4 hex)"
+    )
+    kind = Column(
+        String(20),
+        nullable=False,
+        comment="Команда: test, engine_test, scan"
+    )
+    meta = Column(
+        JSON,
+        nullable=True,
+        comment="Параметры команды (имя файла скана и т.п.)"
+    )
+    owner = Column(
+        String(100),
+        nullable=True,
+        comment="Процесс сервера, держащий SSH-соединение (host:pid)"
+    )
+    stop_requested = Column(
+        Boolean,
+        nullable=False,
+        default=False,
+        comment="Запрошена остановка (/stop мог прийти в другой процесс)"
+    )
+    done = Column(
+        Boolean,
+        nullable=False,
+        default=False,
+        comment="Команда завершена, журнал дописан"
+    )
+    created_dt = Column(DateTime, nullable=True, comment="Время запуска")
+    finished_dt = Column(DateTime, nullable=True, comment="Время завершения")
+
+
+class LidarTaskLog(Base):
+    """Строки журнала команды в порядке id"""
+    __tablename__ = "lidar_task_logs"
+
+    id = Column(
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        comment="Порядковый номер сообщения"
+    )
+    task_id = Column(
+        String(32),
+        nullable=False,
+        index=True,
+        comment="task_id команды"
+    )
+    type = Column(
+        String(10),
+        nullable=False,
+        comment="Тип сообщения: out, err, info"
+    )
+    text = Column(
+        Text,
+        nullable=False,
+        comment="Текст сообщения"
+    )
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+
+# Каталог на установке подставляется в команды shell: только безопасные символы пути
+REMOTE_PATH_PATTERN = r"^/?[A-Za-z0-9_.-]+(/[A-Za-z0-9_.-]+)*/?$"
+
+
+class DeviceCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=50)
+    host: str = Field(..., min_length=1, max_length=100)
+    port: int = Field(22, ge=1, le=65535)
+    username: str = Field(..., min_length=1, max_length=50)
+    password: str = Field(..., max_length=100)
+    remote_path: str = Field(..., min_length=1, max_length=200, pattern=REMOTE_PATH_PATTERN)
+    enabled: bool = True
+
+
+class DeviceUpdate(BaseModel):
+    name: str | None = Field(None, min_length=1, max_length=50)
+    host: str | None = Field(None, min_length=1, max_length=100)
+    port: int | None = Field(None, ge=1, le=65535)
+    username: str | None = Field(None, min_length=1, max_length=50)
+    password: str | None = Field(None, max_length=100)
+    remote_path: str | None = Field(None, min_length=1, max_length=200, pattern=REMOTE_PATH_PATTERN)
+    enabled: bool | None = None
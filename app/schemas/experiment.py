@@ -1,8 +1,11 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
 class ExperimentCreate(BaseModel):
-    exp_dt: str
+    # Строка из формы (datetime-local) разбирается здесь, а не в СУБД
+    exp_dt: datetime
     room_description: str | None = None
     address: str
     object_description: str | None = None
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, Field
+
+
+class FilterParams(BaseModel):
+    # Отсечение по дальности, мм
+    range_min: float | None = Field(None, ge=0)
+    range_max: float | None = Field(None, gt=0)
+    # Статистический фильтр: среднее расстояние до k соседей не больше mean + std_ratio * std
+    sor_neighbors: int | None = Field(None, ge=2, le=100)
+    sor_std_ratio: float = Field(2.0, gt=0)
+    # Фильтр по радиусу: не меньше min_neighbors соседей в шаре radius, м
+    ror_radius: float | None = Field(None, gt=0, le=5)
+    ror_min_neighbors: int = Field(4, ge=1, le=1000)
+    # Движение между слоями: скачок дальности относительно обоих соседних слоёв, мм
+    motion_threshold: float | None = Field(None, gt=0)
+    motion_phi_step: float = Field(0.5, gt=0, le=10)
+
+    def cache_key(self) -> str:
+        return self.model_dump_json()
@@ -0,0 +1,11 @@
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+
+class JobCreate(BaseModel):
+    kind: Literal["artifacts", "mesh", "filter", "export", "downsample"]
+    experiment_id: int
+    source: str = "local"
+    params: dict = Field(default_factory=dict)
+    priority: int = Field(0, ge=-10, le=10)
@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+
+
+class Correspondence(BaseModel):
+    # Точка совмещаемого облака и та же точка в опорном (оси отчёта, м)
+    source: list[float] = Field(..., min_length=3, max_length=3)
+    target: list[float] = Field(..., min_length=3, max_length=3)
+
+
+class RegistrationRequest(BaseModel):
+    source: str = "local"
+    reference_id: int
+    reference_source: str = "local"
+    correspondences: list[Correspondence] | None = None
+    max_distance: float | None = Field(None, gt=0, le=5)
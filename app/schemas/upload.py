@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0)
+    sha256: str | None = Field(None, pattern="^[0-9a-fA-F]{64}$")
@@ -0,0 +1,85 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.cloud_store import cloud_store
+from app.utils.geometry import spherical_to_cartesian, bounding_box, layer_stats, voxel_downsample
+
+
+def artifact_dir(experiment_id: int, source: str) -> Path:
+    return settings.ARTIFACTS_DIR / f"{source}_{experiment_id}"
+
+
+def cartesian_path(experiment_id: int, source: str) -> Path:
+    """Декартово облако: float32 x, y, z подряд (готово для Float32Array во вьювере)"""
+    return artifact_dir(experiment_id, source) / "cartesian.f32"
+
+
+def preview_path(experiment_id: int, source: str) -> Path:
+    """Прореженное облако в том же формате, что и cartesian.f32"""
+    return artifact_dir(experiment_id, source) / "preview.f32"
+
+
+def _write_atomic(path: Path, data: np.ndarray):
+    # Свой временный файл у каждого процесса: задачи разных пользователей могут писать параллельно
+    tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    data.astype("<f4", copy=False).tofile(tmp)
+    tmp.replace(path)
+
+
+def write_artifacts(experiment_id: int, source: str, phi, theta, r) -> dict:
+    """
+    Этап пайплайна загрузки: по колонкам облака считает полное и прореженное
+    декартово облако (файлы в scans/artifacts), границы облака и статистику
+    слоёв. Возвращает поля сводки для experiment_artifacts.
+    Выполняется задачей 'artifacts' в пуле процессов (app/utils/jobs.py).
+    """
+    xyz = spherical_to_cartesian(phi, r, theta)
+    preview_idx = voxel_downsample(xyz, settings.PREVIEW_VOXEL_SIZE, settings.PREVIEW_MAX_POINTS)
+
+    out_dir = artifact_dir(experiment_id, source)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _write_atomic(cartesian_path(experiment_id, source), xyz)
+    _write_atomic(preview_path(experiment_id, source), xyz[preview_idx])
+
+    bbox = bounding_box(xyz)
+    return {
+        "points_count": len(xyz),
+        "min_x": bbox["min"][0], "min_y": bbox["min"][1], "min_z": bbox["min"][2],
+        "max_x": bbox["max"][0], "max_y": bbox["max"][1], "max_z": bbox["max"][2],
+        "layers": layer_stats(phi, r, theta),
+        "preview_count": len(preview_idx),
+    }
+
+
+def load_cartesian(experiment_id: int, source: str) -> np.ndarray:
+    """
+    Декартовы координаты (N, 3) в порядке колонок кеша облаков:
+    готовый cartesian.f32 через memory-map, либо расчёт на лету
+    (если артефакта нет или он устарел относительно кеша облаков).
+    """
+    phi, theta, r = cloud_store.load(experiment_id, source)
+    path = cartesian_path(experiment_id, source)
+    if path.exists() and path.stat().st_size and path.stat().st_size == len(r) * 12:
+        return np.memmap(path, dtype="<f4", mode="r").reshape(-1, 3)
+    return spherical_to_cartesian(phi, r, theta)
+
+
+def artifact_to_dict(artifact) -> dict:
+    """Сводка эксперимента для API"""
+    result = {
+        "status": artifact.status,
+        "message": artifact.message,
+        "points_count": artifact.points_count,
+        "preview_count": artifact.preview_count,
+        "bbox": None,
+        "layers": artifact.layers or [],
+    }
+    if artifact.status == "ready":
+        result["bbox"] = {
+            "min": [artifact.min_x, artifact.min_y, artifact.min_z],
+            "max": [artifact.max_x, artifact.max_y, artifact.max_z],
+        }
+    return result
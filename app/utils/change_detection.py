@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.crud.registration import get_registration
+from app.utils.cloud_store import cloud_store
+from app.utils.geometry import from_survey_axes
+from app.utils.registration import apply_transform
+from app.utils.spatial_index import spatial_indexes
+
+# Сколько точек отдаём в один запрос к KD-дереву
+QUERY_CHUNK = 500_000
+
+# Границы интервалов гистограммы расстояний, доли max_distance
+HISTOGRAM_BINS = 20
+
+# Опорные цвета шкалы: синий (без изменений) -> зелёный -> жёлтый -> красный
+COLORMAP = np.array([
+    [0, 0, 255],
+    [0, 200, 0],
+    [255, 220, 0],
+    [255, 0, 0],
+], dtype=np.float64)
+
+
+def _fingerprint(experiment_id: int, source: str) -> str:
+    _, header = cloud_store.ensure_header(experiment_id, source)
+    return f"{source}:{experiment_id}:{header['count']}:{header['max_id']}"
+
+
+def _registration(experiment_id: int, source: str, reference: tuple[int, str]):
+    registration = get_registration(experiment_id, source, *reference)
+    if registration is None:
+        raise LookupError(f"Эксперимент {source}:{experiment_id} не совмещён с опорным")
+    return registration
+
+
+def diff_path(experiment: tuple[int, str], reference: tuple[int, str], max_distance: float) -> Path:
+    """
+    Расстояния от точек эксперимента до опорного облака (float32 по точкам кеша облаков).
+    Имя — хеш пары, версий облаков, совмещения и max_distance.
+    """
+    registration = _registration(*experiment, reference)
+    parts = [
+        _fingerprint(*experiment), _fingerprint(*reference),
+        registration.updated_dt.isoformat(), f"{max_distance}",
+    ]
+    key = hashlib.sha1("|".join(parts).encode()).hexdigest()
+    return settings.ARTIFACTS_DIR / "diff" / f"{key}.f32"
+
+
+def cloud_distances(points: np.ndarray, tree, max_distance: float) -> np.ndarray:
+    """
+    Расстояние от каждой точки до ближайшей точки дерева (cloud-to-cloud), м.
+    Запросы идут частями по QUERY_CHUNK точек, внутри части — на всех ядрах.
+    Точки без соседа ближе max_distance получают inf.
+    """
+    distances = np.empty(len(points), dtype=np.float32)
+    for start in range(0, len(points), QUERY_CHUNK):
+        part, _ = tree.query(
+            points[start:start + QUERY_CHUNK], distance_upper_bound=max_distance, workers=-1,
+        )
+        distances[start:start + QUERY_CHUNK] = part
+    return distances
+
+
+def distance_stats(distances: np.ndarray, threshold: float, max_distance: float) -> dict:
+    """Сводка по расстояниям: среднее, медиана, перцентили, доля изменённых и гистограмма"""
+    found = distances[np.isfinite(distances)]
+    count = len(distances)
+    stats = {
+        "count": count,
+        "matched": len(found),
+        "changed": int(count - np.count_nonzero(distances <= threshold)),
+        "changed_ratio": round(float(np.mean(~(distances <= threshold))), 6) if count else 0.0,
+        "mean": None, "median": None, "p95": None, "max": None, "rmse": None,
+        "histogram": {"edges": [], "counts": []},
+    }
+    if len(found):
+        stats.update({
+            "mean": round(float(found.mean()), 5),
+            "median": round(float(np.median(found)), 5),
+            "p95": round(float(np.percentile(found, 95)), 5),
+            "max": round(float(found.max()), 5),
+            "rmse": round(float(np.sqrt(np.mean(found.astype(np.float64) ** 2))), 5),
+        })
+    counts, edges = np.histogram(found, bins=HISTOGRAM_BINS, range=(0.0, max_distance))
+    stats["histogram"] = {"edges": np.round(edges, 5).tolist(), "counts": counts.tolist()}
+    return stats
+
+
+def compare_experiments(
+    experiment: tuple[int, str],
+    reference: tuple[int, str],
+    max_distance: float,
+    threshold: float,
+):
+    """
+    Сравнение эксперимента с опорным, с которым он совмещён. В обе стороны
+    используются готовые KD-деревья экспериментов: точки эксперимента
+    переводятся в систему опорного, точки опорного — обратным преобразованием
+    в систему эксперимента. Возвращает (расстояния по точкам эксперимента, сводка).
+    """
+    path = diff_path(experiment, reference, max_distance)
+    # Расстояния от точек опорного облака до эксперимента: пропавшее считаем по порогу запроса
+    back_path = path.with_suffix(".back.f32")
+    if path.exists() and back_path.exists():
+        distances = np.fromfile(path, dtype="<f4")
+        back = np.fromfile(back_path, dtype="<f4")
+    else:
+        transform = np.asarray(_registration(*experiment, reference).transform)
+        moving = spatial_indexes.get(*experiment)
+        fixed = spatial_indexes.get(*reference)
+
+        distances = cloud_distances(apply_transform(moving.xyz, transform), fixed.tree, max_distance)
+        back = cloud_distances(apply_transform(fixed.xyz, np.linalg.inv(transform)), moving.tree, max_distance)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        for target, values in ((back_path, back), (path, distances)):
+            values.astype("<f4").tofile(target.with_suffix(target.suffix + suffix))
+            target.with_suffix(target.suffix + suffix).replace(target)
+
+    reverse = {
+        "count": len(back),
+        "missing": int(len(back) - np.count_nonzero(back <= threshold)),
+    }
+    stats = distance_stats(distances, threshold, max_distance)
+    stats["threshold"] = threshold
+    stats["max_distance"] = max_distance
+    stats["disappeared"] = reverse
+    return distances, stats
+
+
+def distance_colors(distances: np.ndarray, color_max: float) -> np.ndarray:
+    """Цвета точек по расстоянию: шкала COLORMAP на [0, color_max], дальше — красный; uint8 (N, 3)"""
+    with np.errstate(invalid="ignore"):
+        t = np.clip(np.nan_to_num(distances, posinf=color_max) / color_max, 0.0, 1.0)
+    position = t * (len(COLORMAP) - 1)
+    low = np.minimum(position.astype(np.int64), len(COLORMAP) - 2)
+    weight = (position - low)[:, None]
+    colors = COLORMAP[low] * (1 - weight) + COLORMAP[low + 1] * weight
+    return np.round(colors).astype(np.uint8)
+
+
+def difference_cloud(experiment: tuple[int, str], reference: tuple[int, str], distances: np.ndarray,
+                     color_max: float) -> bytes:
+    """
+    Облако разности в системе опорного эксперимента: float32 x, y, z (оси вьювера)
+    для всех точек, затем uint8 r, g, b для всех точек
+    """
+    transform = np.asarray(_registration(*experiment, reference).transform)
+    xyz = from_survey_axes(apply_transform(spatial_indexes.get(*experiment).xyz, transform))
+    return (
+        np.ascontiguousarray(xyz, dtype="<f4").tobytes()
+        + distance_colors(distances, color_max).tobytes()
+    )
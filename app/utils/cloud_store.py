@@ -0,0 +1,206 @@
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+from app.crud.measurement import get_measurement_arrays, get_measurements_fingerprint
+from app.utils.geometry import layer_runs
+
+# Формат файла облака (.lpc):
+#   заголовок 64 байта: magic, версия, размер заголовка, число точек,
+#   max(id) измерений эксперимента на момент записи, время записи, число серий слоёв;
+#   далее колонки float32 little-endian подряд: phi[N], theta[N], r[N];
+#   в конце таблица слоёв LAYER_DTYPE[L] — серии подряд идущих точек одного theta
+#   (у облаков, загруженных слоями подряд, серия на слой одна)
+MAGIC = b"LPCLOUD\0"
+VERSION = 2
+HEADER_FORMAT = "<8sIIQqdQ"
+HEADER_SIZE = 64
+COLUMNS = ("phi", "theta", "r")
+LAYER_DTYPE = np.dtype([
+    ("theta", "<f4"), ("start", "<i8"), ("count", "<i8"),
+    ("r_min", "<f4"), ("r_max", "<f4"), ("r_mean", "<f4"),
+])
+
+
+def rounded(values, decimals: int = 4) -> list:
+    """
+    Значения колонки кеша (float32) для JSON: округление в float64, иначе
+    1234.5678 превращается в 1234.5677490234375
+    """
+    return np.round(np.asarray(values, dtype=np.float64), decimals).tolist()
+
+
+def source_key(source: str) -> str:
+    """Источник эксперимента из query-параметра: всё, кроме chd, — локальная БД"""
+    return "chd" if source == "chd" else "local"
+
+
+class CloudStore:
+    """
+    Локальный кеш облаков точек в scans/cache: по файлу на эксперимент,
+    чтение через memory-map. Размер кеша ограничен, вытесняются давно не
+    использованные файлы. При каждом обращении файл сверяется с БД
+    по количеству измерений и max(id).
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[Path, int] | None = None
+
+    def path(self, experiment_id: int, source: str) -> Path:
+        return self.root / f"{source}_{experiment_id}.lpc"
+
+    def _index(self) -> OrderedDict:
+        # Порядок LRU восстанавливаем по mtime: при каждом обращении он обновляется
+        if self._lru is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.root.glob("*.lpc"), key=lambda p: p.stat().st_mtime)
+            self._lru = OrderedDict((p, p.stat().st_size) for p in files)
+        return self._lru
+
+    def _touch(self, path: Path):
+        with self._lock:
+            index = self._index()
+            if path in index:
+                index.move_to_end(path)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _register(self, path: Path):
+        with self._lock:
+            index = self._index()
+            index[path] = path.stat().st_size
+            index.move_to_end(path)
+            total = sum(index.values())
+            while total > self.max_bytes and len(index) > 1:
+                old_path, size = index.popitem(last=False)
+                old_path.unlink(missing_ok=True)
+                total -= size
+
+    def _forget(self, path: Path):
+        with self._lock:
+            self._index().pop(path, None)
+        path.unlink(missing_ok=True)
+
+    @staticmethod
+    def read_header(path: Path) -> dict | None:
+        try:
+            with open(path, "rb") as f:
+                raw = f.read(HEADER_SIZE)
+                # Размер по открытому файлу: его могут вытеснить или заменить сразу после open
+                size = os.fstat(f.fileno()).st_size
+        except OSError:
+            return None
+        if len(raw) < HEADER_SIZE:
+            return None
+        magic, version, header_size, count, max_id, created, layers = struct.unpack_from(HEADER_FORMAT, raw)
+        if magic != MAGIC or version != VERSION or header_size != HEADER_SIZE:
+            return None
+        if size != HEADER_SIZE + count * 4 * len(COLUMNS) + layers * LAYER_DTYPE.itemsize:
+            return None
+        return {"count": count, "max_id": max_id, "created": created, "layers": layers}
+
+    def write(self, experiment_id: int, source: str, phi, theta, r, max_id: int) -> Path:
+        path = self.path(experiment_id, source)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        count = len(phi)
+        columns = [np.asarray(column, dtype="<f4") for column in (phi, theta, r)]
+        table = layer_table(columns[1], columns[2])
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, HEADER_SIZE, count, max_id, time.time(), len(table))
+        with open(tmp, "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\0"))
+            for column in columns:
+                column.tofile(f)
+            table.tofile(f)
+        tmp.replace(path)
+        self._register(path)
+        return path
+
+    def is_valid(self, experiment_id: int, source: str) -> bool:
+        """Файл есть, формат корректен и совпадает с БД по count / max(id)"""
+        header = self.read_header(self.path(experiment_id, source))
+        if header is None:
+            return False
+        count, max_id = get_measurements_fingerprint(experiment_id, source)
+        return header["count"] == count and header["max_id"] == max_id
+
+    def ensure(self, experiment_id: int, source: str) -> Path:
+        """Путь к актуальному файлу облака; при расхождении с БД файл пересобирается"""
+        path = self.path(experiment_id, source)
+        if self.is_valid(experiment_id, source):
+            self._touch(path)
+            return path
+
+        self._forget(path)
+        _, max_id = get_measurements_fingerprint(experiment_id, source)
+        phi, theta, r = get_measurement_arrays(experiment_id, source)
+        return self.write(experiment_id, source, phi, theta, r, max_id)
+
+    def ensure_header(self, experiment_id: int, source: str) -> tuple[Path, dict]:
+        """ensure и заголовок файла; если файл успели вытеснить или пересобрать — ещё раз"""
+        for _ in range(3):
+            path = self.ensure(experiment_id, source)
+            header = self.read_header(path)
+            if header is not None:
+                return path, header
+        raise OSError(f"Не удалось прочитать кеш облака {path.name}")
+
+    def load(self, experiment_id: int, source: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Колонки phi, theta, r как memory-map (без копирования в память процесса)"""
+        path, header = self.ensure_header(experiment_id, source)
+        count = header["count"]
+        if count == 0:
+            empty = np.empty(0, dtype="<f4")
+            return empty, empty, empty
+        data = np.memmap(path, dtype="<f4", mode="r", offset=HEADER_SIZE, shape=(len(COLUMNS), count))
+        return data[0], data[1], data[2]
+
+    def layers(self, experiment_id: int, source: str) -> np.ndarray:
+        """Таблица слоёв облака (LAYER_DTYPE) — без чтения самих точек"""
+        path, header = self.ensure_header(experiment_id, source)
+        if header["layers"] == 0:
+            return np.empty(0, dtype=LAYER_DTYPE)
+        offset = HEADER_SIZE + header["count"] * 4 * len(COLUMNS)
+        return np.fromfile(path, dtype=LAYER_DTYPE, count=header["layers"], offset=offset)
+
+
+def layer_table(theta, r) -> np.ndarray:
+    """Серии слоёв облака в порядке колонок со статистикой r по серии"""
+    values, starts, counts = layer_runs(theta)
+    table = np.empty(len(starts), dtype=LAYER_DTYPE)
+    table["theta"], table["start"], table["count"] = values, starts, counts
+    if len(starts):
+        r = np.asarray(r, dtype=np.float64)
+        table["r_min"] = np.minimum.reduceat(r, starts)
+        table["r_max"] = np.maximum.reduceat(r, starts)
+        table["r_mean"] = np.add.reduceat(r, starts) / counts
+    return table
+
+
+def layer_slice(table: np.ndarray, theta_min: float | None = None, theta_max: float | None = None) -> slice | None:
+    """
+    Диапазон слоёв theta_min..theta_max как срез колонок облака — если облако
+    хранится слоями подряд по возрастанию theta; иначе None (выбирать маской).
+    """
+    theta = table["theta"]
+    if len(theta) > 1 and not bool(np.all(theta[1:] > theta[:-1])):
+        return None
+    low = 0 if theta_min is None else int(np.searchsorted(theta, np.float32(theta_min), side="left"))
+    high = len(theta) if theta_max is None else int(np.searchsorted(theta, np.float32(theta_max), side="right"))
+    if low >= high:
+        return slice(0, 0)
+    return slice(int(table["start"][low]), int(table["start"][high - 1] + table["count"][high - 1]))
+
+
+cloud_store = CloudStore(Path(settings.SCANS_DIR) / "cache", settings.CLOUD_CACHE_MAX_BYTES)
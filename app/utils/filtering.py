@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.schemas.filter import FilterParams
+from app.utils.artifacts import artifact_dir
+from app.utils.cloud_store import cloud_store
+from app.utils.geometry import spherical_to_cartesian
+
+# Сколько точек отдаём в один запрос к KD-дереву (k соседей на точку занимают память)
+QUERY_CHUNK = 500_000
+
+# Порядок этапов: сначала дешёвые по измерениям, потом по соседям
+STAGES = ("range", "motion", "sor", "ror")
+
+
+def filter_path(experiment_id: int, source: str, params: FilterParams) -> Path:
+    """
+    Индексы оставшихся точек (uint32, по возрастанию). Имя — хеш параметров и версии
+    облака, поэтому при изменении облака результат считается заново.
+    """
+    _, header = cloud_store.ensure_header(experiment_id, source)
+    key = f"{params.cache_key()}|{header['count']}:{header['max_id']}"
+    return artifact_dir(experiment_id, source) / "filtered" / f"{hashlib.sha1(key.encode()).hexdigest()}.u32"
+
+
+def range_mask(r: np.ndarray, range_min: float | None, range_max: float | None) -> np.ndarray:
+    """Отсечение по дальности, мм; нулевые дальности (нет отражения) отбрасываются всегда"""
+    keep = r > 0
+    if range_min is not None:
+        keep &= r >= range_min
+    if range_max is not None:
+        keep &= r <= range_max
+    return keep
+
+
+def motion_mask(phi, theta, r, threshold: float, phi_step: float) -> np.ndarray:
+    """
+    Артефакты движения между слоями. Средняя дальность в секторе phi считается
+    по каждому слою theta; точка отбрасывается, если её дальность отличается
+    больше чем на threshold от обоих соседних слоёв, а сами соседние слои
+    между собой согласуются. Так уходят люди, прошедшие перед сканером за
+    один оборот, и одиночные «летающие» измерения на кромках.
+    """
+    layers = np.unique(theta)
+    keep = np.ones(len(r), dtype=bool)
+    if len(layers) < 3:
+        return keep
+
+    bins = int(round(360.0 / phi_step))
+    layer = np.searchsorted(layers, theta).astype(np.int64)
+    sector = np.floor(np.mod(phi, 360.0) / phi_step).astype(np.int64) % bins
+
+    # Средние по занятым ячейкам (слой, сектор); сетку целиком не строим —
+    # при непрерывном theta слоёв может быть столько же, сколько точек
+    cells, inverse, counts = np.unique(layer * bins + sector, return_inverse=True, return_counts=True)
+    mean = np.bincount(inverse, weights=r) / counts
+
+    def neighbor_mean(rows, shift):
+        key = (layer[rows] + shift) * bins + sector[rows]
+        pos = np.minimum(np.searchsorted(cells, key), len(cells) - 1)
+        return np.where(cells[pos] == key, mean[pos], np.nan)
+
+    rows = np.flatnonzero((layer > 0) & (layer < len(layers) - 1))
+    before = neighbor_mean(rows, -1)
+    after = neighbor_mean(rows, 1)
+    value = r[rows]
+    with np.errstate(invalid="ignore"):
+        artifact = (
+            (np.abs(value - before) > threshold)
+            & (np.abs(value - after) > threshold)
+            & (np.abs(before - after) <= threshold)
+        )
+    keep[rows[artifact]] = False
+    return keep
+
+
+def _tree(xyz: np.ndarray) -> cKDTree:
+    return cKDTree(xyz, leafsize=32, balanced_tree=False, compact_nodes=False)
+
+
+def sor_mask(xyz: np.ndarray, tree: cKDTree, neighbors: int, std_ratio: float) -> np.ndarray:
+    """
+    Статистический фильтр: среднее расстояние до k соседей не больше
+    mean + std_ratio * std по всему облаку
+    """
+    k = min(neighbors + 1, len(xyz))
+    mean_distance = np.empty(len(xyz))
+    for start in range(0, len(xyz), QUERY_CHUNK):
+        distances, _ = tree.query(xyz[start:start + QUERY_CHUNK], k=k, workers=-1)
+        # Первый сосед — сама точка
+        mean_distance[start:start + QUERY_CHUNK] = distances[:, 1:].mean(axis=1)
+    limit = mean_distance.mean() + std_ratio * mean_distance.std()
+    return mean_distance <= limit
+
+
+def ror_mask(xyz: np.ndarray, tree: cKDTree, radius: float, min_neighbors: int) -> np.ndarray:
+    """Фильтр по радиусу: в шаре radius не меньше min_neighbors других точек"""
+    counts = np.empty(len(xyz), dtype=np.int64)
+    for start in range(0, len(xyz), QUERY_CHUNK):
+        counts[start:start + QUERY_CHUNK] = tree.query_ball_point(
+            xyz[start:start + QUERY_CHUNK], radius, return_length=True, workers=-1,
+        )
+    return counts - 1 >= min_neighbors
+
+
+def run_filters(phi, theta, r, params: FilterParams, check=None):
+    """
+    Этапы фильтрации по порядку STAGES, каждый — по точкам, оставшимся после
+    предыдущих. check вызывается между этапами (отмена задачи).
+    Возвращает (индексы оставшихся точек, число удалённых по этапам).
+    """
+    check = check or (lambda: None)
+    idx = np.arange(len(r), dtype=np.int64)
+    removed = dict.fromkeys(STAGES, 0)
+
+    def apply(stage: str, keep: np.ndarray):
+        nonlocal idx
+        removed[stage] = int(len(keep) - np.count_nonzero(keep))
+        idx = idx[keep]
+        check()
+
+    apply("range", range_mask(r, params.range_min, params.range_max))
+    if params.motion_threshold is not None:
+        apply("motion", motion_mask(
+            phi[idx], theta[idx], r[idx], params.motion_threshold, params.motion_phi_step,
+        ))
+    if params.sor_neighbors is not None and len(idx):
+        xyz = spherical_to_cartesian(phi[idx], r[idx], theta[idx]).astype(np.float64)
+        apply("sor", sor_mask(xyz, _tree(xyz), params.sor_neighbors, params.sor_std_ratio))
+    if params.ror_radius is not None and len(idx):
+        xyz = spherical_to_cartesian(phi[idx], r[idx], theta[idx]).astype(np.float64)
+        apply("ror", ror_mask(xyz, _tree(xyz), params.ror_radius, params.ror_min_neighbors))
+    return idx, removed
+
+
+def read_filtered(path: Path):
+    """Кешированный результат: (индексы, сводка) или None, если его нет"""
+    stats_path = path.with_suffix(".json")
+    if not (path.exists() and stats_path.exists()):
+        return None
+    return np.fromfile(path, dtype="<u4"), json.loads(stats_path.read_text(encoding="utf-8"))
+
+
+def write_filtered(path: Path, idx: np.ndarray, stats: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    stats_path = path.with_suffix(".json")
+    idx.astype("<u4").tofile(path.with_suffix(suffix))
+    stats_path.with_suffix(".json" + suffix).write_text(json.dumps(stats), encoding="utf-8")
+    # Сводку пишем последней: по ней проверяется, что индексы готовы
+    path.with_suffix(suffix).replace(path)
+    stats_path.with_suffix(".json" + suffix).replace(stats_path)
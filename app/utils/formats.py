@@ -0,0 +1,324 @@
+import mmap
+import struct
+from datetime import date
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+
+from app.utils.geometry import spherical_to_cartesian, cartesian_to_spherical, to_survey_axes, from_survey_axes
+from app.utils.scan_parser import decompress, parse_scan_text
+
+# Сколько точек конвертируем и отдаём за один шаг потоковой выгрузки
+EXPORT_CHUNK_POINTS = 500_000
+
+IMPORT_FORMATS = ("txt", "ply", "pcd", "las")
+
+EXPORT_FORMATS = {
+    "ply": ("application/octet-stream", "ply"),
+    "pcd": ("application/octet-stream", "pcd"),
+    "las": ("application/vnd.las", "las"),
+}
+
+# Помимо x, y, z (м, Z вверх) в PLY и PCD сохраняем исходные измерения,
+# чтобы файл можно было загрузить обратно без потерь
+_FIELDS = ("x", "y", "z", "phi", "theta", "r")
+_RECORD = np.dtype([(name, "<f4") for name in _FIELDS])
+
+# LAS 1.2, формат точек 0 (20 байт на точку)
+LAS_HEADER_SIZE = 227
+LAS_SCALE = 0.0001
+_LAS_RECORD = np.dtype([
+    ("x", "<i4"), ("y", "<i4"), ("z", "<i4"),
+    ("intensity", "<u2"), ("flags", "u1"), ("classification", "u1"),
+    ("scan_angle", "i1"), ("user_data", "u1"), ("point_source_id", "<u2"),
+])
+
+
+def iter_survey_chunks(phi, theta, r, chunk_points: int = EXPORT_CHUNK_POINTS):
+    """Куски облака: (срез, декартовы координаты в осях отчёта), без расчёта всего облака сразу"""
+    for start in range(0, len(r), chunk_points):
+        sl = slice(start, start + chunk_points)
+        yield sl, to_survey_axes(spherical_to_cartesian(phi[sl], r[sl], theta[sl]))
+
+
+def _records(phi, theta, r, sl, xyz) -> bytes:
+    rec = np.empty(len(xyz), dtype=_RECORD)
+    rec["x"], rec["y"], rec["z"] = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+    rec["phi"], rec["theta"], rec["r"] = phi[sl], theta[sl], r[sl]
+    return rec.tobytes()
+
+
+def ply_header(count: int) -> bytes:
+    lines = [
+        "ply",
+        "format binary_little_endian 1.0",
+        "comment LidarPointCloudService export, x/y/z in meters, phi/theta in degrees, r in mm",
+        f"element vertex {count}",
+        *(f"property float {name}" for name in _FIELDS),
+        "end_header",
+    ]
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def pcd_header(count: int) -> bytes:
+    n = len(_FIELDS)
+    lines = [
+        "# .PCD v0.7 - Point Cloud Data file format",
+        "VERSION 0.7",
+        "FIELDS " + " ".join(_FIELDS),
+        "SIZE " + " ".join(["4"] * n),
+        "TYPE " + " ".join(["F"] * n),
+        "COUNT " + " ".join(["1"] * n),
+        f"WIDTH {count}",
+        "HEIGHT 1",
+        "VIEWPOINT 0 0 0 1 0 0 0",
+        f"POINTS {count}",
+        "DATA binary",
+    ]
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def las_header(count: int, bbox_min, bbox_max) -> bytes:
+    today = date.today()
+    return struct.pack(
+        "<4sHH16sBB32s32sHHHIIBHI5I3d3d6d",
+        b"LASF", 0, 0, b"\0" * 16, 1, 2,
+        b"LidarPointCloudService", b"LidarPointCloudService export",
+        today.timetuple().tm_yday, today.year,
+        LAS_HEADER_SIZE, LAS_HEADER_SIZE, 0,
+        0, _LAS_RECORD.itemsize, count,
+        count, 0, 0, 0, 0,
+        LAS_SCALE, LAS_SCALE, LAS_SCALE,
+        *bbox_min,
+        bbox_max[0], bbox_min[0], bbox_max[1], bbox_min[1], bbox_max[2], bbox_min[2],
+    )
+
+
+def _las_bounds(phi, theta, r):
+    # Заголовок LAS требует границ облака до записи точек — отдельный проход по кускам
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    for _, xyz in iter_survey_chunks(phi, theta, r):
+        low = np.minimum(low, xyz.min(axis=0))
+        high = np.maximum(high, xyz.max(axis=0))
+    if len(r) == 0:
+        low = high = np.zeros(3)
+    return [float(v) for v in low], [float(v) for v in high]
+
+
+def iter_export(fmt: str, phi, theta, r):
+    """
+    Потоковая выгрузка облака в PLY / PCD / LAS: заголовок, затем точки кусками.
+    phi, theta, r могут быть memory-map — в памяти одновременно только один кусок.
+    """
+    count = len(r)
+    if fmt == "ply":
+        yield ply_header(count)
+    elif fmt == "pcd":
+        yield pcd_header(count)
+    elif fmt == "las":
+        bbox_min, bbox_max = _las_bounds(phi, theta, r)
+        yield las_header(count, bbox_min, bbox_max)
+    else:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    for sl, xyz in iter_survey_chunks(phi, theta, r):
+        if fmt == "las":
+            rec = np.zeros(len(xyz), dtype=_LAS_RECORD)
+            scaled = np.round((xyz - np.asarray(bbox_min)) / LAS_SCALE).astype(np.int32)
+            rec["x"], rec["y"], rec["z"] = scaled[:, 0], scaled[:, 1], scaled[:, 2]
+            rec["flags"] = 0b00001001  # return 1 из 1
+            yield rec.tobytes()
+        else:
+            yield _records(phi, theta, r, sl, xyz)
+
+
+def export_size(fmt: str, count: int) -> int:
+    """Размер файла выгрузки в байтах (для Content-Length)"""
+    if fmt == "ply":
+        return len(ply_header(count)) + count * _RECORD.itemsize
+    if fmt == "pcd":
+        return len(pcd_header(count)) + count * _RECORD.itemsize
+    return LAS_HEADER_SIZE + count * _LAS_RECORD.itemsize
+
+
+# ---------- Чтение ----------
+
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+
+
+def detect_format(filename: str, data: bytes) -> str:
+    """Формат файла по сигнатуре, затем по расширению"""
+    head = data[:64]
+    if head.startswith(b"ply"):
+        return "ply"
+    if head.startswith(b"LASF"):
+        return "las"
+    if head.lstrip().startswith((b"# .PCD", b"VERSION", b"FIELDS")):
+        return "pcd"
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    if extension in IMPORT_FORMATS:
+        return extension
+    raise ValueError(f"Неподдерживаемый формат файла: {filename}")
+
+
+def _split_header(data: bytes, end_marker: bytes) -> tuple[list[str], int]:
+    end = data.find(end_marker)
+    if end == -1:
+        raise ValueError("Не найден конец заголовка")
+    body_start = data.find(b"\n", end) + 1
+    if not body_start:
+        raise ValueError("Не найден конец заголовка")
+    lines = data[:body_start].decode("ascii", errors="replace").splitlines()
+    return [line.strip() for line in lines if line.strip()], body_start
+
+
+def _columns_to_measurements(columns: dict) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Исходные измерения, если они есть в файле, иначе пересчёт из x, y, z (оси отчёта, м)"""
+    if all(name in columns for name in ("phi", "theta", "r")):
+        return (
+            np.asarray(columns["phi"], dtype=np.float64),
+            np.asarray(columns["theta"], dtype=np.float64),
+            np.asarray(columns["r"], dtype=np.float64),
+        )
+    if not all(name in columns for name in ("x", "y", "z")):
+        raise ValueError("В файле нет координат x, y, z")
+    survey = np.column_stack([columns["x"], columns["y"], columns["z"]]).astype(np.float64)
+    phi, r, theta = cartesian_to_spherical(from_survey_axes(survey))
+    return phi, theta, r
+
+
+def read_scan_txt(data: bytes):
+    """Сырой файл сканера: строки 'phi;r;theta'"""
+    return parse_scan_text(data)
+
+
+def read_ply(data: bytes):
+    lines, body_start = _split_header(data, b"end_header")
+    if lines[0] != "ply":
+        raise ValueError("Неверный заголовок PLY")
+
+    encoding = None
+    elements = []  # [(name, count, [(prop, dtype)])]
+    for line in lines[1:]:
+        parts = line.split()
+        if parts[0] == "format":
+            encoding = parts[1]
+        elif parts[0] == "element":
+            elements.append((parts[1], int(parts[2]), []))
+        elif parts[0] == "property":
+            if parts[1] == "list":
+                raise ValueError("Списковые свойства PLY не поддерживаются")
+            elements[-1][2].append((parts[2], _PLY_TYPES[parts[1]]))
+
+    offset = body_start
+    for name, count, props in elements:
+        if encoding == "ascii":
+            if name != "vertex":
+                raise ValueError("В ASCII PLY вершины должны идти первым элементом")
+            text = data[offset:].split(b"\n", count)[:count]
+            values = np.array(b" ".join(text).split(), dtype=np.float64).reshape(count, len(props))
+            return _columns_to_measurements({p: values[:, i] for i, (p, _) in enumerate(props)})
+
+        byte_order = "<" if encoding == "binary_little_endian" else ">"
+        dtype = np.dtype([(p, byte_order + t) for p, t in props])
+        if name == "vertex":
+            vertices = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            return _columns_to_measurements({p: vertices[p] for p in dtype.names})
+        offset += dtype.itemsize * count
+
+    raise ValueError("В PLY нет элемента vertex")
+
+
+def read_pcd(data: bytes):
+    lines, body_start = _split_header(data, b"DATA")
+    header = {}
+    for line in lines:
+        if line.startswith("#"):
+            continue
+        key, *values = line.split()
+        header[key.upper()] = values
+
+    fields = header["FIELDS"]
+    sizes = [int(v) for v in header["SIZE"]]
+    types = header["TYPE"]
+    counts = [int(v) for v in header.get("COUNT", ["1"] * len(fields))]
+    points = int(header["POINTS"][0])
+    mode = header["DATA"][0]
+
+    if mode == "ascii":
+        rows = data[body_start:].split(b"\n", points)[:points]
+        values = np.array(b" ".join(rows).split(), dtype=np.float64).reshape(points, sum(counts))
+        starts = np.cumsum([0] + counts[:-1])
+        return _columns_to_measurements({f: values[:, s] for f, s in zip(fields, starts)})
+    if mode != "binary":
+        raise ValueError(f"Режим PCD '{mode}' не поддерживается")
+
+    kinds = {"F": "f", "I": "i", "U": "u"}
+    dtype = np.dtype([
+        (f, "<" + kinds[t] + str(size), (count,)) if count > 1 else (f, "<" + kinds[t] + str(size))
+        for f, size, t, count in zip(fields, sizes, types, counts)
+    ])
+    rows = np.frombuffer(data, dtype=dtype, count=points, offset=body_start)
+    return _columns_to_measurements({f: rows[f] for f in fields if rows[f].ndim == 1})
+
+
+def read_las(data: bytes):
+    if data[:4] != b"LASF":
+        raise ValueError("Неверная сигнатура LAS")
+    minor = data[25]
+    point_offset, = struct.unpack_from("<I", data, 96)
+    point_format = data[104]
+    record_length, legacy_count = struct.unpack_from("<HI", data, 105)
+    scale = np.array(struct.unpack_from("<3d", data, 131))
+    shift = np.array(struct.unpack_from("<3d", data, 155))
+    count = legacy_count
+    if minor >= 4 and count == 0:
+        count, = struct.unpack_from("<Q", data, 247)
+    if point_format & 0x80:
+        raise ValueError("Сжатые LAZ-файлы не поддерживаются")
+
+    # Координаты — первые 12 байт каждой записи, остальные поля пропускаем
+    dtype = np.dtype({"names": ["x", "y", "z"], "formats": ["<i4"] * 3,
+                      "offsets": [0, 4, 8], "itemsize": record_length})
+    rows = np.frombuffer(data, dtype=dtype, count=count, offset=point_offset)
+    return _columns_to_measurements({
+        axis: rows[axis] * scale[i] + shift[i] for i, axis in enumerate(("x", "y", "z"))
+    })
+
+
+READERS = {"txt": read_scan_txt, "ply": read_ply, "pcd": read_pcd, "las": read_las}
+
+
+def _map_file(f) -> mmap.mmap:
+    """Открытый файл отображается в память: читатели разбирают его без копии целиком в RAM"""
+    if not f.seek(0, 2):
+        raise ValueError("Пустой файл")
+    # Отображение живёт, пока на него ссылаются массивы из np.frombuffer
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_point_cloud(filename: str, data: bytes | Path | BinaryIO):
+    """
+    Измерения (phi, theta, r) из файла любого поддерживаемого формата;
+    data — содержимое, путь или открытый файл (например, файл загрузки UploadFile.file)
+    """
+    if isinstance(data, Path):
+        with open(data, "rb") as f:
+            data = _map_file(f)
+    elif hasattr(data, "fileno"):
+        data = _map_file(data)
+    data = decompress(data)
+    if filename.lower().endswith(".gz"):
+        filename = filename[:-3]
+    fmt = detect_format(filename, data)
+    try:
+        return READERS[fmt](data)
+    except (KeyError, IndexError, struct.error) as e:
+        raise ValueError(f"Повреждённый файл {fmt.upper()}: {e}")
@@ -0,0 +1,158 @@
+import numpy as np
+
+# Геометрия установки: ноль двигателя смещён на 120°, ось вращения
+# отстоит от центра лидара на 100 мм (см. static/js/cloud_worker.js)
+THETA_ZERO_DEG = 120.0
+SENSOR_OFFSET_MM = 100.0
+
+
+def spherical_to_cartesian(phi, r, theta) -> np.ndarray:
+    """
+    Векторный перевод измерений (phi, r, theta) в декартовы координаты.
+    Оси совпадают с осями Three.js во вьювере, результат в метрах, (N, 3) float32.
+    """
+    phi_rad = np.radians(np.asarray(phi, dtype=np.float64))
+    alpha = np.radians(THETA_ZERO_DEG - np.asarray(theta, dtype=np.float64))
+    r = np.asarray(r, dtype=np.float64)
+
+    r_cos = r * np.cos(phi_rad)
+    sin_a = np.sin(alpha)
+    cos_a = np.cos(alpha)
+
+    xyz = np.empty((r.shape[0], 3), dtype=np.float32)
+    xyz[:, 0] = r * np.sin(phi_rad) / 1000.0
+    xyz[:, 1] = (-r_cos * sin_a - SENSOR_OFFSET_MM * cos_a) / 1000.0
+    xyz[:, 2] = -(r_cos * cos_a - SENSOR_OFFSET_MM * sin_a) / 1000.0
+    return xyz
+
+
+def cartesian_to_spherical(xyz: np.ndarray):
+    """
+    Обратное к spherical_to_cartesian: (N, 3) в метрах (оси вьювера) -> phi, r, theta.
+    Для каждой точки есть два положения двигателя; выбираем то, что попадает
+    в рабочий диапазон 0..240°, иначе первое. Точки ближе 100 мм к оси
+    вращения проецируются на цилиндр смещения.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64) * 1000.0
+    x, y, z = xyz[:, 0], xyz[:, 1], xyz[:, 2]
+
+    # -y*cos(a) + z*sin(a) = offset  =>  a = gamma +- arccos(offset / rho)
+    rho = np.hypot(y, z)
+    gamma = np.arctan2(z, -y)
+    delta = np.arccos(np.clip(SENSOR_OFFSET_MM / np.maximum(rho, 1e-9), -1.0, 1.0))
+
+    theta_plus = (THETA_ZERO_DEG - np.degrees(gamma + delta)) % 360
+    theta_minus = (THETA_ZERO_DEG - np.degrees(gamma - delta)) % 360
+    use_minus = (theta_plus > 240) & (theta_minus <= 240)
+    theta = np.where(use_minus, theta_minus, theta_plus)
+    alpha = np.radians(THETA_ZERO_DEG - theta)
+
+    u = -y * np.sin(alpha) - z * np.cos(alpha)
+    r = np.hypot(x, u)
+    phi = np.degrees(np.arctan2(x, u)) % 360
+    return phi, r, theta
+
+
+def to_survey_axes(xyz: np.ndarray) -> np.ndarray:
+    """
+    Оси вьювера -> оси отчёта (как в подсказке view_cloud.js, Z вверх):
+    X = Z вьювера, Y = X вьювера, Z = Y вьювера.
+    """
+    return xyz[:, [2, 0, 1]]
+
+
+def from_survey_axes(xyz: np.ndarray) -> np.ndarray:
+    """Обратное к to_survey_axes"""
+    return xyz[:, [1, 2, 0]]
+
+
+def bounding_box(xyz: np.ndarray) -> dict:
+    """Границы облака: {"min": [x, y, z], "max": [x, y, z]}"""
+    if len(xyz) == 0:
+        return {"min": [0.0, 0.0, 0.0], "max": [0.0, 0.0, 0.0]}
+    return {
+        "min": [float(v) for v in xyz.min(axis=0)],
+        "max": [float(v) for v in xyz.max(axis=0)],
+    }
+
+
+def layer_runs(theta):
+    """
+    Серии подряд идущих точек с одинаковым theta: (theta серии, начало, число точек).
+    У облака, записанного слоями подряд, серия на слой одна.
+    """
+    theta = np.asarray(theta)
+    if theta.size == 0:
+        return theta[:0], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(theta[1:] != theta[:-1]) + 1))
+    counts = np.diff(np.append(starts, theta.size))
+    return theta[starts], starts, counts
+
+
+def layer_order(theta) -> np.ndarray | None:
+    """
+    Перестановка, собирающая точки слоёв подряд по возрастанию theta (порядок внутри
+    слоя сохраняется); None — облако уже так упорядочено (файл сканера пишет слоями)
+    """
+    theta = np.asarray(theta)
+    if theta.size < 2 or bool(np.all(theta[1:] >= theta[:-1])):
+        return None
+    return np.argsort(theta, kind="stable")
+
+
+def layer_stats(phi, r, theta) -> list[dict]:
+    """Статистика по слоям (одному углу двигателя theta соответствует один слой)"""
+    theta = np.asarray(theta)
+    if theta.size == 0:
+        return []
+    phi = np.asarray(phi)
+    r = np.asarray(r)
+
+    # Облако, упорядоченное по слоям, не сортируем
+    order = layer_order(theta)
+    if order is not None:
+        theta, r, phi = theta[order], r[order], phi[order]
+    layers, starts, counts = layer_runs(theta)
+
+    r_min = np.minimum.reduceat(r, starts)
+    r_max = np.maximum.reduceat(r, starts)
+    r_sum = np.add.reduceat(r, starts)
+    phi_min = np.minimum.reduceat(phi, starts)
+    phi_max = np.maximum.reduceat(phi, starts)
+
+    return [
+        {
+            "theta": float(layers[i]),
+            "count": int(counts[i]),
+            "r_min": float(r_min[i]),
+            "r_max": float(r_max[i]),
+            "r_mean": float(r_sum[i] / counts[i]),
+            "phi_min": float(phi_min[i]),
+            "phi_max": float(phi_max[i]),
+        }
+        for i in range(len(layers))
+    ]
+
+
+def voxel_keys(xyz: np.ndarray, voxel_size: float) -> np.ndarray:
+    """Один int64-ключ на точку: номера вокселя по трём осям, упакованные по 21 биту"""
+    cells = np.floor((xyz - xyz.min(axis=0)) / voxel_size).astype(np.int64)
+    np.clip(cells, 0, (1 << 21) - 1, out=cells)
+    return (cells[:, 0] << 42) | (cells[:, 1] << 21) | cells[:, 2]
+
+
+def voxel_downsample(xyz: np.ndarray, voxel_size: float, max_points: int | None = None) -> np.ndarray:
+    """
+    Индексы прореженного облака: по одной точке на воксель.
+    Если точек всё равно больше max_points — дополнительно берём каждую k-ю.
+    """
+    if len(xyz) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    idx = np.unique(voxel_keys(xyz, voxel_size), return_index=True)[1]
+    idx.sort()
+
+    if max_points and len(idx) > max_points:
+        step = int(np.ceil(len(idx) / max_points))
+        idx = idx[::step]
+    return idx
@@ -0,0 +1,461 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+
+from app.core.config import settings
+from app.core.metrics import JOB_SECONDS
+from app.crud.artifact import get_artifact, save_artifact
+from app.crud.job import (
+    ACTIVE_STATUSES, create_job, fail_jobs_of, get_active_job_owners, get_job, get_latest_job, update_job,
+)
+from app.schemas.filter import FilterParams
+from app.utils.artifacts import artifact_dir, cartesian_path, write_artifacts
+from app.utils.cloud_store import cloud_store
+from app.utils.filtering import filter_path, read_filtered, run_filters, write_filtered
+from app.utils.formats import EXPORT_FORMATS, iter_export
+from app.utils.geometry import spherical_to_cartesian, voxel_downsample
+from app.utils.meshing import is_mesh_valid, mesh_path, write_mesh
+from app.utils.shared_arrays import attached_arrays, share_arrays
+from app.utils.task_state import OWNER, is_dead_owner
+
+# Как часто опрашиваем БД, ожидая задачу из другого процесса сервера, с
+POLL_INTERVAL = 0.5
+
+# Как часто выгрузка проверяет отмену: раз в столько кусков
+EXPORT_CHECK_EVERY = 16
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobError(RuntimeError):
+    """Задача завершилась ошибкой или была отменена"""
+
+
+def cancel_path(job_id: int) -> Path:
+    """Маркер отмены: виден процессу пула и другим процессам сервера"""
+    return settings.JOBS_DIR / f"{job_id}.cancel"
+
+
+# --- Работа в процессе пула -------------------------------------------------
+# Обработчики получают колонки облака из разделяемой памяти (phi, theta, r),
+# описание задачи и check() для проверки отмены; в БД не обращаются.
+
+def _run_artifacts(cloud: dict, task: dict, check) -> dict:
+    return write_artifacts(task["experiment_id"], task["source"], cloud["phi"], cloud["theta"], cloud["r"])
+
+
+def _run_mesh(cloud: dict, task: dict, check) -> dict:
+    params = task["params"]
+    return write_mesh(
+        Path(task["path"]), cloud["phi"], cloud["theta"], cloud["r"], task["fingerprint"],
+        params["phi_step"], params["max_edge"],
+    )
+
+
+def _run_filter(cloud: dict, task: dict, check) -> dict:
+    idx, removed = run_filters(cloud["phi"], cloud["theta"], cloud["r"], FilterParams(**task["params"]), check)
+    stats = {"total": len(cloud["r"]), "kept": len(idx), "removed": removed}
+    write_filtered(Path(task["path"]), idx, stats)
+    return stats
+
+
+def _run_export(cloud: dict, task: dict, check) -> dict:
+    path = Path(task["path"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            for i, part in enumerate(iter_export(task["params"]["fmt"], cloud["phi"], cloud["theta"], cloud["r"])):
+                f.write(part)
+                if i % EXPORT_CHECK_EVERY == 0:
+                    check()
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return {"points": len(cloud["r"]), "size": path.stat().st_size}
+
+
+def _run_downsample(cloud: dict, task: dict, check) -> dict:
+    params = task["params"]
+    xyz = spherical_to_cartesian(cloud["phi"], cloud["r"], cloud["theta"])
+    check()
+    idx = voxel_downsample(xyz, params["voxel"], params["max_points"])
+    path = Path(task["path"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    xyz[idx].astype("<f4").tofile(tmp)
+    tmp.replace(path)
+    return {"points": len(idx)}
+
+
+HANDLERS = {
+    "artifacts": _run_artifacts,
+    "mesh": _run_mesh,
+    "filter": _run_filter,
+    "export": _run_export,
+    "downsample": _run_downsample,
+}
+
+
+def _execute(task: dict):
+    """Точка входа процесса пула"""
+    marker = cancel_path(task["id"])
+
+    def check():
+        if marker.exists():
+            raise JobCancelled()
+
+    check()
+    with attached_arrays(task["shared"]) as cloud:
+        return HANDLERS[task["kind"]](cloud, task, check)
+
+
+# --- Параметры, файлы результатов и кеш (процесс сервера) ------------------
+
+def normalize_params(kind: str, params: dict) -> dict:
+    """Проверка параметров и значения по умолчанию; ValueError — неверные параметры"""
+    params = dict(params or {})
+    if kind == "artifacts":
+        return {}
+    if kind == "mesh":
+        phi_step = float(params.get("phi_step") or settings.MESH_PHI_STEP)
+        max_edge = float(params.get("max_edge") or settings.MESH_MAX_EDGE)
+        if not (0 < phi_step <= 10 and 0 < max_edge <= 10):
+            raise ValueError("Неверные параметры поверхности")
+        return {"phi_step": phi_step, "max_edge": max_edge}
+    if kind == "filter":
+        filter_params = FilterParams(**params)
+        if (filter_params.range_min is not None and filter_params.range_max is not None
+                and filter_params.range_min > filter_params.range_max):
+            raise ValueError("range_min больше range_max")
+        return filter_params.model_dump()
+    if kind == "export":
+        fmt = params.get("fmt", "ply")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+        return {"fmt": fmt}
+    if kind == "downsample":
+        voxel = float(params.get("voxel") or settings.PREVIEW_VOXEL_SIZE)
+        max_points = params.get("max_points")
+        if not 0 < voxel <= 10 or (max_points is not None and int(max_points) < 1):
+            raise ValueError("Неверные параметры прореживания")
+        return {"voxel": voxel, "max_points": int(max_points) if max_points is not None else None}
+    raise ValueError(f"Неизвестный тип задачи: {kind}")
+
+
+def job_key(kind: str, experiment_id: int, source: str, params: dict, fingerprint: tuple[int, int]) -> str:
+    raw = json.dumps([kind, experiment_id, source, params, list(fingerprint)], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def result_path(kind: str, experiment_id: int, source: str, params: dict, key: str) -> Path:
+    """Файл результата задачи"""
+    if kind == "artifacts":
+        return cartesian_path(experiment_id, source)
+    if kind == "mesh":
+        return mesh_path(experiment_id, source)
+    if kind == "filter":
+        return filter_path(experiment_id, source, FilterParams(**params))
+    if kind == "export":
+        return artifact_dir(experiment_id, source) / "exports" / f"{key}.{EXPORT_FORMATS[params['fmt']][1]}"
+    return artifact_dir(experiment_id, source) / "downsample" / f"{key}.f32"
+
+
+def is_result_valid(kind: str, experiment_id: int, source: str, params: dict, key: str,
+                    fingerprint: tuple[int, int]) -> bool:
+    """Готовый результат можно отдать без пересчёта"""
+    if kind == "artifacts":
+        artifact = get_artifact(experiment_id, source)
+        path = cartesian_path(experiment_id, source)
+        return (artifact is not None and artifact.status == "ready"
+                and artifact.points_count == fingerprint[0]
+                and path.exists() and path.stat().st_size == fingerprint[0] * 12)
+    if kind == "mesh":
+        return is_mesh_valid(experiment_id, source, params["phi_step"], params["max_edge"])
+    if kind == "filter":
+        return read_filtered(result_path(kind, experiment_id, source, params, key)) is not None
+    return result_path(kind, experiment_id, source, params, key).exists()
+
+
+def job_to_dict(job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "experiment_id": job.experiment_id,
+        "source": job.source,
+        "params": job.params,
+        "priority": job.priority,
+        "status": job.status,
+        "message": job.message,
+        "result": job.result,
+        "created_dt": job.created_dt.isoformat() if job.created_dt else None,
+        "started_dt": job.started_dt.isoformat() if job.started_dt else None,
+        "finished_dt": job.finished_dt.isoformat() if job.finished_dt else None,
+    }
+
+
+# --- Очередь и пул процессов ----------------------------------------------
+
+class JobManager:
+    """
+    Очередь задач с приоритетами и пул процессов для тяжёлых расчётов по облакам.
+    Облако эксперимента один раз копируется в разделяемую память и открывается
+    процессами пула без копирования; блок живёт, пока есть задачи по этому облаку.
+    В пул одновременно уходит не больше workers задач, остальные ждут в очереди
+    по приоритету. Состояние задач хранится в таблице jobs.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool: ProcessPoolExecutor | None = None
+        self._queue: list[tuple[int, int, int]] = []
+        self._tasks: dict[int, dict] = {}
+        self._running: dict[int, dict] = {}
+        self._waiters: dict[int, Future] = {}
+        self._clouds: dict[tuple, dict] = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._dispatcher: threading.Thread | None = None
+        self._closed = False
+
+    def _fingerprint(self, experiment_id: int, source: str) -> tuple[int, int]:
+        _, header = cloud_store.ensure_header(experiment_id, source)
+        return header["count"], header["max_id"]
+
+    def submit(self, kind: str, experiment_id: int, source: str, params: dict | None = None,
+               priority: int = 0, user_id: int | None = None) -> dict:
+        """
+        Поставить задачу в очередь. Если такая же задача (тип, параметры, версия облака)
+        этого пользователя уже выполняется или её результат готов — возвращается она.
+        Готовый результат другого пользователя не пересчитывается: файл общий,
+        а строка задачи (её отмена и просмотр) у каждого своя.
+        """
+        params = normalize_params(kind, params)
+        fingerprint = self._fingerprint(experiment_id, source)
+        key = job_key(kind, experiment_id, source, params, fingerprint)
+
+        own = get_latest_job(key, user_id=user_id)
+        if own is not None:
+            if own.status in ACTIVE_STATUSES:
+                return job_to_dict(own)
+            if own.status == "done" and is_result_valid(kind, experiment_id, source, params, key, fingerprint):
+                return job_to_dict(own)
+
+        done = get_latest_job(key, status="done")
+        if done is not None and is_result_valid(kind, experiment_id, source, params, key, fingerprint):
+            now = datetime.now()
+            job = create_job(kind=kind, experiment_id=experiment_id, source=source, user_id=user_id,
+                             params=params, cache_key=key, priority=priority, owner=OWNER,
+                             status="done", result=done.result, started_dt=now, finished_dt=now)
+            return job_to_dict(job)
+
+        job = create_job(kind=kind, experiment_id=experiment_id, source=source, user_id=user_id,
+                         params=params, cache_key=key, priority=priority, owner=OWNER)
+        if kind == "artifacts":
+            save_artifact(experiment_id, source, status="pending", message=None)
+
+        task = {
+            "id": job.id, "kind": kind, "experiment_id": experiment_id, "source": source,
+            "params": params, "fingerprint": fingerprint,
+            "path": str(result_path(kind, experiment_id, source, params, key)),
+        }
+        with self._cond:
+            self._tasks[job.id] = task
+            self._waiters[job.id] = Future()
+            heapq.heappush(self._queue, (-priority, next(self._seq), job.id))
+            self._start()
+            self._cond.notify_all()
+        return job_to_dict(job)
+
+    def latest(self, kind: str, experiment_id: int, source: str, params: dict | None = None) -> dict | None:
+        """Последняя задача с такими же параметрами по текущей версии облака"""
+        params = normalize_params(kind, params)
+        key = job_key(kind, experiment_id, source, params, self._fingerprint(experiment_id, source))
+        job = get_latest_job(key)
+        return job_to_dict(job) if job else None
+
+    def cancel(self, job_id: int) -> dict | None:
+        """Отмена: задача из очереди снимается сразу, выполняющаяся — на ближайшей проверке"""
+        job = get_job(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return job_to_dict(job) if job else None
+
+        with self._cond:
+            task = self._tasks.pop(job_id, None)
+        if task is not None:
+            self._complete(task, "cancelled", "Задача отменена")
+        else:
+            settings.JOBS_DIR.mkdir(parents=True, exist_ok=True)
+            cancel_path(job_id).touch()
+        return job_to_dict(get_job(job_id))
+
+    async def wait(self, job_id: int) -> dict:
+        """Дождаться завершения задачи, не занимая цикл событий"""
+        with self._cond:
+            waiter = self._waiters.get(job_id)
+        if waiter is not None:
+            return await asyncio.wrap_future(waiter)
+        # Задача другого процесса сервера (или уже завершённая) — ждём по БД
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return job_to_dict(job) if job else None
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def run(self, kind: str, experiment_id: int, source: str, params: dict | None = None,
+                  priority: int = 0, user_id: int | None = None) -> dict:
+        """Поставить задачу и дождаться результата; JobError — если она не выполнена"""
+        job = await asyncio.to_thread(self.submit, kind, experiment_id, source, params, priority, user_id)
+        if job["status"] != "done":
+            job = await self.wait(job["id"])
+        if job["status"] != "done":
+            raise JobError(job["message"] or f"Задача завершилась со статусом {job['status']}")
+        return job
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch, name="jobs-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._queue or len(self._running) >= self.workers):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, job_id = heapq.heappop(self._queue)
+                task = self._tasks.pop(job_id, None)
+                if task is None:
+                    continue
+                self._running[job_id] = task
+
+            if cancel_path(job_id).exists():
+                self._complete(task, "cancelled", "Задача отменена")
+                continue
+            try:
+                task["shared"] = self._acquire_cloud(task)
+                update_job(job_id, status="running", started_dt=datetime.now())
+                pool = self._get_pool()
+                future = pool.submit(_execute, task)
+                future.add_done_callback(lambda f, t=task, p=pool: self._finish(t, f, p))
+            except Exception as e:
+                print(f"Ошибка запуска задачи {job_id}: {e}")
+                self._complete(task, "error", str(e)[:300])
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def _acquire_cloud(self, task: dict) -> dict:
+        """Облако задачи в разделяемой памяти (общий блок для задач по одному облаку)"""
+        key = (task["experiment_id"], task["source"], *task["fingerprint"])
+        with self._cond:
+            entry = self._clouds.get(key)
+            if entry is not None:
+                entry["refs"] += 1
+                return entry["spec"]
+        phi, theta, r = cloud_store.load(task["experiment_id"], task["source"])
+        block, spec = share_arrays({"phi": phi, "theta": theta, "r": r})
+        with self._cond:
+            entry = self._clouds.get(key)
+            if entry is not None:
+                # Параллельно уже создали такой же блок — наш не нужен
+                entry["refs"] += 1
+                block.close()
+                block.unlink()
+                return entry["spec"]
+            self._clouds[key] = {"block": block, "spec": spec, "refs": 1}
+        return spec
+
+    def _release_cloud(self, task: dict):
+        key = (task["experiment_id"], task["source"], *task["fingerprint"])
+        with self._cond:
+            entry = self._clouds.get(key)
+            if entry is None or task.get("shared") is None:
+                return
+            entry["refs"] -= 1
+            if entry["refs"] > 0:
+                return
+            del self._clouds[key]
+        entry["block"].close()
+        entry["block"].unlink()
+
+    def _finish(self, task: dict, future, pool: ProcessPoolExecutor):
+        """Завершение задачи в пуле (вызывается из служебного потока пула)"""
+        try:
+            result = future.result()
+        except JobCancelled:
+            self._complete(task, "cancelled", "Задача отменена")
+        except BrokenProcessPool as e:
+            # Процесс пула упал (например, нехватка памяти) — старый пул закрываем
+            # (его служебный поток и очереди), следующая задача создаст новый
+            with self._cond:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._complete(task, "error", f"Процесс расчёта завершился аварийно: {e}"[:300])
+        except Exception as e:
+            print(f"Ошибка задачи {task['kind']} {task['source']}/{task['experiment_id']}: {e}")
+            self._complete(task, "error", str(e)[:300])
+        else:
+            self._complete(task, "done", None, result)
+
+    def _complete(self, task: dict, status: str, message: str | None, result: dict | None = None):
+        job_id = task["id"]
+        self._release_cloud(task)
+        if task["kind"] == "artifacts":
+            if status == "done":
+                save_artifact(task["experiment_id"], task["source"], status="ready", message=None, **result)
+                result = {"points_count": result["points_count"], "preview_count": result["preview_count"]}
+            else:
+                save_artifact(task["experiment_id"], task["source"], status="error", message=message)
+
+        job = update_job(job_id, status=status, message=message, result=result, finished_dt=datetime.now())
+        if job is not None and job.started_dt is not None:
+            JOB_SECONDS.labels(task["kind"], status).observe((job.finished_dt - job.started_dt).total_seconds())
+        cancel_path(job_id).unlink(missing_ok=True)
+        with self._cond:
+            self._running.pop(job_id, None)
+            waiter = self._waiters.pop(job_id, None)
+            self._cond.notify_all()
+        if waiter is not None:
+            waiter.set_result(job_to_dict(job))
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            pool, self._pool = self._pool, None
+            clouds, self._clouds = self._clouds, {}
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        for entry in clouds.values():
+            entry["block"].close()
+            entry["block"].unlink()
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    При запуске: задачи, чей процесс сервера завершился, помечаем ошибкой. Задачи
+    соседних процессов (uvicorn --workers N) не трогаем — они ещё выполняются
+    """
+    dead = [owner for owner in get_active_job_owners() if is_dead_owner(owner)]
+    return fail_jobs_of(dead, include_unowned=True)
+
+
+job_manager = JobManager(settings.JOB_WORKERS or os.cpu_count() or 1)
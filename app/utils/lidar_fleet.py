@@ -0,0 +1,278 @@
+"""
+Несколько сканирующих установок: реестр (таблица lidar_devices), пулы SSH-соединений
+по установкам и планировщик команд.
+
+На установке одновременно выполняется не больше одной команды (скан, тест лидара
+или двигателя): занятость хранится в lidar_devices.active_task_id и общая для всех
+процессов сервера. Команды на разных установках идут параллельно; команда без
+device_id уходит на первую свободную установку. Очередь — в памяти процесса,
+принявшего команду.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import paramiko
+
+from app.core.config import settings
+from app.core.metrics import SSH_CONNECT_SECONDS
+from app.crud.device import claim_device, get_devices, mark_device_seen, release_device, release_devices_of
+from app.utils.task_state import OWNER, is_dead_owner, task_backend
+
+# Как часто планировщик пробует занять установку, пока команды ждут, с
+POLL_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class DeviceConfig:
+    """Параметры подключения установки (снимок записи lidar_devices)"""
+    id: int
+    name: str
+    host: str
+    port: int
+    username: str
+    password: str
+    remote_path: str
+
+    @classmethod
+    def from_model(cls, device) -> "DeviceConfig":
+        return cls(device.id, device.name, device.host, device.port, device.username, device.password,
+                   device.remote_path)
+
+
+class SSHPool:
+    """
+    Соединения с одной установкой. Свободные клиенты переиспользуются (не больше
+    max_idle), на одном клиенте можно открыть несколько каналов.
+    """
+
+    def __init__(self, device: DeviceConfig, max_idle: int):
+        self.device = device
+        self.max_idle = max_idle
+        self._idle: list[paramiko.SSHClient] = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> paramiko.SSHClient:
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        started = time.perf_counter()
+        try:
+            ssh.connect(self.device.host, port=self.device.port, username=self.device.username,
+                        password=self.device.password, timeout=10)
+        except Exception as e:
+            SSH_CONNECT_SECONDS.labels("error").observe(time.perf_counter() - started)
+            _mark_seen(self.device.id, str(e) or type(e).__name__)
+            raise
+        SSH_CONNECT_SECONDS.labels("ok").observe(time.perf_counter() - started)
+        _mark_seen(self.device.id)
+        return ssh
+
+    @contextmanager
+    def client(self):
+        """Клиент из пула или новый; после ошибки клиент закрывается, а не возвращается"""
+        ssh = self._take() or self.connect()
+        try:
+            yield ssh
+        except BaseException:
+            ssh.close()
+            raise
+        self._give(ssh)
+
+    def _take(self):
+        with self._lock:
+            while self._idle:
+                ssh = self._idle.pop()
+                transport = ssh.get_transport()
+                if transport is not None and transport.is_active():
+                    return ssh
+                ssh.close()
+        return None
+
+    def _give(self, ssh):
+        transport = ssh.get_transport()
+        with self._lock:
+            if transport is not None and transport.is_active() and len(self._idle) < self.max_idle:
+                self._idle.append(ssh)
+                return
+        ssh.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for ssh in idle:
+            ssh.close()
+
+
+def _mark_seen(device_id: int, error: str | None = None):
+    try:
+        mark_device_seen(device_id, error)
+    except Exception:
+        pass
+
+
+class DevicePools:
+    """Пулы по установкам; при изменении параметров установки пул пересоздаётся"""
+
+    def __init__(self, max_idle: int):
+        self.max_idle = max_idle
+        self._pools: dict[int, SSHPool] = {}
+        self._lock = threading.Lock()
+
+    def get(self, device: DeviceConfig) -> SSHPool:
+        with self._lock:
+            pool = self._pools.get(device.id)
+            if pool is not None and pool.device == device:
+                return pool
+            self._pools[device.id] = SSHPool(device, self.max_idle)
+        if pool is not None:
+            pool.close()
+        return self._pools[device.id]
+
+    def drop(self, device_id: int):
+        with self._lock:
+            pool = self._pools.pop(device_id, None)
+        if pool is not None:
+            pool.close()
+
+
+@dataclass
+class ScanRequest:
+    task_id: str
+    kind: str
+    cmd: str
+    device_id: int | None = None
+    # Скан: имя файла на установке и эксперимент (ExperimentCreate) для загрузки в БД после съёмки
+    filename: str | None = None
+    experiment: object | None = None
+
+
+class ScanScheduler:
+    """
+    Очередь команд установок. run(request, device, release) выполняет команду
+    в отдельном потоке; установка занимается перед запуском и освобождается после
+    или раньше — вызовом release(), когда работа с самой установкой закончена.
+    """
+
+    def __init__(self, run):
+        self.run = run
+        self._queue: list[ScanRequest] = []
+        self._running: dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._dispatcher = None
+
+    def submit(self, request: ScanRequest) -> int:
+        """Поставить команду в очередь; возвращает число команд впереди неё"""
+        with self._cond:
+            ahead = sum(1 for item in self._queue
+                        if request.device_id is None or item.device_id in (None, request.device_id))
+            self._queue.append(request)
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name="lidar-scheduler", daemon=True)
+                self._dispatcher.start()
+            self._cond.notify_all()
+        return ahead
+
+    def cancel(self, task_id: str) -> bool:
+        """Убрать команду из очереди; False — её там нет (уже выполняется или чужая)"""
+        with self._cond:
+            for item in self._queue:
+                if item.task_id == task_id:
+                    self._queue.remove(item)
+                    break
+            else:
+                return False
+        _finish(task_id, "[!] Отменено в очереди")
+        return True
+
+    def queued_count(self) -> int:
+        return len(self._queue)
+
+    def queued_by_device(self) -> dict:
+        """Число ждущих команд по device_id (None — на любую установку)"""
+        with self._cond:
+            result: dict = {}
+            for item in self._queue:
+                result[item.device_id] = result.get(item.device_id, 0) + 1
+            return result
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                pending = list(self._queue)
+            try:
+                self._start_pending(pending)
+            except Exception:
+                # БД недоступна — попробуем на следующем круге
+                pass
+            with self._cond:
+                if self._queue:
+                    self._cond.wait(POLL_INTERVAL)
+
+    def _start_pending(self, pending: list[ScanRequest]):
+        devices = {device.id: device for device in get_devices(enabled_only=True)}
+        free = [device_id for device_id, device in devices.items() if device.active_task_id is None]
+        for request in pending:
+            # /stop мог прийти в другой процесс сервера
+            if task_backend.stop_requested(request.task_id):
+                self.cancel(request.task_id)
+                continue
+            if request.device_id is not None and request.device_id not in devices:
+                with self._cond:
+                    if request in self._queue:
+                        self._queue.remove(request)
+                _finish(request.task_id, f"[!] Установка {request.device_id} не найдена или отключена")
+                continue
+            candidates = [request.device_id] if request.device_id is not None else list(free)
+            for device_id in candidates:
+                if device_id in free and claim_device(device_id, request.task_id, OWNER):
+                    free.remove(device_id)
+                    self._start(request, DeviceConfig.from_model(devices[device_id]))
+                    break
+
+    def _start(self, request: ScanRequest, device: DeviceConfig):
+        with self._cond:
+            if request in self._queue:
+                self._queue.remove(request)
+            self._running[request.task_id] = device.id
+        threading.Thread(target=self._run, args=(request, device), name=f"lidar-{device.id}", daemon=True).start()
+
+    def _run(self, request: ScanRequest, device: DeviceConfig):
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            try:
+                release_device(device.id, request.task_id)
+            except Exception:
+                pass
+            with self._cond:
+                self._running.pop(request.task_id, None)
+                self._cond.notify_all()
+
+        try:
+            self.run(request, device, release)
+        finally:
+            release()
+
+
+def _finish(task_id: str, text: str):
+    try:
+        task_backend.publish(task_id, [{"type": "info", "text": text}])
+        task_backend.finish(task_id)
+    except Exception:
+        pass
+
+
+def release_stale_claims() -> int:
+    """При запуске: снять занятость установок, оставшуюся от умерших процессов этого хоста"""
+    stale = [device.active_owner for device in get_devices() if is_dead_owner(device.active_owner)]
+    return release_devices_of(stale)
+
+
+device_pools = DevicePools(settings.LIDAR_SSH_POOL_SIZE)
@@ -0,0 +1,193 @@
+import os
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from app.utils.artifacts import artifact_dir
+from app.utils.cloud_store import cloud_store
+from app.utils.geometry import spherical_to_cartesian
+
+# Формат файла поверхности (mesh.bin):
+#   заголовок 64 байта: magic, версия, размер заголовка, число вершин, число треугольников,
+#   число точек и max(id) облака, по которому строили, шаг phi (°), максимальное ребро (м);
+#   далее float32 позиции[V*3], float32 нормали[V*3], uint32 индексы[T*3] (оси вьювера, метры)
+MESH_MAGIC = b"LPMESH\0\0"
+MESH_VERSION = 1
+MESH_HEADER_FORMAT = "<8sIIIIQqff"
+MESH_HEADER_SIZE = 64
+
+# Ограничение на размер сетки слоёв x секторов phi
+MAX_GRID_CELLS = 50_000_000
+# Сколько точек раскладываем по ячейкам сетки за один шаг (ограничивает временные массивы)
+MESH_BIN_CHUNK = 2_000_000
+
+def mesh_path(experiment_id: int, source: str) -> Path:
+    return artifact_dir(experiment_id, source) / "mesh.bin"
+
+
+def read_mesh_header(path: Path) -> dict | None:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(MESH_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(raw) < MESH_HEADER_SIZE:
+        return None
+    magic, version, header_size, vertices, triangles, points, max_id, phi_step, max_edge = \
+        struct.unpack_from(MESH_HEADER_FORMAT, raw)
+    if magic != MESH_MAGIC or version != MESH_VERSION or header_size != MESH_HEADER_SIZE:
+        return None
+    return {
+        "vertices": vertices,
+        "triangles": triangles,
+        "points": points,
+        "max_id": max_id,
+        "phi_step": round(phi_step, 6),
+        "max_edge": round(max_edge, 6),
+    }
+
+
+def _bin_columns(phi, theta, r, start: int, layers: np.ndarray, phi_step: float):
+    """
+    Для строк облака — номер ячейки сетки (слой theta x сектор phi)
+    и первая точка в каждой ячейке; start — смещение строк в облаке.
+    """
+    bins = int(round(360.0 / phi_step))
+    rows = np.flatnonzero(r > 0)
+    layer = np.searchsorted(layers, theta[rows])
+    sector = np.floor(np.mod(phi[rows], 360.0) / phi_step).astype(np.int64) % bins
+    keys, first = np.unique(layer.astype(np.int64) * bins + sector, return_index=True)
+    return keys, rows[first] + start
+
+
+def grid_vertices(phi, theta, r, phi_step: float):
+    """
+    Представительные точки сетки скана: по одной на ячейку (слой, сектор phi).
+    Проход по точкам — кусками по MESH_BIN_CHUNK строк в процессе задачи (он сам
+    работает в пуле app/utils/jobs.py, второй пул внутри не запускаем).
+    """
+    count = len(r)
+    layers = np.unique(np.asarray(theta))
+    bins = int(round(360.0 / phi_step))
+    if len(layers) * bins > MAX_GRID_CELLS:
+        raise ValueError("Слишком мелкий шаг phi для такого числа слоёв")
+
+    parts = [
+        _bin_columns(phi[start:start + MESH_BIN_CHUNK], theta[start:start + MESH_BIN_CHUNK],
+                     r[start:start + MESH_BIN_CHUNK], start, layers, phi_step)
+        for start in range(0, count, MESH_BIN_CHUNK)
+    ] or [_bin_columns(phi, theta, r, 0, layers, phi_step)]
+
+    keys = np.concatenate([k for k, _ in parts])
+    rows = np.concatenate([i for _, i in parts])
+    # Части идут по порядку строк, поэтому первое вхождение ключа — самая ранняя точка
+    keys, first = np.unique(keys, return_index=True)
+    return keys, rows[first], len(layers), bins
+
+
+def triangulate_grid(keys: np.ndarray, layers_count: int, bins: int, xyz: np.ndarray, max_edge: float) -> np.ndarray:
+    """
+    Треугольники между соседними слоями и соседними секторами (с переходом через 360°).
+    Ячейка даёт два треугольника, если все её вершины есть и рёбра не длиннее max_edge.
+    """
+    grid = np.full(layers_count * bins, -1, dtype=np.int64)
+    grid[keys] = np.arange(len(keys))
+    grid = grid.reshape(layers_count, bins)
+
+    a = grid[:-1]
+    b = np.roll(grid[:-1], -1, axis=1)
+    c = grid[1:]
+    d = np.roll(grid[1:], -1, axis=1)
+    triangles = np.concatenate([
+        np.stack([a, c, b], axis=-1).reshape(-1, 3),
+        np.stack([b, c, d], axis=-1).reshape(-1, 3),
+    ])
+    triangles = triangles[(triangles >= 0).all(axis=1)]
+    if len(triangles) == 0:
+        return np.empty((0, 3), dtype=np.uint32)
+
+    p = xyz[triangles]
+    edges = np.stack([
+        np.linalg.norm(p[:, 0] - p[:, 1], axis=1),
+        np.linalg.norm(p[:, 1] - p[:, 2], axis=1),
+        np.linalg.norm(p[:, 2] - p[:, 0], axis=1),
+    ], axis=1)
+    return triangles[(edges <= max_edge).all(axis=1)].astype(np.uint32)
+
+
+def vertex_normals(xyz: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Нормали вершин: сумма нормалей прилегающих граней (с весом площади), к сканеру"""
+    normals = np.zeros_like(xyz, dtype=np.float64)
+    if len(triangles):
+        p = xyz[triangles].astype(np.float64)
+        face = np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0])
+        for corner in range(3):
+            for axis in range(3):
+                normals[:, axis] += np.bincount(triangles[:, corner], weights=face[:, axis], minlength=len(xyz))
+
+    # Сканер в начале координат: нормаль должна смотреть на него
+    flip = np.einsum("ij,ij->i", normals, xyz) > 0
+    normals[flip] *= -1
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, length, out=normals, where=length > 0)
+    return normals.astype(np.float32)
+
+
+def is_mesh_valid(experiment_id: int, source: str, phi_step: float, max_edge: float) -> bool:
+    """Готовая поверхность построена по актуальному облаку и с теми же параметрами"""
+    header = read_mesh_header(mesh_path(experiment_id, source))
+    if header is None:
+        return False
+    _, cloud = cloud_store.ensure_header(experiment_id, source)
+    return (
+        header["points"] == cloud["count"]
+        and header["max_id"] == cloud["max_id"]
+        and header["phi_step"] == round(phi_step, 6)
+        and header["max_edge"] == round(max_edge, 6)
+    )
+
+
+def write_mesh(path: Path, phi, theta, r, fingerprint: tuple[int, int], phi_step: float, max_edge: float) -> dict:
+    """
+    Поверхность по сетке скана phi x theta: соседние измерения соседних слоёв
+    соединяются треугольниками, разрывы по дальности отсекаются по длине ребра.
+    fingerprint — (число точек, max(id)) облака для заголовка файла.
+    Выполняется задачей 'mesh' в пуле процессов (app/utils/jobs.py).
+    """
+    keys, rows, layers_count, bins = grid_vertices(phi, theta, r, phi_step)
+    xyz = spherical_to_cartesian(phi[rows], r[rows], theta[rows])
+    triangles = triangulate_grid(keys, layers_count, bins, xyz, max_edge)
+    normals = vertex_normals(xyz, triangles)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    header = struct.pack(
+        MESH_HEADER_FORMAT, MESH_MAGIC, MESH_VERSION, MESH_HEADER_SIZE,
+        len(xyz), len(triangles), fingerprint[0], fingerprint[1], phi_step, max_edge,
+    )
+    with open(tmp, "wb") as f:
+        f.write(header.ljust(MESH_HEADER_SIZE, b"\0"))
+        xyz.astype("<f4", copy=False).tofile(f)
+        normals.astype("<f4", copy=False).tofile(f)
+        triangles.astype("<u4", copy=False).tofile(f)
+    tmp.replace(path)
+    return {"vertices": len(xyz), "triangles": len(triangles)}
+
+
+def mesh_status(experiment_id: int, source: str, phi_step: float, max_edge: float, job: dict | None = None) -> dict:
+    """
+    Состояние поверхности: ready, pending, error или missing.
+    job — последняя задача 'mesh' с теми же параметрами (см. app/utils/jobs.py).
+    """
+    state = {"job_id": job["id"] if job else None}
+    if job and job["status"] in ("queued", "running"):
+        return {"status": "pending", "message": None, **state}
+    if is_mesh_valid(experiment_id, source, phi_step, max_edge):
+        header = read_mesh_header(mesh_path(experiment_id, source))
+        return {"status": "ready", "message": None,
+                "vertices": header["vertices"], "triangles": header["triangles"], **state}
+    if job and job["status"] in ("error", "cancelled"):
+        return {"status": "error", "message": job["message"], **state}
+    return {"status": "missing", "message": None, **state}
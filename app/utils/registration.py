@@ -0,0 +1,236 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core.config import settings
+from app.crud.registration import get_registration, save_registration
+from app.utils.artifacts import load_cartesian
+from app.utils.cloud_store import cloud_store
+from app.utils.geometry import to_survey_axes, from_survey_axes, voxel_downsample
+
+# Соседей для оценки нормалей и точек для оценки грубых вариантов совмещения
+NORMAL_NEIGHBORS = 16
+COARSE_SAMPLE = 5000
+
+
+def survey_cloud(experiment_id: int, source: str) -> np.ndarray:
+    """Облако эксперимента в осях отчёта, (N, 3) float64, м"""
+    return to_survey_axes(np.asarray(load_cartesian(experiment_id, source))).astype(np.float64)
+
+
+def apply_transform(xyz: np.ndarray, transform: np.ndarray) -> np.ndarray:
+    return xyz @ transform[:3, :3].T + transform[:3, 3]
+
+
+def _rigid(rotation: np.ndarray, translation) -> np.ndarray:
+    transform = np.eye(4)
+    transform[:3, :3] = rotation
+    transform[:3, 3] = translation
+    return transform
+
+
+def _rotation_z(angle: float) -> np.ndarray:
+    c, s = np.cos(angle), np.sin(angle)
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+def _rotation_from_vector(v: np.ndarray) -> np.ndarray:
+    """Поворот по вектору оси-угла (формула Родрига)"""
+    angle = np.linalg.norm(v)
+    if angle < 1e-12:
+        return np.eye(3)
+    k = v / angle
+    K = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return np.eye(3) + np.sin(angle) * K + (1 - np.cos(angle)) * K @ K
+
+
+def kabsch(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """Жёсткое преобразование source -> target по парам точек (метод Кабша)"""
+    source, target = np.asarray(source, dtype=np.float64), np.asarray(target, dtype=np.float64)
+    cs, ct = source.mean(axis=0), target.mean(axis=0)
+    U, _, Vt = np.linalg.svd((source - cs).T @ (target - ct))
+    d = np.sign(np.linalg.det(Vt.T @ U.T)) or 1.0
+    rotation = Vt.T @ np.diag([1.0, 1.0, d]) @ U.T
+    return _rigid(rotation, ct - rotation @ cs)
+
+
+def pca_alignment(source: np.ndarray, target: np.ndarray, target_tree: cKDTree) -> np.ndarray:
+    """
+    Грубое совмещение без пар точек. Штатив выставлен по уровню, поэтому ищем
+    только поворот вокруг вертикали: главные оси облаков в плане совмещаются
+    с точностью до 90° (комната симметрична), из четырёх вариантов берём тот,
+    у которого меньше медианное расстояние до опорного облака.
+    """
+    cs, ct = source.mean(axis=0), target.mean(axis=0)
+
+    def heading(xyz, center):
+        flat = xyz[:, :2] - center[:2]
+        w, v = np.linalg.eigh(flat.T @ flat)
+        axis = v[:, np.argmax(w)]
+        return np.arctan2(axis[1], axis[0])
+
+    base = heading(target, ct) - heading(source, cs)
+    step = max(1, len(source) // COARSE_SAMPLE)
+    sample = source[::step]
+
+    best, best_score = None, np.inf
+    for k in range(4):
+        rotation = _rotation_z(base + k * np.pi / 2)
+        transform = _rigid(rotation, ct - rotation @ cs)
+        distances, _ = target_tree.query(apply_transform(sample, transform), workers=-1)
+        score = float(np.median(distances))
+        if score < best_score:
+            best, best_score = transform, score
+    return best
+
+
+def estimate_normals(xyz: np.ndarray, tree: cKDTree, k: int = NORMAL_NEIGHBORS) -> np.ndarray:
+    """Нормали по k соседям: собственный вектор наименьшего собственного значения ковариации"""
+    _, neighbors = tree.query(xyz, k=min(k, len(xyz)), workers=-1)
+    patches = xyz[neighbors] - xyz[neighbors].mean(axis=1, keepdims=True)
+    covariance = np.einsum("mki,mkj->mij", patches, patches)
+    _, vectors = np.linalg.eigh(covariance)
+    return vectors[:, :, 0]
+
+
+def icp_point_to_plane(
+    source: np.ndarray,
+    target: np.ndarray,
+    target_normals: np.ndarray,
+    target_tree: cKDTree,
+    initial: np.ndarray,
+    max_distance: float,
+    iterations: int,
+    tolerance: float = 1e-6,
+):
+    """
+    ICP точка-плоскость: на каждой итерации линеаризуем поворот и решаем систему 6x6.
+    Радиус поиска пар сужается от 4 * max_distance до max_distance.
+    Возвращает (матрица 4x4, СКО, доля точек с парой).
+    """
+    transform = initial.copy()
+    rmse, fitness = np.inf, 0.0
+    for i in range(iterations):
+        radius = max(max_distance, 4 * max_distance * 0.7 ** i)
+        moved = apply_transform(source, transform)
+        distances, idx = target_tree.query(moved, distance_upper_bound=radius, workers=-1)
+        matched = np.isfinite(distances)
+        if matched.sum() < 6:
+            raise ValueError("Облака не перекрываются: не найдено пар точек")
+
+        p, q, n = moved[matched], target[idx[matched]], target_normals[idx[matched]]
+        residual = np.einsum("ij,ij->i", q - p, n)
+        A = np.hstack([np.cross(p, n), n])
+        x = np.linalg.lstsq(A.T @ A, A.T @ residual, rcond=None)[0]
+
+        step = _rigid(_rotation_from_vector(x[:3]), x[3:])
+        transform = step @ transform
+        rmse = float(np.sqrt(np.mean(residual ** 2)))
+        fitness = float(matched.mean())
+        if np.linalg.norm(x) < tolerance and radius == max_distance:
+            break
+    return transform, rmse, fitness
+
+
+def register_experiment(
+    experiment_id: int,
+    source: str,
+    reference_id: int,
+    reference_source: str,
+    correspondences: list[tuple[list[float], list[float]]] | None = None,
+    max_distance: float | None = None,
+):
+    """
+    Совмещение эксперимента с опорным: грубо по парам точек (если заданы) или по
+    главным осям, затем ICP точка-плоскость по прореженным облакам.
+    Результат сохраняется в experiment_registrations.
+    """
+    voxel = settings.REGISTRATION_VOXEL_SIZE
+    max_distance = max_distance or settings.REGISTRATION_MAX_DISTANCE
+
+    moving = survey_cloud(experiment_id, source)
+    fixed = survey_cloud(reference_id, reference_source)
+    if len(moving) == 0 or len(fixed) == 0:
+        raise ValueError("Пустое облако точек")
+
+    moving = moving[voxel_downsample(moving, voxel, settings.REGISTRATION_MAX_POINTS)]
+    fixed = fixed[voxel_downsample(fixed, voxel, settings.REGISTRATION_MAX_POINTS)]
+    fixed_tree = cKDTree(fixed)
+    fixed_normals = estimate_normals(fixed, fixed_tree)
+
+    if correspondences:
+        if len(correspondences) < 3:
+            raise ValueError("Нужно не меньше трёх пар точек")
+        initial = kabsch([pair[0] for pair in correspondences], [pair[1] for pair in correspondences])
+        method = "correspondences"
+    else:
+        initial = pca_alignment(moving, fixed, fixed_tree)
+        method = "pca"
+
+    transform, rmse, fitness = icp_point_to_plane(
+        moving, fixed, fixed_normals, fixed_tree, initial,
+        max_distance, settings.REGISTRATION_ICP_ITERATIONS,
+    )
+    return save_registration(
+        experiment_id, source, reference_id, reference_source,
+        transform=transform.tolist(), method=method, rmse=rmse, fitness=fitness,
+    )
+
+
+def registration_to_dict(registration) -> dict:
+    return {
+        "experiment_id": registration.experiment_id,
+        "source": registration.source,
+        "reference_id": registration.reference_id,
+        "reference_source": registration.reference_source,
+        "transform": registration.transform,
+        "method": registration.method,
+        "rmse": registration.rmse,
+        "fitness": registration.fitness,
+        "updated_dt": registration.updated_dt.isoformat() if registration.updated_dt else None,
+    }
+
+
+def merged_path(reference: tuple[int, str], others: list[tuple[int, str]], voxel: float) -> Path:
+    """
+    Файл объединённого облака. Имя — хеш состава, версий облаков и совмещений,
+    поэтому при любом изменении входных данных файл строится заново.
+    """
+    parts = [f"{voxel}"]
+    for experiment_id, source in [reference] + others:
+        _, header = cloud_store.ensure_header(experiment_id, source)
+        parts.append(f"{source}:{experiment_id}:{header['count']}:{header['max_id']}")
+        if (experiment_id, source) != reference:
+            registration = get_registration(experiment_id, source, *reference)
+            if registration is None:
+                raise LookupError(f"Эксперимент {source}:{experiment_id} не совмещён с опорным")
+            parts.append(registration.updated_dt.isoformat())
+    key = hashlib.sha1("|".join(parts).encode()).hexdigest()
+    return settings.ARTIFACTS_DIR / "merged" / f"{key}.f32"
+
+
+def build_merged_cloud(reference: tuple[int, str], others: list[tuple[int, str]], voxel: float) -> Path:
+    """
+    Объединённое облако в системе опорного эксперимента, по одной точке на воксель
+    (при совпадении приоритет у опорного облака). Формат как у cartesian.f32.
+    """
+    path = merged_path(reference, others, voxel)
+    if path.exists():
+        return path
+
+    clouds = [survey_cloud(*reference)]
+    for experiment_id, source in others:
+        transform = np.asarray(get_registration(experiment_id, source, *reference).transform)
+        clouds.append(apply_transform(survey_cloud(experiment_id, source), transform))
+    merged = np.concatenate(clouds)
+    merged = merged[voxel_downsample(merged, voxel)]
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    from_survey_axes(merged).astype("<f4").tofile(tmp)
+    tmp.replace(path)
+    return path
@@ -0,0 +1,132 @@
+import io
+import math
+import warnings
+import zlib
+
+import numpy as np
+
+from app.core.config import settings
+
+# Сколько ошибочных строк перечисляем в ответе, и сколько строк показываем в предпросмотре
+MAX_ROW_ERRORS = 20
+PREVIEW_ROWS = 10
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class ScanParseError(ValueError):
+    """Файл скана не прошёл проверку; errors — [{"line": номер строки, "message": ...}]"""
+
+    def __init__(self, message: str, errors: list[dict] | None = None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def decompress(data: bytes, max_bytes: int | None = None) -> bytes:
+    """
+    Файл, сжатый gzip на клиенте, распаковываем; остальные отдаём как есть.
+    Распакованный размер ограничен UPLOAD_MAX_BYTES — архив-бомба не раздует память.
+    """
+    if data[:2] != GZIP_MAGIC:
+        return data
+    limit = settings.UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    parts, total = [], 0
+    try:
+        # gzip-файл может состоять из нескольких склеенных архивов
+        while data:
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parts.append(inflater.decompress(data, limit - total + 1))
+            total += len(parts[-1])
+            if total > limit:
+                raise ValueError("Распакованный файл слишком большой")
+            if not inflater.eof:
+                raise ValueError("Повреждённый gzip-архив: архив обрезан")
+            data = inflater.unused_data
+    except zlib.error as e:
+        raise ValueError(f"Повреждённый gzip-архив: {e}")
+    return b"".join(parts)
+
+
+def _lines(data):
+    """Построчное чтение содержимого: bytes — через BytesIO, mmap — без копии файла в память"""
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    data.seek(0)
+    return iter(data.readline, b"")
+
+
+def _row_errors(data: bytes, max_errors: int = MAX_ROW_ERRORS) -> list[dict]:
+    """
+    Медленный построчный проход — только когда быстрый разбор не удался.
+    Правила те же, что были в create.js: пустые строки пропускаются,
+    нужно минимум 3 значения через ';', лишние значения игнорируются.
+    """
+    errors = []
+    for number, raw in enumerate(_lines(data), start=1):
+        line = raw.split(b"#", 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split(b";")
+        if len(parts) < 3:
+            errors.append({"line": number, "message": "требуется 3 значения"})
+        else:
+            try:
+                values = [float(part) for part in parts[:3]]
+            except ValueError:
+                errors.append({"line": number, "message": "неверный формат чисел"})
+            else:
+                if not all(math.isfinite(v) for v in values):
+                    errors.append({"line": number, "message": "значение не является конечным числом"})
+        if len(errors) >= max_errors:
+            break
+    return errors
+
+
+def parse_scan_text(data: bytes):
+    """
+    Векторный разбор файла сканера 'phi;r;theta' (строка на измерение).
+    Возвращает (phi, theta, r) float64. При любой ошибке бросает ScanParseError
+    со списком первых MAX_ROW_ERRORS ошибочных строк.
+    """
+    data = decompress(data)
+    try:
+        with warnings.catch_warnings():
+            # Пустой файл — не предупреждение, а ошибка ниже
+            warnings.simplefilter("ignore", UserWarning)
+            values = np.loadtxt(
+                _lines(data), delimiter=";", usecols=(0, 1, 2),
+                dtype=np.float64, ndmin=2, comments="#",
+            )
+    except ValueError:
+        values = None
+
+    if values is not None and np.isfinite(values).all():
+        if len(values) == 0:
+            raise ScanParseError("Файл не содержит действительных данных")
+        return values[:, 0], values[:, 2], values[:, 1]
+
+    errors = _row_errors(data)
+    if not errors:
+        errors = [{"line": None, "message": "не удалось разобрать файл"}]
+    first = errors[0]
+    where = f" в строке {first['line']}" if first["line"] else ""
+    raise ScanParseError(f"Неверный формат{where}: {first['message']}", errors)
+
+
+def scan_summary(phi, theta, r) -> dict:
+    """Сводка по разобранному файлу и первые строки для таблицы предпросмотра"""
+    count = len(r)
+    preview = [
+        {"phi": p, "r": d, "theta": t}
+        for p, d, t in zip(
+            phi[:PREVIEW_ROWS].tolist(), r[:PREVIEW_ROWS].tolist(), theta[:PREVIEW_ROWS].tolist()
+        )
+    ]
+    return {
+        "count": count,
+        "min_r": float(r.min()) if count else 0.0,
+        "max_r": float(r.max()) if count else 0.0,
+        "avg_r": float(r.mean()) if count else 0.0,
+        "layers": int(np.unique(theta).size),
+        "preview": preview,
+    }
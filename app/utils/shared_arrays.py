@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Выравнивание массивов внутри блока, байт
+ALIGN = 64
+
+
+def share_arrays(arrays: dict[str, np.ndarray]):
+    """
+    Копирует массивы в один блок разделяемой памяти.
+    Возвращает (блок, описание); описание передаётся в процесс пула
+    и там открывается через attached_arrays без копирования данных.
+    """
+    fields, offset = [], 0
+    for key, array in arrays.items():
+        array = np.asarray(array)
+        fields.append([key, array.dtype.str, list(array.shape), offset])
+        offset += -(-array.nbytes // ALIGN) * ALIGN
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for (key, dtype, shape, start), array in zip(fields, arrays.values()):
+        view = np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+        view[...] = array
+    return block, {"name": block.name, "fields": fields}
+
+
+@contextmanager
+def attached_arrays(spec: dict):
+    """
+    Массивы из блока, созданного share_arrays в другом процессе: {имя: массив}.
+    Блок закрывается на выходе из with; удаляет его только создатель.
+    """
+    # Процессы пула (spawn) пользуются трекером ресурсов создателя блока,
+    # поэтому повторная регистрация при открытии ничего не меняет
+    block = shared_memory.SharedMemory(name=spec["name"])
+    arrays = {
+        key: np.ndarray(shape, dtype=dtype, buffer=block.buf, offset=start)
+        for key, dtype, shape, start in spec["fields"]
+    }
+    try:
+        yield arrays
+    finally:
+        arrays.clear()
+        try:
+            block.close()
+        except BufferError:
+            # Кто-то ещё держит вид на блок — память освободится вместе с ним
+            pass
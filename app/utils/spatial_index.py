@@ -0,0 +1,167 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from app.core.config import settings
+from app.utils.artifacts import load_cartesian
+from app.utils.cloud_store import cloud_store, rounded
+from app.utils.geometry import to_survey_axes
+
+# Сколько сэмплов луча проверяем при выборе точки лучом
+MAX_RAY_SAMPLES = 20_000
+
+
+class SpatialIndex:
+    """KD-дерево по облаку эксперимента в осях отчёта (м) и колонки исходных измерений"""
+
+    def __init__(self, xyz: np.ndarray, phi, theta, r, fingerprint: tuple[int, int]):
+        self.xyz = xyz
+        self.phi = phi
+        self.theta = theta
+        self.r = r
+        self.fingerprint = fingerprint
+        self.tree = cKDTree(xyz, leafsize=32, balanced_tree=False, compact_nodes=False)
+
+    @property
+    def nbytes(self) -> int:
+        # Координаты, перестановка индексов и узлы дерева — примерно по 56 байт на точку
+        return len(self.xyz) * 56
+
+    def points(self, idx, distances=None) -> list[dict]:
+        """Найденные точки: индекс, координаты (оси отчёта) и исходное измерение"""
+        idx = np.asarray(idx, dtype=np.int64)
+        xyz = self.xyz[idx]
+        result = [
+            {"index": i, "x": x, "y": y, "z": z, "phi": p, "theta": t, "r": d}
+            for i, (x, y, z), p, t, d in zip(
+                idx.tolist(),
+                rounded(xyz),
+                rounded(self.phi[idx]),
+                rounded(self.theta[idx]),
+                rounded(self.r[idx]),
+            )
+        ]
+        if distances is not None:
+            for item, distance in zip(result, rounded(distances)):
+                item["distance"] = distance
+        return result
+
+    def nearest(self, point, k: int = 1, max_distance: float = np.inf):
+        distances, idx = self.tree.query(point, k=k, distance_upper_bound=max_distance)
+        distances, idx = np.atleast_1d(distances), np.atleast_1d(idx)
+        found = np.isfinite(distances)
+        return idx[found], distances[found]
+
+    def radius(self, point, radius: float):
+        """Индексы точек в шаре и расстояния до них, по возрастанию расстояния"""
+        idx = np.asarray(self.tree.query_ball_point(point, radius, return_sorted=False), dtype=np.int64)
+        distances = np.linalg.norm(self.xyz[idx] - np.asarray(point), axis=1)
+        order = np.argsort(distances, kind="stable")
+        return idx[order], distances[order]
+
+    def box(self, low, high) -> np.ndarray:
+        """Индексы точек в параллелепипеде: шар по чебышёвской метрике вокруг центра и точный отбор"""
+        low, high = np.asarray(low, dtype=np.float64), np.asarray(high, dtype=np.float64)
+        center = (low + high) / 2
+        half = float(np.max(high - low)) / 2
+        idx = np.asarray(self.tree.query_ball_point(center, half, p=np.inf, return_sorted=False), dtype=np.int64)
+        xyz = self.xyz[idx]
+        idx = idx[np.all((xyz >= low) & (xyz <= high), axis=1)]
+        idx.sort()
+        return idx
+
+    def pick(self, origin, direction, radius: float):
+        """
+        Ближайшая к началу луча точка на расстоянии не больше radius от луча.
+        Луч обрезается границами облака и проверяется шарами вдоль него.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        length = np.linalg.norm(direction)
+        if length == 0 or len(self.xyz) == 0:
+            return None
+        direction = direction / length
+
+        # Пересечение луча с границами облака (метод плит)
+        low, high = self.tree.mins - radius, self.tree.maxes + radius
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (low - origin) / direction
+            t2 = (high - origin) / direction
+        t_near = np.nanmax(np.minimum(t1, t2))
+        t_far = np.nanmin(np.maximum(t1, t2))
+        t_near = max(t_near, 0.0)
+        if not np.isfinite(t_far) or t_far < t_near:
+            return None
+
+        step = max(radius, (t_far - t_near) / MAX_RAY_SAMPLES)
+        samples = origin + np.arange(t_near, t_far + step, step)[:, None] * direction
+        # Шары радиуса sqrt(r^2 + (step/2)^2) вокруг сэмплов покрывают цилиндр радиуса r
+        reach = float(np.hypot(radius, step / 2))
+        candidates = self.tree.query_ball_point(samples, reach, return_sorted=False)
+        idx = np.unique(np.concatenate([np.asarray(c, dtype=np.int64) for c in candidates]))
+        if len(idx) == 0:
+            return None
+
+        offsets = self.xyz[idx] - origin
+        along = offsets @ direction
+        across = np.linalg.norm(offsets - along[:, None] * direction, axis=1)
+        hit = (across <= radius) & (along >= 0)
+        if not hit.any():
+            return None
+        best = np.flatnonzero(hit)[np.argmin(along[hit])]
+        return int(idx[best]), float(across[best])
+
+
+class SpatialIndexCache:
+    """
+    Индексы экспериментов в памяти процесса. Вытесняются давно не использованные,
+    когда суммарный размер превышает max_bytes. Индекс перестраивается, если
+    облако в кеше (scans/cache) изменилось.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[tuple[int, str], SpatialIndex] = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: dict[tuple[int, str], threading.Lock] = {}
+
+    def _fingerprint(self, experiment_id: int, source: str) -> tuple[int, int]:
+        _, header = cloud_store.ensure_header(experiment_id, source)
+        return header["count"], header["max_id"]
+
+    def get(self, experiment_id: int, source: str) -> SpatialIndex:
+        key = (experiment_id, source)
+        fingerprint = self._fingerprint(experiment_id, source)
+        with self._lock:
+            index = self._items.get(key)
+            if index is not None and index.fingerprint == fingerprint:
+                self._items.move_to_end(key)
+                return index
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        # Один и тот же индекс строим один раз, даже при параллельных запросах
+        with build_lock:
+            with self._lock:
+                index = self._items.get(key)
+                if index is not None and index.fingerprint == fingerprint:
+                    return index
+            phi, theta, r = cloud_store.load(experiment_id, source)
+            xyz = np.ascontiguousarray(to_survey_axes(np.asarray(load_cartesian(experiment_id, source))),
+                                       dtype=np.float64)
+            index = SpatialIndex(xyz, phi, theta, r, fingerprint)
+
+            # Кладём в кеш, не отпуская build_lock: ждущие запросы сразу найдут готовый индекс
+            with self._lock:
+                self._items[key] = index
+                self._items.move_to_end(key)
+                total = sum(item.nbytes for item in self._items.values())
+                while total > self.max_bytes and len(self._items) > 1:
+                    _, old = self._items.popitem(last=False)
+                    total -= old.nbytes
+                self._building.pop(key, None)
+        return index
+
+
+spatial_indexes = SpatialIndexCache(settings.SPATIAL_INDEX_MAX_BYTES)
@@ -0,0 +1,366 @@
+"""
+Общее состояние команд установки (скан, тесты) и раздача их журналов.
+
+SSH-соединение держит поток того процесса сервера, который принял /start,
+а /stop и /ws/{task_id} могут прийти в любой другой процесс (uvicorn --workers N).
+Поэтому флаг остановки, признак завершения и журнал хранятся в бэкенде:
+
+  memory — в памяти процесса, для запуска в один процесс (по умолчанию);
+           журналы дублируются в файлы scans/logs и читаются оттуда после вытеснения
+  db     — в таблицах lidar_tasks / lidar_task_logs основной БД; на PostgreSQL
+           подписчиков будит LISTEN/NOTIFY, иначе они опрашивают таблицу
+
+Поток команды вызывает publish / finish / stop_requested / update_meta (синхронно),
+обработчики запросов — create / exists / meta / request_stop / subscribe. У сообщений
+журнала есть номер seq: подписчик, переподключившись, продолжает с него.
+"""
+import asyncio
+import json
+import os
+import select
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+from app.core.config import settings
+from app.crud.task import (
+    NOTIFY_CHANNEL, add_task_logs, create_task, delete_old_tasks, get_task, get_task_logs, update_task,
+)
+from app.db.session import engine
+
+# Как часто подписчик опрашивает БД без уведомлений, с
+POLL_INTERVAL = 0.5
+# Пауза перед переподключением слушателя LISTEN после ошибки, с
+LISTEN_RETRY = 5.0
+
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_dead_owner(owner: str | None) -> bool:
+    """
+    Владелец (host:pid) — завершившийся процесс этого хоста. Свой OWNER при запуске —
+    прошлый процесс с тем же pid (например, pid 1 в контейнере); процессы других хостов
+    не проверить — считаем живыми
+    """
+    if not owner:
+        return False
+    host, _, pid = owner.rpartition(":")
+    return host == socket.gethostname() and pid.isdigit() and (owner == OWNER or not _pid_alive(int(pid)))
+
+
+class _Waiters:
+    """asyncio.Event подписчиков по task_id; будить можно из любого потока"""
+
+    def __init__(self):
+        self._items: dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    def add(self, task_id: str) -> tuple:
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._items.setdefault(task_id, set()).add(waiter)
+        return waiter
+
+    def remove(self, task_id: str, waiter: tuple):
+        with self._lock:
+            waiters = self._items.get(task_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._items[task_id]
+
+    def wake(self, task_id: str):
+        with self._lock:
+            waiters = list(self._items.get(task_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Цикл событий подписчика уже закрыт
+                pass
+
+
+class TaskLog:
+    """
+    Журнал одной команды: последние buffer_size сообщений в памяти (кольцевой буфер),
+    полный журнал — в файле JSON Lines. У сообщений сквозной номер seq с 1.
+    """
+
+    def __init__(self, path: Path, buffer_size: int):
+        self.path = path
+        self.buffer: deque[dict] = deque(maxlen=buffer_size)
+        self.seq = 0
+
+    def append(self, messages: list[dict]):
+        lines = []
+        for message in messages:
+            self.seq += 1
+            message = {"seq": self.seq, **message}
+            self.buffer.append(message)
+            lines.append(json.dumps(message, ensure_ascii=False) + "\n")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def from_buffer(self, after: int) -> list[dict] | None:
+        """Сообщения после after из буфера; None — часть их уже вытеснена и лежит только в файле"""
+        if self.buffer and self.buffer[0]["seq"] > after + 1:
+            return None
+        return [message for message in self.buffer if message["seq"] > after]
+
+
+def read_log_file(path: Path, after: int = 0, limit: int = 1000) -> list[dict]:
+    """Сообщения журнала из файла после after; недописанная последняя строка пропускается"""
+    result = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                message = json.loads(line)
+                if message["seq"] > after:
+                    result.append(message)
+                    if len(result) >= limit:
+                        break
+    except FileNotFoundError:
+        pass
+    return result
+
+
+class MemoryTaskBackend:
+    """
+    Состояние в памяти процесса: только для одного процесса сервера.
+    Журналы — в TaskLog (буфер + файл в logs_dir); завершённые команды забываются
+    через ttl_hours, их журналы остаются на диске keep_days дней и отдаются из файла.
+    """
+
+    def __init__(self, logs_dir: Path, buffer_size: int, ttl_hours: int, keep_days: int):
+        self.logs_dir = logs_dir
+        self.buffer_size = buffer_size
+        self.ttl_seconds = ttl_hours * 3600
+        self.keep_seconds = keep_days * 86400
+        self._tasks: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._waiters = _Waiters()
+
+    def log_path(self, task_id: str) -> Path:
+        return self.logs_dir / f"{task_id}.jsonl"
+
+    async def create(self, task_id: str, kind: str, meta: dict | None = None):
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path(task_id).touch()
+        with self._lock:
+            self._tasks[task_id] = {
+                "kind": kind, "meta": meta or {}, "log": TaskLog(self.log_path(task_id), self.buffer_size),
+                "stop": False, "done": False, "finished": None,
+            }
+
+    async def exists(self, task_id: str) -> bool:
+        # Забытую команду можно прочитать из файла журнала
+        return task_id in self._tasks or (task_id.isalnum() and self.log_path(task_id).exists())
+
+    async def request_stop(self, task_id: str) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return False
+            task["stop"] = True
+        return True
+
+    def stop_requested(self, task_id: str) -> bool:
+        task = self._tasks.get(task_id)
+        return bool(task and task["stop"])
+
+    async def meta(self, task_id: str) -> dict | None:
+        task = self._tasks.get(task_id)
+        return dict(task["meta"]) if task else None
+
+    def update_meta(self, task_id: str, fields: dict):
+        with self._lock:
+            self._tasks[task_id]["meta"].update(fields)
+
+    def publish(self, task_id: str, messages: list[dict]):
+        with self._lock:
+            self._tasks[task_id]["log"].append(messages)
+        self._waiters.wake(task_id)
+
+    def finish(self, task_id: str):
+        with self._lock:
+            task = self._tasks[task_id]
+            task["done"] = True
+            task["finished"] = time.monotonic()
+        self._waiters.wake(task_id)
+
+    async def subscribe(self, task_id: str, after: int = 0):
+        """
+        Сообщения журнала с номером больше after (повторное подключение — с последнего
+        полученного); итерация заканчивается, когда команда завершена
+        """
+        waiter = self._waiters.add(task_id)
+        try:
+            while True:
+                waiter[1].clear()
+                with self._lock:
+                    task = self._tasks.get(task_id)
+                    batch = task["log"].from_buffer(after) if task else None
+                    done = task is None or task["done"]
+                if batch is None:
+                    # Вытесненное из буфера (или вся забытая команда) — из файла
+                    batch = await asyncio.to_thread(read_log_file, self.log_path(task_id), after)
+                    if batch:
+                        done = False
+                    elif task is not None:
+                        # Файла журнала нет — отдаём то, что осталось в буфере
+                        with self._lock:
+                            batch = [message for message in task["log"].buffer if message["seq"] > after]
+                for message in batch:
+                    after = message["seq"]
+                    yield message
+                if done:
+                    return
+                if not batch:
+                    await waiter[1].wait()
+        finally:
+            self._waiters.remove(task_id, waiter)
+
+    def cleanup(self):
+        """Забываем команды, завершённые больше ttl_hours назад, и удаляем старые файлы журналов"""
+        deadline = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            for task_id in [k for k, task in self._tasks.items() if task["done"] and task["finished"] < deadline]:
+                del self._tasks[task_id]
+        if not self.logs_dir.exists():
+            return
+        file_deadline = time.time() - self.keep_seconds
+        for path in self.logs_dir.glob("*.jsonl"):
+            try:
+                if path.stem not in self._tasks and path.stat().st_mtime < file_deadline:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class DatabaseTaskBackend:
+    """Состояние и журналы в основной БД: общие для всех процессов сервера"""
+
+    def __init__(self, ttl_hours: int, poll_interval: float = POLL_INTERVAL):
+        self.ttl_hours = ttl_hours
+        self.poll_interval = poll_interval
+        self._waiters = _Waiters()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    async def create(self, task_id: str, kind: str, meta: dict | None = None):
+        await asyncio.to_thread(create_task, task_id, kind, meta, OWNER)
+
+    async def exists(self, task_id: str) -> bool:
+        return await asyncio.to_thread(get_task, task_id) is not None
+
+    async def request_stop(self, task_id: str) -> bool:
+        return await asyncio.to_thread(update_task, task_id, stop_requested=True)
+
+    def stop_requested(self, task_id: str) -> bool:
+        task = get_task(task_id)
+        return bool(task and task.stop_requested)
+
+    async def meta(self, task_id: str) -> dict | None:
+        task = await asyncio.to_thread(get_task, task_id)
+        return dict(task.meta or {}) if task else None
+
+    def update_meta(self, task_id: str, fields: dict):
+        task = get_task(task_id)
+        if task is not None:
+            update_task(task_id, meta={**(task.meta or {}), **fields})
+
+    def publish(self, task_id: str, messages: list[dict]):
+        add_task_logs(task_id, messages)
+        self._waiters.wake(task_id)
+
+    def finish(self, task_id: str):
+        update_task(task_id, done=True, finished_dt=datetime.now())
+        self._waiters.wake(task_id)
+
+    async def subscribe(self, task_id: str, after: int = 0):
+        """seq сообщения — id строки в lidar_task_logs: растёт, но не подряд"""
+        self._start_listener()
+        waiter = self._waiters.add(task_id)
+        last_id = after
+        try:
+            while True:
+                waiter[1].clear()
+                # Признак завершения читаем раньше журнала: finish пишется после всех строк
+                task = await asyncio.to_thread(get_task, task_id)
+                rows = await asyncio.to_thread(get_task_logs, task_id, last_id)
+                for row in rows:
+                    last_id = row.id
+                    yield {"seq": row.id, "type": row.type, "text": row.text}
+                if rows:
+                    continue
+                if task is None or task.done:
+                    return
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._waiters.remove(task_id, waiter)
+
+    def cleanup(self):
+        delete_old_tasks(self.ttl_hours)
+
+    def _start_listener(self):
+        if engine.dialect.name != "postgresql":
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="task-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """LISTEN на отдельном соединении; пока оно недоступно, подписчики опрашивают БД"""
+        while True:
+            connection = None
+            try:
+                raw = engine.raw_connection()
+                raw.detach()
+                connection = raw.driver_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                while True:
+                    if select.select([connection], [], [], 60.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._waiters.wake(connection.notifies.pop(0).payload)
+            except Exception:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+                time.sleep(LISTEN_RETRY)
+
+
+def _make_backend():
+    if settings.TASK_BACKEND == "memory":
+        return MemoryTaskBackend(settings.TASK_LOGS_DIR, settings.TASK_LOG_BUFFER, settings.TASK_TTL_HOURS,
+                                 settings.TASK_LOG_KEEP_DAYS)
+    if settings.TASK_BACKEND == "db":
+        return DatabaseTaskBackend(settings.TASK_TTL_HOURS)
+    raise ValueError("TASK_BACKEND должен быть memory или db")
+
+
+task_backend = _make_backend()
@@ -0,0 +1,194 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+from app.utils.cloud_store import cloud_store
+
+# Предельная глубина октодерева: 8^8 узлов хватает с запасом, а ячейки помещаются в int32
+MAX_OCTREE_DEPTH = 8
+
+
+def octree_cells(xyz: np.ndarray, bbox: dict, depth: int) -> np.ndarray:
+    """
+    Номера ячеек октодерева глубины depth для каждой точки, (N, 3) int32.
+    Корень — куб со стороной по наибольшему размеру облака от bbox["min"].
+    """
+    origin = np.asarray(bbox["min"], dtype=np.float64)
+    size = max(float(np.max(np.asarray(bbox["max"]) - origin)), 1e-6)
+    cells_per_axis = 1 << depth
+    cells = np.floor((xyz - origin) / size * cells_per_axis).astype(np.int32)
+    np.clip(cells, 0, cells_per_axis - 1, out=cells)
+    return cells
+
+
+def tile_bounds(bbox: dict, depth: int, cell) -> dict:
+    origin = np.asarray(bbox["min"], dtype=np.float64)
+    size = max(float(np.max(np.asarray(bbox["max"]) - origin)), 1e-6) / (1 << depth)
+    low = origin + np.asarray(cell) * size
+    return {"min": [float(v) for v in low], "max": [float(v) for v in low + size]}
+
+
+def octree_tiles(xyz: np.ndarray, bbox: dict, depth: int) -> list[dict]:
+    """Непустые узлы октодерева на глубине depth: ключ, количество точек, границы"""
+    if len(xyz) == 0:
+        return []
+    cells = octree_cells(xyz, bbox, depth).astype(np.int64)
+    keys = _tile_keys(cells, depth)
+    unique, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    return [
+        {
+            "tile": format_tile(depth, cells[i]),
+            "count": int(count),
+            "bounds": tile_bounds(bbox, depth, cells[i]),
+        }
+        for i, count in zip(first, counts)
+    ]
+
+
+def format_tile(depth: int, cell) -> str:
+    return f"{depth}/{int(cell[0])}/{int(cell[1])}/{int(cell[2])}"
+
+
+def parse_tile(tile: str) -> tuple[int, tuple[int, int, int]]:
+    """'depth/x/y/z' -> (depth, (x, y, z))"""
+    try:
+        depth, x, y, z = (int(part) for part in tile.split("/"))
+    except ValueError:
+        raise ValueError(f"Неверный ключ тайла: {tile}")
+    if not 0 <= depth <= MAX_OCTREE_DEPTH:
+        raise ValueError(f"Глубина тайла вне 0..{MAX_OCTREE_DEPTH}: {tile}")
+    limit = 1 << depth
+    if not all(0 <= v < limit for v in (x, y, z)):
+        raise ValueError(f"Тайл вне октодерева: {tile}")
+    return depth, (x, y, z)
+
+
+def select_points(
+    phi: np.ndarray,
+    theta: np.ndarray,
+    xyz: np.ndarray,
+    bbox: dict,
+    theta_min: float | None = None,
+    theta_max: float | None = None,
+    phi_min: float | None = None,
+    phi_max: float | None = None,
+    tile: str | None = None,
+) -> np.ndarray:
+    """
+    Индексы точек, попадающих одновременно в диапазон слоёв theta,
+    в сектор phi (если phi_min > phi_max — сектор через 0°) и в тайл октодерева.
+    """
+    mask = np.ones(len(theta), dtype=bool)
+    if theta_min is not None:
+        mask &= theta >= theta_min
+    if theta_max is not None:
+        mask &= theta <= theta_max
+
+    if phi_min is not None or phi_max is not None:
+        low = 0.0 if phi_min is None else phi_min % 360
+        high = 360.0 if phi_max is None or phi_max == 360 else phi_max % 360
+        if low <= high:
+            mask &= (phi >= low) & (phi <= high)
+        else:
+            mask &= (phi >= low) | (phi <= high)
+
+    if tile:
+        depth, cell = parse_tile(tile)
+        idx = np.flatnonzero(mask)
+        cells = octree_cells(xyz[idx], bbox, depth)
+        return idx[np.all(cells == np.asarray(cell, dtype=np.int32), axis=1)]
+
+    return np.flatnonzero(mask)
+
+
+def _tile_keys(cells: np.ndarray, depth: int) -> np.ndarray:
+    cells = cells.astype(np.int64)
+    return (cells[:, 0] << (2 * depth)) | (cells[:, 1] << depth) | cells[:, 2]
+
+
+class TileOrder:
+    """
+    Точки облака, упорядоченные по тайлам октодерева глубины depth:
+    индексы точек тайла — срез order, поиск тайла — бинарный по ключам
+    """
+
+    def __init__(self, xyz: np.ndarray, bbox: dict, depth: int, fingerprint: tuple[int, int]):
+        self.bbox = bbox
+        self.depth = depth
+        self.fingerprint = fingerprint
+        keys = _tile_keys(octree_cells(xyz, bbox, depth), depth)
+        order = np.argsort(keys, kind="stable")
+        self.order = order.astype(np.int32) if len(order) < 2 ** 31 else order
+        self.keys, self.starts, self.counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.keys.nbytes + self.starts.nbytes + self.counts.nbytes
+
+    def tiles(self) -> list[dict]:
+        """То же, что octree_tiles, без прохода по точкам"""
+        mask = (1 << self.depth) - 1
+        result = []
+        for key, count in zip(self.keys.tolist(), self.counts.tolist()):
+            cell = ((key >> (2 * self.depth)) & mask, (key >> self.depth) & mask, key & mask)
+            result.append({
+                "tile": format_tile(self.depth, cell),
+                "count": count,
+                "bounds": tile_bounds(self.bbox, self.depth, cell),
+            })
+        return result
+
+    def indices(self, cell) -> np.ndarray:
+        """Индексы точек тайла (в порядке колонок облака внутри тайла)"""
+        key = (int(cell[0]) << (2 * self.depth)) | (int(cell[1]) << self.depth) | int(cell[2])
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return np.empty(0, dtype=np.int64)
+        return self.order[self.starts[i]:self.starts[i] + self.counts[i]]
+
+
+class TileOrderCache:
+    """
+    TileOrder экспериментов в памяти процесса (как SpatialIndexCache): вытесняются
+    давно не использованные, перестраиваются при изменении облака в кеше
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[tuple[int, str, int], TileOrder] = OrderedDict()
+        self._lock = threading.Lock()
+        self._building: dict[tuple[int, str, int], threading.Lock] = {}
+
+    def get(self, experiment_id: int, source: str, depth: int, xyz: np.ndarray, bbox: dict) -> TileOrder:
+        key = (experiment_id, source, depth)
+        _, header = cloud_store.ensure_header(experiment_id, source)
+        fingerprint = (header["count"], header["max_id"])
+        with self._lock:
+            tile_order = self._items.get(key)
+            if tile_order is not None and tile_order.fingerprint == fingerprint and tile_order.bbox == bbox:
+                self._items.move_to_end(key)
+                return tile_order
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        # Первые запросы узлов одного облака приходят пачкой — сортируем точки один раз
+        with build_lock:
+            with self._lock:
+                tile_order = self._items.get(key)
+                if tile_order is not None and tile_order.fingerprint == fingerprint and tile_order.bbox == bbox:
+                    return tile_order
+            tile_order = TileOrder(xyz, bbox, depth, fingerprint)
+
+            with self._lock:
+                self._items[key] = tile_order
+                self._items.move_to_end(key)
+                total = sum(item.nbytes for item in self._items.values())
+                while total > self.max_bytes and len(self._items) > 1:
+                    _, old = self._items.popitem(last=False)
+                    total -= old.nbytes
+                self._building.pop(key, None)
+        return tile_order
+
+
+tile_orders = TileOrderCache(settings.TILE_INDEX_MAX_BYTES)
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+from app.core.config import settings
+
+
+class UploadError(ValueError):
+    """Ошибка протокола загрузки; status_code — HTTP-код для ответа клиенту"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def merge_ranges(ranges) -> list[list[int]]:
+    """Объединение пересекающихся и смежных диапазонов [start, end)"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class UploadStore:
+    """
+    Промежуточное хранилище загрузок по частям: scans/uploads/{upload_id}/
+        meta.json   — владелец, имя файла, размер, время создания
+        data.part   — файл целиком, части пишутся по своим смещениям
+        ranges/     — по пустому маркеру '{start}_{end}' на каждую принятую часть
+        finalizing  — маркер сборки эксперимента (создаётся с O_EXCL, один на загрузку)
+        result.json — ответ завершённой сборки, отдаётся на повторный finalize
+
+    Маркеры создаются после записи данных, поэтому принятые диапазоны
+    переживают обрыв связи и перезапуск сервера, а параллельные запросы
+    (в том числе из разных воркеров) не мешают друг другу.
+    """
+
+    def __init__(self, root: Path, chunk_size: int, max_bytes: int, ttl_hours: int):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_hours * 3600
+
+    def _dir(self, upload_id: str) -> Path:
+        # upload_id приходит из URL — пускаем только то, что выдали сами
+        if len(upload_id) != 32 or not all(c in "0123456789abcdef" for c in upload_id):
+            raise UploadError("Загрузка не найдена", 404)
+        return self.root / upload_id
+
+    def data_path(self, upload_id: str) -> Path:
+        return self._dir(upload_id) / "data.part"
+
+    def _meta(self, upload_id: str, user_id: int) -> dict:
+        try:
+            meta = json.loads((self._dir(upload_id) / "meta.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise UploadError("Загрузка не найдена", 404)
+        if meta["user_id"] != user_id:
+            raise UploadError("Загрузка не найдена", 404)
+        return meta
+
+    def _ranges(self, upload_id: str) -> list[list[int]]:
+        ranges = []
+        try:
+            markers = list((self._dir(upload_id) / "ranges").iterdir())
+        except FileNotFoundError:
+            # Загрузку удалили параллельно (discard или cleanup)
+            raise UploadError("Загрузка не найдена", 404)
+        for marker in markers:
+            start, end = marker.name.split("_")
+            ranges.append((int(start), int(end)))
+        return merge_ranges(ranges)
+
+    def create(self, user_id: int, filename: str, size: int, sha256: str | None = None) -> dict:
+        """Новая загрузка: резервируем файл нужного размера"""
+        if size <= 0:
+            raise UploadError("Пустой файл")
+        if size > self.max_bytes:
+            raise UploadError("Файл слишком большой", 413)
+        self.cleanup()
+
+        upload_id = uuid.uuid4().hex
+        directory = self.root / upload_id
+        (directory / "ranges").mkdir(parents=True)
+        with open(directory / "data.part", "wb") as f:
+            f.truncate(size)
+
+        meta = {
+            "user_id": user_id,
+            "filename": os.path.basename(filename),
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "created": time.time(),
+        }
+        (directory / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        return self.status(upload_id, user_id)
+
+    def write_chunk(self, upload_id: str, user_id: int, offset: int, data: bytes,
+                    sha256: str | None = None) -> dict:
+        """Запись части по смещению; при переданной контрольной сумме сначала проверяем её"""
+        meta = self._meta(upload_id, user_id)
+        if (self._dir(upload_id) / "finalizing").exists():
+            raise UploadError("Загрузка уже завершается", 409)
+        end = offset + len(data)
+        if not data:
+            raise UploadError("Пустая часть")
+        if offset < 0 or end > meta["size"]:
+            raise UploadError("Часть выходит за границы файла", 416)
+        if sha256 and hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise UploadError("Контрольная сумма части не совпадает", 422)
+
+        fd = os.open(self.data_path(upload_id), os.O_WRONLY)
+        try:
+            written = 0
+            while written < len(data):
+                written += os.pwrite(fd, data[written:], offset + written)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        (self._dir(upload_id) / "ranges" / f"{offset}_{end}").touch()
+        return self.status(upload_id, user_id)
+
+    def status(self, upload_id: str, user_id: int) -> dict:
+        """Что уже принято и какие диапазоны осталось дослать"""
+        meta = self._meta(upload_id, user_id)
+        received = self._ranges(upload_id)
+        missing, position = [], 0
+        for start, end in received:
+            if start > position:
+                missing.append([position, start])
+            position = end
+        if position < meta["size"]:
+            missing.append([position, meta["size"]])
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "chunk_size": self.chunk_size,
+            "received_bytes": sum(end - start for start, end in received),
+            "missing": missing,
+            "complete": not missing,
+        }
+
+    def complete_path(self, upload_id: str, user_id: int) -> tuple[Path, str]:
+        """Путь к собранному файлу и его исходное имя; проверяет полноту и общую сумму"""
+        meta = self._meta(upload_id, user_id)
+        if (self._dir(upload_id) / "result.json").exists():
+            raise UploadError("Загрузка уже завершена", 409)
+        if not self.status(upload_id, user_id)["complete"]:
+            raise UploadError("Файл загружен не полностью", 409)
+
+        path = self.data_path(upload_id)
+        if meta["sha256"]:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(self.chunk_size), b""):
+                    digest.update(block)
+            if digest.hexdigest() != meta["sha256"]:
+                raise UploadError("Контрольная сумма файла не совпадает", 422)
+        return path, meta["filename"]
+
+    def begin_finalize(self, upload_id: str, user_id: int) -> dict | None:
+        """
+        Захват сборки эксперимента: None — можно собирать; ответ первой сборки, если она
+        уже завершена; 409, если она ещё идёт (клиент повторил запрос по таймауту)
+        """
+        self._meta(upload_id, user_id)
+        directory = self._dir(upload_id)
+        try:
+            return json.loads((directory / "result.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(directory / "finalizing", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise UploadError("Загрузка уже обрабатывается", 409)
+        except FileNotFoundError:
+            raise UploadError("Загрузка не найдена", 404)
+        return None
+
+    def finish_finalize(self, upload_id: str, result: dict):
+        """Эксперимент создан: запоминаем ответ, сам файл больше не нужен"""
+        directory = self._dir(upload_id)
+        tmp = directory / f"result.{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(result), encoding="utf-8")
+        tmp.replace(directory / "result.json")
+        (directory / "data.part").unlink(missing_ok=True)
+
+    def abort_finalize(self, upload_id: str):
+        """Сборка не удалась — загрузку можно завершить ещё раз"""
+        (self._dir(upload_id) / "finalizing").unlink(missing_ok=True)
+
+    def discard(self, upload_id: str, user_id: int | None = None):
+        if user_id is not None:
+            self._meta(upload_id, user_id)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def cleanup(self):
+        """Удаляем брошенные загрузки старше UPLOAD_TTL_HOURS"""
+        if not self.root.exists():
+            return
+        deadline = time.time() - self.ttl_seconds
+        for directory in self.root.iterdir():
+            try:
+                # Каждая принятая часть добавляет маркер и обновляет mtime ranges/
+                if (directory / "ranges").stat().st_mtime < deadline:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+
+upload_store = UploadStore(
+    settings.UPLOADS_DIR,
+    settings.UPLOAD_CHUNK_SIZE,
+    settings.UPLOAD_MAX_BYTES,
+    settings.UPLOAD_TTL_HOURS,
+)
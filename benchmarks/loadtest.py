@@ -0,0 +1,369 @@
+"""
+Нагрузочный тест работающего сервера (uvicorn main:app): много одновременных
+зрителей и операторов установки.
+
+  зритель   — вход (bcrypt), список экспериментов, открытие облака как во вьювере
+              (страница, сводка, превью, список узлов октодерева, узлы), сводка
+  оператор  — вход, загрузка скана файлом, запуск скана на установке
+              и чтение журнала по WebSocket до конца, список экспериментов
+
+Установку заменяет имитация benchmarks/mock_lidar.py (--mock-lidar-port запускает
+её в этом же процессе); сервер должен быть запущен с LIDAR_HOST=127.0.0.1 и
+LIDAR_PORT=<тот же порт>. Итог: по каждой операции — число, ошибки, запросов/с,
+перцентили задержки; --output сохраняет его в JSON.
+
+    LIDAR_HOST=127.0.0.1 LIDAR_PORT=2222 uvicorn main:app --port 8000
+    python -m benchmarks.loadtest --base-url http://127.0.0.1:8000 --viewers 50 --operators 4 \\
+        --duration 120 --mock-lidar-port 2222 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+import numpy as np
+import websockets
+
+from benchmarks.mock_lidar import MockLidar
+from benchmarks.synthetic import make_experiment, scan_text
+
+# Глубина октодерева и загрузка узлов — как во вьювере (TILE_POINTS, MAX_TILE_DEPTH,
+# MAX_NODE_REQUESTS и POINT_BUDGET в static/js/view_cloud.js)
+TILE_POINTS = 100_000
+MAX_TILE_DEPTH = 6
+MAX_NODE_REQUESTS = 4
+POINT_BUDGET = 8_000_000
+# Веса действий в сценариях
+VIEWER_ACTIONS = {"login": 1, "listing": 3, "open_cloud": 2, "summary": 2}
+OPERATOR_ACTIONS = {"upload": 1, "scan": 2, "listing": 1}
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Stats:
+    """Задержки, ошибки и объём ответов по операциям"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_messages = defaultdict(set)
+        self.bytes = defaultdict(int)
+
+    def record(self, operation: str, seconds: float, ok: bool = True, size: int = 0, message: str | None = None):
+        self.samples[operation].append(seconds)
+        self.bytes[operation] += size
+        if not ok:
+            self.errors[operation] += 1
+            if message and len(self.error_messages[operation]) < 5:
+                self.error_messages[operation].add(message[:200])
+
+    def report(self, elapsed: float) -> dict:
+        operations = {}
+        for operation in sorted(set(self.samples) | set(self.errors)):
+            samples = np.asarray(self.samples[operation]) if self.samples[operation] else np.zeros(1)
+            count = len(self.samples[operation])
+            operations[operation] = {
+                "count": count,
+                "errors": self.errors[operation],
+                "error_rate": round(self.errors[operation] / count, 4) if count else 1.0,
+                "rps": round(count / elapsed, 2),
+                "mb": round(self.bytes[operation] / 2 ** 20, 1),
+                **{f"p{p}": round(float(np.percentile(samples, p)), 4) for p in PERCENTILES},
+                "max": round(float(samples.max()), 4),
+                "error_messages": sorted(self.error_messages[operation]),
+            }
+        return operations
+
+
+class VirtualUser:
+    def __init__(self, base_url: str, username: str, password: str, stats: Stats, timeout: float):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout, follow_redirects=False)
+        self.user_id = None
+
+    async def call(self, operation: str, method: str, url: str, expect=(200,), **kwargs):
+        """Запрос с замером; None — ошибка (статус не из expect или исключение)"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(operation, time.perf_counter() - started, ok=False, message=repr(e))
+            return None
+        ok = response.status_code in expect
+        self.stats.record(operation, time.perf_counter() - started, ok, len(response.content),
+                          None if ok else f"HTTP {response.status_code}")
+        return response if ok else None
+
+    async def register(self):
+        await self.call("register", "POST", "/registration", expect=(303,), data={
+            "username": self.username, "email": f"{self.username}@example.com",
+            "password": self.password, "password2": self.password,
+        })
+
+    async def login(self) -> bool:
+        response = await self.call("login", "POST", "/login", expect=(303,),
+                                   data={"username": self.username, "password": self.password})
+        if response is None:
+            return False
+        self.user_id = int(response.headers["location"].strip("/"))
+        return True
+
+    async def listing(self):
+        await self.call("listing", "GET", f"/{self.user_id}/check")
+
+    async def summary(self, experiment_id: int):
+        response = await self.call("cloud.summary", "GET",
+                                   f"/{self.user_id}/api/experiments/{experiment_id}/summary?source=local")
+        if response is None:
+            return None
+        body = response.json()
+        return body.get("summary") if body.get("ok") else None
+
+    async def open_cloud(self, experiment_id: int):
+        """
+        Как loadVisualization во вьювере: страница, сводка, превью, список узлов (/tiles)
+        и узлы (/chunk?tile=). Камеры нет — грузим все узлы в пределах POINT_BUDGET,
+        не больше MAX_NODE_REQUESTS одновременно, как при обзоре облака целиком
+        """
+        started = time.perf_counter()
+        base = f"/{self.user_id}/api/experiments/{experiment_id}"
+        ok = await self.call("cloud.page", "GET", f"/{self.user_id}/check/experiments/{experiment_id}?source=local")
+        summary = await self.summary(experiment_id)
+        if summary and summary.get("status") == "ready":
+            ok = ok and await self.call("cloud.preview", "GET", f"{base}/cartesian?source=local&preview=true")
+            depth = tile_depth(summary.get("points_count") or 0)
+            response = ok and await self.call("cloud.tiles", "GET", f"{base}/tiles?source=local&depth={depth}")
+            ok = bool(response)
+            if ok:
+                requests = asyncio.Semaphore(MAX_NODE_REQUESTS)
+
+                async def node(tile: str):
+                    async with requests:
+                        return await self.call("cloud.node", "GET", f"{base}/chunk?source=local&tile={tile}")
+
+                nodes = await asyncio.gather(*(node(tile) for tile in budget_tiles(response.json()["tiles"])))
+                ok = all(nodes)
+        else:
+            ok = ok and await self.call("cloud.measurements", "GET", f"{base}/measurements?source=local")
+        self.stats.record("cloud.open", time.perf_counter() - started, bool(ok))
+
+    async def upload(self, scan: bytes) -> int | None:
+        response = await self.call("upload", "POST", f"/{self.user_id}/create/import", data={
+            "date": "2025-01-01T12:00", "room_description": "load test", "address": "load test",
+            "object_description": "synthetic room",
+        }, files={"cloud_file": ("scan.txt", scan, "text/plain")})
+        if response is None:
+            return None
+        body = response.json()
+        if body.get("status") != "success":
+            self.stats.record("upload.rejected", 0.0, ok=False, message=body.get("message"))
+            return None
+        return body["experiment_id"]
+
+    async def scan(self, scan_range: int, scan_step: int):
+        """Запуск скана и чтение журнала по WebSocket до закрытия"""
+        response = await self.call("scan.start", "POST", "/api/lidar/start", json={
+            "scan_range": scan_range, "scan_step": scan_step, "lidar_duration": 1, "pulse_delay": 1,
+        })
+        if response is None:
+            return
+        task_id = response.json()["task_id"]
+        url = self.base_url.replace("http", "ws", 1) + f"/api/lidar/ws/{task_id}"
+        started = time.perf_counter()
+        messages, ok, error = 0, True, None
+        try:
+            async with websockets.connect(url, open_timeout=10) as ws:
+                self.stats.record("scan.ws_connect", time.perf_counter() - started)
+                async for raw in ws:
+                    messages += 1
+                    message = json.loads(raw)
+                    if message.get("type") == "err":
+                        ok, error = False, message.get("text")
+        except (OSError, websockets.WebSocketException) as e:
+            ok, error = False, repr(e)
+        self.stats.record("scan.log", time.perf_counter() - started, ok, messages, error)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def tile_depth(points_count: int) -> int:
+    """Глубина октодерева примерно по TILE_POINTS точек в узле (tileDepth во вьювере)"""
+    depth = math.ceil(math.log(max(points_count, 1) / TILE_POINTS, 8))
+    return min(MAX_TILE_DEPTH, max(1, depth))
+
+
+def budget_tiles(tiles: list[dict]) -> list[str]:
+    """Ключи узлов, которые поместятся в POINT_BUDGET"""
+    keys, loaded = [], 0
+    for tile in tiles:
+        if loaded + tile["count"] > POINT_BUDGET:
+            break
+        keys.append(tile["tile"])
+        loaded += tile["count"]
+    return keys
+
+
+def choose(actions: dict) -> str:
+    return random.choices(list(actions), weights=list(actions.values()))[0]
+
+
+async def viewer(user: VirtualUser, experiment_id: int, deadline: float, think: float):
+    if not await user.login():
+        return
+    while time.monotonic() < deadline:
+        action = choose(VIEWER_ACTIONS)
+        if action == "login":
+            await user.login()
+        elif action == "listing":
+            await user.listing()
+        elif action == "open_cloud":
+            await user.open_cloud(experiment_id)
+        else:
+            await user.summary(experiment_id)
+        await asyncio.sleep(random.expovariate(1 / think) if think else 0)
+
+
+async def operator(user: VirtualUser, scan: bytes, args, deadline: float):
+    if not await user.login():
+        return
+    while time.monotonic() < deadline:
+        action = choose(OPERATOR_ACTIONS)
+        if action == "upload":
+            await user.upload(scan)
+        elif action == "scan":
+            await user.scan(args.scan_range, args.scan_step)
+        else:
+            await user.listing()
+        await asyncio.sleep(random.expovariate(1 / args.think) if args.think else 0)
+
+
+async def wait_ready(user: VirtualUser, experiment_id: int, timeout: float) -> bool:
+    """Ждём артефакты эксперимента, чтобы зрители шли быстрым путём вьювера"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        summary = await user.summary(experiment_id)
+        if summary and summary.get("status") in ("ready", "error"):
+            return summary["status"] == "ready"
+        await asyncio.sleep(1)
+    return False
+
+
+async def run(args) -> dict:
+    # Подготовка (регистрация, загрузка облака) считается отдельно от нагрузки
+    setup, stats = Stats(), Stats()
+    run_id = uuid.uuid4().hex[:6]
+    users = [
+        VirtualUser(args.base_url, f"lt{run_id}{i}", args.password, setup, args.timeout)
+        for i in range(args.viewers + args.operators)
+    ]
+    setup_started = time.monotonic()
+    await asyncio.gather(*(user.register() for user in users))
+
+    experiment_id = args.experiment
+    if experiment_id is None:
+        print(f"Загрузка облака на {args.cloud_points} точек для зрителей...")
+        seed = users[0]
+        await seed.login()
+        experiment_id = await seed.upload(scan_text(*make_experiment(args.cloud_points)))
+        if experiment_id is None:
+            raise SystemExit(f"Не удалось загрузить облако: {dict(setup.error_messages)}")
+        ready = await wait_ready(seed, experiment_id, args.ready_timeout)
+        print(f"Эксперимент {experiment_id}, артефакты {'готовы' if ready else 'не готовы'}")
+
+    setup_elapsed = time.monotonic() - setup_started
+    upload_scan = scan_text(*make_experiment(args.upload_points, seed=1))
+    for user in users:
+        user.stats = stats
+
+    started = time.monotonic()
+    deadline = started + args.ramp_up + args.duration
+    tasks = []
+    for i, user in enumerate(users):
+        # Пользователи подключаются равномерно за ramp_up секунд
+        delay = args.ramp_up * i / max(len(users), 1)
+        if i < args.viewers:
+            coro = viewer(user, experiment_id, deadline, args.think)
+        else:
+            coro = operator(user, upload_scan, args, deadline)
+        tasks.append(asyncio.create_task(delayed(delay, coro)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started
+    await asyncio.gather(*(user.close() for user in users))
+
+    return {
+        "base_url": args.base_url,
+        "viewers": args.viewers,
+        "operators": args.operators,
+        "duration": round(elapsed, 1),
+        "experiment_id": experiment_id,
+        "operations": stats.report(elapsed),
+        "setup": setup.report(setup_elapsed),
+    }
+
+
+async def delayed(delay: float, coro):
+    await asyncio.sleep(delay)
+    await coro
+
+
+def print_report(report: dict):
+    print(f"\n{report['viewers']} зрителей, {report['operators']} операторов, {report['duration']} с")
+    header = f"  {'операция':<20} {'число':>7} {'ошибки':>7} {'в сек':>7}" + "".join(
+        f" {'p' + str(p):>8}" for p in PERCENTILES) + f" {'max':>8} {'МБ':>8}"
+    print(header)
+    for name, item in report["operations"].items():
+        print(f"  {name:<20} {item['count']:>7} {item['errors']:>7} {item['rps']:>7.2f}"
+              + "".join(f" {item[f'p{p}']:>8.3f}" for p in PERCENTILES)
+              + f" {item['max']:>8.3f} {item['mb']:>8.1f}")
+        for message in item["error_messages"]:
+            print(f"      ! {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--operators", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=60, help="длительность после разгона, с")
+    parser.add_argument("--ramp-up", type=float, default=10, help="за сколько секунд подключаются все пользователи")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза между действиями, с")
+    parser.add_argument("--timeout", type=float, default=120, help="таймаут запроса, с")
+    parser.add_argument("--password", default="LoadTest-1")
+    parser.add_argument("--experiment", type=int, help="облако для зрителей; по умолчанию загружается новое")
+    parser.add_argument("--cloud-points", type=int, default=1_000_000)
+    parser.add_argument("--upload-points", type=int, default=200_000, help="размер скана, загружаемого операторами")
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--scan-range", type=int, default=60)
+    parser.add_argument("--scan-step", type=int, default=1)
+    parser.add_argument("--mock-lidar-port", type=int, help="запустить имитацию установки на этом порту")
+    parser.add_argument("--layer-delay", type=float, default=0.05, help="пауза на слой скана в имитации, с")
+    parser.add_argument("--output", help="куда записать итог JSON")
+    args = parser.parse_args()
+
+    lidar = None
+    if args.mock_lidar_port:
+        lidar = MockLidar(args.mock_lidar_port, layer_delay=args.layer_delay).start()
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        if lidar is not None:
+            lidar.close()
+    if lidar is not None:
+        report["mock_lidar_commands"] = lidar.commands
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Имитация установки (Raspberry Pi) для нагрузочных тестов: SSH-сервер на paramiko,
+который понимает команды app/api/v1/lidar.py и отвечает как настоящие скрипты:
+
+  cd ... && echo ok / pwd                     — проверка каталога (/ping, /connect)
+  ... && python lidar.py / engine.py          — короткий тест с несколькими строками вывода
+  ... && python scan.py --scan_range ... ...  — скан: строка прогресса на каждый слой
+
+Сервер под нагрузкой нужно запустить с LIDAR_HOST=127.0.0.1 и LIDAR_PORT=<порт>.
+
+    python -m benchmarks.mock_lidar --port 2222 --layer-delay 0.05
+"""
+import argparse
+import re
+import shlex
+import socket
+import threading
+import time
+
+import paramiko
+
+
+class LidarServer(paramiko.ServerInterface):
+    def __init__(self, username: str, password: str, handler):
+        self.username = username
+        self.password = password
+        self.handler = handler
+
+    def check_auth_password(self, username, password):
+        if username == self.username and password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.handler, args=(channel, command.decode("utf-8")), daemon=True).start()
+        return True
+
+
+class MockLidar:
+    """SSH-сервер в фоновых потоках; каждая команда выполняется в своём потоке"""
+
+    def __init__(self, port: int = 2222, host: str = "127.0.0.1", username: str = "vr",
+                 password: str = "vr", remote_path: str = "/home/vr/Desktop/lidar",
+                 layer_delay: float = 0.05):
+        self.address = (host, port)
+        self.username = username
+        self.password = password
+        self.remote_path = remote_path
+        self.layer_delay = layer_delay
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.commands = 0
+        self._lock = threading.Lock()
+        self._socket = None
+        self._closed = threading.Event()
+
+    def start(self) -> "MockLidar":
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(self.address)
+        self._socket.listen(128)
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def close(self):
+        self._closed.set()
+        if self._socket is not None:
+            self._socket.close()
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=LidarServer(self.username, self.password, self._run_command))
+        except (paramiko.SSHException, EOFError, OSError):
+            transport.close()
+            return
+        # Транспорт живёт, пока клиент не закроет соединение
+        while transport.is_active() and not self._closed.is_set():
+            time.sleep(0.5)
+        transport.close()
+
+    def _run_command(self, channel, command: str):
+        with self._lock:
+            self.commands += 1
+        # Рабочая часть команды — после последнего '&&' (cd и активация venv пропускаем)
+        tail = command.split("&&")[-1].strip()
+        try:
+            if tail == "echo ok":
+                self._finish(channel, "ok\n", 0)
+            elif tail == "pwd":
+                self._finish(channel, self.remote_path + "\n", 0)
+            elif re.match(r"python (lidar|engine)\.py$", tail):
+                for step in range(5):
+                    if not self._send(channel, f"[{step + 1}/5] {tail.split()[1]}: ok\n"):
+                        return
+                    time.sleep(self.layer_delay)
+                self._finish(channel, "done\n", 0)
+            elif tail.startswith("python scan.py"):
+                self._scan(channel, shlex.split(tail)[2:])
+            else:
+                channel.sendall_stderr(f"unknown command: {tail}\n".encode())
+                self._finish(channel, "", 127)
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+
+    def _scan(self, channel, argv: list[str]):
+        options = dict(zip(argv[::2], argv[1::2]))
+        scan_range = float(options.get("--scan_range", 180))
+        scan_step = float(options.get("--scan_step", 1)) or 1.0
+        layers = max(int(scan_range / scan_step), 1)
+        filename = options.get("--filename", "scans/scan.txt")
+        if not self._send(channel, f"Скан {filename}: {layers} слоёв\n"):
+            return
+        for layer in range(layers):
+            time.sleep(self.layer_delay)
+            if not self._send(channel, f"слой {layer + 1}/{layers}, theta={layer * scan_step:.1f}\n"):
+                return
+        self._finish(channel, f"Сохранено: {filename}\n", 0)
+
+    @staticmethod
+    def _send(channel, text: str) -> bool:
+        """False — клиент закрыл канал (остановка скана)"""
+        if channel.closed:
+            return False
+        channel.sendall(text.encode("utf-8"))
+        return True
+
+    @staticmethod
+    def _finish(channel, text: str, code: int):
+        if text:
+            channel.sendall(text.encode("utf-8"))
+        channel.send_exit_status(code)
+        channel.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2222)
+    parser.add_argument("--user", default="vr")
+    parser.add_argument("--password", default="vr")
+    parser.add_argument("--layer-delay", type=float, default=0.05, help="пауза на слой скана, с")
+    args = parser.parse_args()
+
+    server = MockLidar(args.port, args.host, args.user, args.password, layer_delay=args.layer_delay).start()
+    print(f"Имитация установки на {args.host}:{args.port} (Ctrl+C — выход)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Замер скорости серверного разбора файла скана (app/utils/scan_parser.py).
+
+Генерирует синтетический файл 'phi;r;theta' на несколько миллионов строк
+и разбирает его как есть и сжатым gzip.
+
+    python -m benchmarks.parse_scan --lines 2000000 5000000
+"""
+import argparse
+import gzip
+import time
+
+import numpy as np
+
+from app.utils.scan_parser import ScanParseError, parse_scan_text, scan_summary
+
+
+def make_scan(lines: int, points_per_layer: int = 2000, seed: int = 0) -> bytes:
+    """Файл в формате установки: слои по theta с шагом 0.5°, по points_per_layer точек"""
+    rng = np.random.default_rng(seed)
+    phi = rng.uniform(0, 360, lines)
+    r = rng.uniform(100, 9000, lines)
+    theta = (np.arange(lines) // points_per_layer) * 0.5 % 240
+    rows = np.column_stack([phi, r, theta])
+    text = "\n".join(f"{p:.2f};{d:.1f};{t:.1f}" for p, d, t in rows.tolist())
+    return text.encode("ascii")
+
+
+def measure(name: str, func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"  {name:<22} {elapsed:8.3f} с")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        data = make_scan(lines)
+        packed = gzip.compress(data, compresslevel=6)
+        print(f"{lines} строк, {len(data) / 2**20:.1f} МБ (gzip {len(packed) / 2**20:.1f} МБ)")
+
+        elapsed = measure("разбор", parse_scan_text, data)
+        measure("разбор gzip", parse_scan_text, packed)
+        phi, theta, r = parse_scan_text(data)
+        measure("сводка", scan_summary, phi, theta, r)
+        print(f"  {lines / elapsed / 1e6:.2f} млн строк/с")
+
+        broken = data + b"\n1.0;abc;2.0\n3.0;4.0\n"
+        started = time.perf_counter()
+        try:
+            parse_scan_text(broken)
+        except ScanParseError as e:
+            print(f"  {'файл с ошибками':<22} {time.perf_counter() - started:8.3f} с, {e.errors}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Синтетические сканы для бенчмарков: комната-параллелепипед, снятая установкой
+слоями по theta, с шумом дальности и пропусками отражений.
+"""
+import json
+
+import numpy as np
+
+# Размеры комнаты, мм (от установки до стен по x, y и до пола/потолка)
+ROOM = {"x": (-3200.0, 4100.0), "y": (-2500.0, 2900.0), "z": (-1400.0, 1600.0)}
+THETA_STEP = 0.5
+THETA_MAX = 180.0
+
+
+def make_experiment(points: int, seed: int = 0):
+    """
+    phi, theta, r (float64) на points точек: слои theta с шагом THETA_STEP,
+    по каждому слою равномерный phi с дрожанием; r — расстояние до стен комнаты
+    вдоль луча, шум ~5 мм и ~1% нулевых дальностей (нет отражения).
+    """
+    rng = np.random.default_rng(seed)
+    layers = int(THETA_MAX / THETA_STEP)
+    per_layer = -(-points // layers)
+
+    theta = np.repeat(np.arange(layers) * THETA_STEP, per_layer)[:points]
+    phi = (np.tile(np.linspace(0.0, 360.0, per_layer, endpoint=False), layers)[:points]
+           + rng.normal(0.0, 0.02, points)) % 360.0
+
+    # Луч из центра установки: theta от вертикали, phi — азимут
+    t, p = np.radians(theta), np.radians(phi)
+    direction = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hits = []
+        for axis, (low, high) in zip(direction, ROOM.values()):
+            wall = np.where(axis > 0, high, low)
+            hits.append(np.where(axis != 0, wall / axis, np.inf))
+    r = np.min(np.abs(hits), axis=0) + rng.normal(0.0, 5.0, points)
+    r[rng.random(points) < 0.01] = 0.0
+    return phi, theta, np.round(np.clip(r, 0.0, None), 1)
+
+
+def measurements_json(phi, theta, r) -> bytes:
+    """Тело файла для /create/save: {"measurements": [{"phi", "theta", "r"}, ...]}"""
+    items = [
+        {"phi": a, "theta": b, "r": c}
+        for a, b, c in zip(np.round(phi, 4).tolist(), theta.tolist(), r.tolist())
+    ]
+    return json.dumps({"measurements": items}).encode("utf-8")
+
+
+def scan_text(phi, theta, r) -> bytes:
+    """Файл в формате установки: строки 'phi;r;theta'"""
+    rows = np.column_stack([phi, r, theta]).tolist()
+    return "\n".join(f"{a:.2f};{c:.1f};{b:.1f}" for a, c, b in rows).encode("ascii")
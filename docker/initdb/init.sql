@@ -23,6 +23,8 @@ CREATE TABLE IF NOT EXISTS measurements (
     r                  FLOAT                       NOT NULL
 );
 
+CREATE INDEX IF NOT EXISTS ix_measurements_experiment_id ON measurements (experiment_id);
+
 ---- 2. Сидаем тестовых пользователей (пароли — заранее захешируйте bcrypt)
 --INSERT INTO users (user_name, user_password, email) VALUES
 --('alice', '$2b$12$CZ1J4w3tp7rJTQWJ60Ja0.fgdqBwa5lCPqbKlscgWOAdyYv5E.kJq', 'alice@example.com'),
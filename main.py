@@ -1,23 +1,58 @@
 # -*- coding: utf-8 -*-
+import time
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response
 from fastapi.exception_handlers import http_exception_handler as default_http_handler
 from fastapi.openapi.utils import get_openapi
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
 from app.api.v1.web import router as web_router
 from app.api.v1.lidar import router as lidar_router
+from app.api.v1.cloud import router as cloud_router
+from app.api.v1.upload import router as upload_router
+from app.api.v1.spatial import router as spatial_router
+from app.api.v1.registration import router as registration_router
+from app.api.v1.filtering import router as filtering_router
+from app.api.v1.jobs import router as jobs_router
+from app.api.v1.profiles import router as profiles_router
+from app.core.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS
+from app.core.profiling import ProfileMiddleware
+from app.core.security import password_hasher
+from app.crud.device import ensure_default_device
 from app.db.base import Base
 from app.db.session import engine
+from app.utils.jobs import fail_interrupted_jobs, job_manager
+from app.utils.lidar_fleet import release_stale_claims
 
 # Авто-создаём все таблицы (для разработки)
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Lidar API")
 
+
+# Пул задач живёт в памяти процесса: незавершённые задачи умерших процессов уже не выполнятся
+@app.on_event("startup")
+def mark_interrupted_jobs():
+    fail_interrupted_jobs()
+
+
+# Реестр установок: установка из LIDAR_* для пустого реестра, занятость от умерших процессов снимаем
+@app.on_event("startup")
+def prepare_lidar_devices():
+    ensure_default_device()
+    release_stale_claims()
+
+
+@app.on_event("shutdown")
+def stop_job_pool():
+    job_manager.shutdown()
+    password_hasher.shutdown()
+
+
 #Чтобы читались картинки из .md файлов
 DOCS_DIR = Path(__file__).parent / "docs"
 app.mount("/docs", StaticFiles(directory=DOCS_DIR), name="docs")
@@ -65,6 +100,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики запросов: метка — шаблон пути роута, а не сам путь, чтобы не плодить ряды
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    HTTP_REQUESTS_IN_PROGRESS.labels(request.method).inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_PROGRESS.labels(request.method).dec()
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status),
+        ).observe(time.perf_counter() - started)
+
+
+# Профиль запроса по X-Profile: 1 / ?profile=1 или по выборке PROFILE_SAMPLE_RATE
+app.add_middleware(ProfileMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # favicon
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -83,4 +146,11 @@ async def auth_http_exception_handler(request: Request, exc: HTTPException):
 
 # Все ваши веб-роуты в одном месте
 app.include_router(web_router)
+app.include_router(cloud_router)
+app.include_router(upload_router)
+app.include_router(spatial_router)
+app.include_router(registration_router)
+app.include_router(filtering_router)
+app.include_router(jobs_router)
+app.include_router(profiles_router)
 app.include_router(lidar_router, prefix="/api/lidar")
\ No newline at end of file
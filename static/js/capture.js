@@ -44,11 +44,44 @@ document.addEventListener("DOMContentLoaded", () => {
   const inputDuration = document.getElementById("lidar_duration");
   const inputPulseDelay = document.getElementById("pulse_delay");
 
+  const selectDevice = document.getElementById("device_id");
+  const checkSaveExperiment = document.getElementById("save_experiment");
+  const inputAddress = document.getElementById("exp_address");
+  const inputRoom = document.getElementById("exp_room");
+  const inputObject = document.getElementById("exp_object");
+
   let isConnected = false;
   let currentTaskId = null;
   let currentFilename = null;
+  let currentScanTaskId = null;
   let ws = null;
 
+  // Выбранная установка; пусто — любая свободная (проверка связи — первая в реестре)
+  function deviceBody(body) {
+    const deviceId = selectDevice?.value;
+    return deviceId ? { ...(body || {}), device_id: Number(deviceId) } : (body || {});
+  }
+
+  async function loadDevices() {
+    if (!selectDevice) return;
+    try {
+      const resp = await fetch("/api/lidar/devices");
+      if (!resp.ok) return;
+      const data = await resp.json();
+      for (const device of data.devices) {
+        const option = document.createElement("option");
+        option.value = device.id;
+        option.textContent = `${device.name} (${device.status}${device.queued ? ", в очереди " + device.queued : ""})`;
+        option.disabled = !device.enabled;
+        selectDevice.appendChild(option);
+      }
+    } catch (e) {
+      log("[-] Не удалось получить список установок: " + e.message);
+    }
+  }
+
+  loadDevices();
+
   async function postJson(path, body) {
     const resp = await fetch(path, {
       method: "POST",
@@ -65,7 +98,7 @@ document.addEventListener("DOMContentLoaded", () => {
   btnCheck?.addEventListener("click", async () => {
     log("[+] Проверка соединения с лидаром...");
     try {
-      const resp = await postJson("/api/lidar/ping", {});
+      const resp = await postJson("/api/lidar/ping", deviceBody());
       if (resp.ok) log("[+] Лидар доступен");
       else log("[-] Лидар недоступен");
     } catch (e) {
@@ -76,7 +109,7 @@ document.addEventListener("DOMContentLoaded", () => {
   btnConnect?.addEventListener("click", async () => {
     log("[+] Подключение к Raspberry Pi...");
     try {
-      const resp = await postJson("/api/lidar/connect", {});
+      const resp = await postJson("/api/lidar/connect", deviceBody());
       if (resp.ok) {
         isConnected = true;
         log("[+] Подключение установлено");
@@ -93,20 +126,28 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
-    async function openLogWs(taskId) {
+    // Номер последнего полученного сообщения журнала: после обрыва
+    // переподключаемся и получаем только пропущенное
+    let lastSeq = 0;
+
+    async function openLogWs(taskId, resume = false) {
       if (ws) {
-        try { ws.close(); } catch (e) { }
+        const old = ws;
         ws = null;
+        try { old.close(); } catch (e) { }
       }
+      if (!resume) lastSeq = 0;
       const protocol = (location.protocol === "https:") ? "wss:" : "ws:";
-      const url = `${protocol}//${location.host}/api/lidar/ws/${taskId}`;
-      ws = new WebSocket(url);
+      const url = `${protocol}//${location.host}/api/lidar/ws/${taskId}?after=${lastSeq}`;
+      const socket = new WebSocket(url);
+      ws = socket;
 
-      ws.onopen = () => log(`[+] Подключен к логам (task ${taskId})`);
+      socket.onopen = () => log(`[+] Подключен к логам (task ${taskId})`);
 
-      ws.onmessage = ev => {
+      socket.onmessage = ev => {
         try {
           const obj = JSON.parse(ev.data);
+          if (obj.seq) lastSeq = obj.seq;
           if (obj.type === "out") {
             log(obj.text);
           } else if (obj.type === "err") {
@@ -134,14 +175,23 @@ document.addEventListener("DOMContentLoaded", () => {
         }
       };
 
-      ws.onclose = () => log("[*] WebSocket логов закрыт");
-      ws.onerror = e => log("[!] WebSocket ошибка");
+      socket.onclose = ev => {
+        log("[*] WebSocket логов закрыт");
+        // Сервер закрывает журнал кодом 1000, когда команда завершена;
+        // иначе это обрыв — переподключаемся с последнего сообщения
+        if (ws === socket && ev.code !== 1000 && currentTaskId === taskId) {
+          setTimeout(() => {
+            if (ws === socket) openLogWs(taskId, true);
+          }, 1000);
+        }
+      };
+      socket.onerror = e => log("[!] WebSocket ошибка");
     }
 
   btnLidarTest?.addEventListener("click", async () => {
     if (!isConnected) { log("[-] Нет подключения"); return; }
     try {
-      const resp = await postJson("/api/lidar/test", {});
+      const resp = await postJson("/api/lidar/test", deviceBody());
       if (resp.task_id) {
         currentTaskId = resp.task_id;
         await openLogWs(currentTaskId);
@@ -154,7 +204,7 @@ document.addEventListener("DOMContentLoaded", () => {
   btnEngineTest?.addEventListener("click", async () => {
     if (!isConnected) { log("[-] Нет подключения"); return; }
     try {
-      const resp = await postJson("/api/lidar/engine_test", {});
+      const resp = await postJson("/api/lidar/engine_test", deviceBody());
       if (resp.task_id) {
         currentTaskId = resp.task_id;
         await openLogWs(currentTaskId);
@@ -166,12 +216,20 @@ document.addEventListener("DOMContentLoaded", () => {
 
   btnStartScan?.addEventListener("click", async () => {
     if (!isConnected) { log("[-] Нет подключения"); return; }
-    const payload = {
+    const payload = deviceBody({
       scan_range: inputRange?.value,
       scan_step: inputStep?.value,
       lidar_duration: inputDuration?.value,
       pulse_delay: inputPulseDelay?.value
-    };
+    });
+    // После съёмки сервер сам заберёт файл с установки и сохранит эксперимент
+    if (checkSaveExperiment?.checked) {
+      payload.experiment = {
+        address: inputAddress?.value,
+        room_description: inputRoom?.value,
+        object_description: inputObject?.value
+      };
+    }
     btnStartScan.disabled = true;
     btnStopScan.disabled = false;
     if (btnDownload) btnDownload.disabled = true;
@@ -181,6 +239,7 @@ document.addEventListener("DOMContentLoaded", () => {
       if (resp.task_id) {
         currentTaskId = resp.task_id;
         currentFilename = resp.filename;
+        currentScanTaskId = resp.task_id;
         await openLogWs(currentTaskId);
       }
     } catch (e) {
@@ -205,7 +264,8 @@ document.addEventListener("DOMContentLoaded", () => {
 
     btnDownload?.addEventListener("click", () => {
       if (!currentFilename) return log("[-] Нет файла для скачивания");
-      window.location = `/api/lidar/download?filename=${encodeURIComponent(currentFilename)}`;
+      // По task_id сервер знает, на какой установке лежит файл скана
+      window.location = `/api/lidar/download?task_id=${encodeURIComponent(currentScanTaskId)}`;
       if (btnStartScan) btnStartScan.disabled = false;   // ← включаем повторные съёмки
     });
 
@@ -0,0 +1,53 @@
+// Фоновая загрузка облака для view_cloud.js: запрос и разбор ответа вне основного потока.
+// Сообщение: { id, url, format: 'bin' | 'json' }.
+// Ответ: { id, positions, count, body } (буфер позиций передаётся без копирования) или { id, error }.
+
+// Та же формула, что в app/utils/geometry.py (spherical_to_cartesian)
+function polarToCartesianWithRotation(phi, r, theta) {
+    const alpha = (120 - theta) * Math.PI / 180;
+    const phiRad = phi * Math.PI / 180;
+
+    // Преобразование осей: y->x, x->z, z->y
+    const x = r * Math.sin(phiRad);
+    const y = -r * Math.cos(phiRad) * Math.sin(alpha) - 100 * Math.cos(alpha);
+    const z = -(r * Math.cos(phiRad) * Math.cos(alpha) - 100 * Math.sin(alpha));
+
+    return { x: x / 1000, y: y / 1000, z: z / 1000 };
+}
+
+// Перевод JSON-координат в плоский массив позиций (используется, пока артефакты не готовы)
+function coordinatesToPositions(coordinates) {
+    const positions = new Float32Array(coordinates.length * 3);
+    coordinates.forEach((coord, i) => {
+        const { x, y, z } = polarToCartesianWithRotation(coord.phi, coord.r, coord.theta);
+        positions[i * 3] = x;
+        positions[i * 3 + 1] = y;
+        positions[i * 3 + 2] = z;
+    });
+    return positions;
+}
+
+function load(url, format) {
+    return fetch(url).then(response => {
+        if (format === 'json') {
+            // Сервер может вернуть {ok: false, message} и с кодом 200
+            return response.json().then(body => {
+                if (!body.ok) throw new Error(body.message || `Ошибка сервера: ${response.status}`);
+                const positions = coordinatesToPositions(body.coordinates);
+                delete body.coordinates;
+                return { positions, body };
+            });
+        }
+        if (!response.ok) throw new Error(`Ошибка сервера: ${response.status}`);
+        return response.arrayBuffer().then(buffer => ({ positions: new Float32Array(buffer), body: null }));
+    });
+}
+
+self.onmessage = event => {
+    const { id, url, format } = event.data;
+    load(url, format)
+        .then(({ positions, body }) => {
+            self.postMessage({ id, positions, count: positions.length / 3, body }, [positions.buffer]);
+        })
+        .catch(err => self.postMessage({ id, error: err.message }));
+};
@@ -21,9 +21,19 @@ document.addEventListener('DOMContentLoaded', function() {
         room: '',
         address: '',
         object: '',
-        measurements: []
+        // Файл облака отправляется на сервер как есть (текстовый скан — сжатым gzip)
+        cloudFile: null,
+        // Номер загрузки по частям (для больших файлов), завершается при сохранении
+        uploadId: null
     };
 
+    // Форматы, которые принимает сервер
+    const UPLOAD_FORMATS = ['txt', 'ply', 'pcd', 'las'];
+
+    // Файлы больше порога загружаются частями с повторами и докачкой
+    const CHUNKED_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+    const UPLOAD_RETRIES = 5;
+
     // Установка текущей даты по умолчанию
     function setCurrentDateTime() {
         const now = new Date();
@@ -79,12 +89,14 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Обработка выбранного файла
-    function handleFile(file) {
-        if (!file || !file.name.endsWith('.txt')) {
-            alert('Пожалуйста, выберите файл в формате TXT');
+    // Обработка выбранного файла: разбор и проверка выполняются на сервере
+    async function handleFile(file) {
+        const extension = fileExtension(file);
+        if (!file || !UPLOAD_FORMATS.includes(extension)) {
+            alert('Пожалуйста, выберите файл в формате TXT, PLY, PCD или LAS');
             return;
         }
+        experimentData.cloudFile = null;
 
             // Скрываем информационную надпись
         dataPreviewInfo.style.display = 'none';
@@ -96,72 +108,140 @@ document.addEventListener('DOMContentLoaded', function() {
             <div class="upload-hint">${file.name}</div>
         `;
 
-        const reader = new FileReader();
-        reader.onload = function(e) {
-            // Парсим содержимое файла
-            parseFileContent(e.target.result);
-        };
-        reader.readAsText(file);
-    }
-
-    // Парсинг содержимого файла
-function parseFileContent(content) {
-    try {
-        const lines = content.split('\n');
-        const measurements = [];
-        let validLines = 0;
-
-        for (let i = 0; i < lines.length; i++) {
-            const line = lines[i].trim();
-            if (!line) continue;
+        try {
+            const upload = await compressFile(file);
+            let response;
+            experimentData.uploadId = null;
+
+            if (upload.size > CHUNKED_UPLOAD_THRESHOLD) {
+                // Большой файл: загрузка частями с докачкой, проверка уже загруженного файла
+                experimentData.uploadId = await uploadInChunks(file, upload);
+                response = await fetch(`/${getUserIdFromUrl()}/create/uploads/${experimentData.uploadId}/preview`);
+            } else {
+                const formData = new FormData();
+                formData.append('cloud_file', upload, upload.name);
+                response = await fetch(`/${getUserIdFromUrl()}/create/parse`, {
+                    method: 'POST',
+                    body: formData
+                });
+            }
+            if (!response.ok) {
+                throw new Error(`Ошибка сервера: ${response.status}`);
+            }
+            const summary = await response.json();
+            if (!summary.ok) {
+                handleParseError(summary.message, summary.errors || []);
+                return;
+            }
 
-            // Разделяем строку по точкам с запятой
-            const parts = line.split(';').map(part => part.trim());
+            // Сохраняем файл: при сохранении он уйдёт на сервер без повторной обработки в браузере
+            experimentData.cloudFile = upload;
+            updateUI(summary);
+        } catch (error) {
+            handleParseError(error.message, []);
+        }
+    }
 
-            // Проверяем, что в строке минимум 3 значения
-            if (parts.length < 3) {
-                throw new Error(`Неверный формат в строке ${i+1}: требуется 3 значения`);
+    // Запрос с повтором при сетевых ошибках и ответах 5xx (пауза растёт: 1, 2, 4... с)
+    async function fetchWithRetry(url, options, attempts = UPLOAD_RETRIES) {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                const response = await fetch(url, options);
+                if (response.status < 500 || attempt + 1 >= attempts) {
+                    return response;
+                }
+            } catch (error) {
+                if (attempt + 1 >= attempts) throw error;
             }
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+        }
+    }
 
-            const phi = parseFloat(parts[0]);
-            const r = parseFloat(parts[1]);
-            const theta = parseFloat(parts[2]);
+    async function sha256Hex(buffer) {
+        // crypto.subtle доступен только в защищённом контексте (https, localhost)
+        if (!window.crypto || !window.crypto.subtle) return null;
+        const digest = await crypto.subtle.digest('SHA-256', buffer);
+        return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+    }
 
-            // Проверяем, что значения являются числами
-            if (isNaN(phi) || isNaN(r) || isNaN(theta)) {
-                throw new Error(`Неверный формат чисел в строке ${i+1}`);
+    // Загрузка частями; номер загрузки хранится в localStorage, чтобы продолжить после обрыва
+    async function uploadInChunks(file, upload) {
+        const base = `/${getUserIdFromUrl()}/create/uploads`;
+        const storageKey = `lidar-upload:${file.name}:${file.size}:${file.lastModified}`;
+        let status = null;
+
+        const savedId = localStorage.getItem(storageKey);
+        if (savedId) {
+            const response = await fetchWithRetry(`${base}/${savedId}`, {});
+            if (response.ok) {
+                status = await response.json();
+                if (status.size !== upload.size) status = null;
             }
-
-            measurements.push({ phi, r, theta });
-            validLines++;
+        }
+        if (!status) {
+            const response = await fetchWithRetry(base, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ filename: upload.name, size: upload.size })
+            });
+            if (!response.ok) throw new Error(`Не удалось начать загрузку: ${response.status}`);
+            status = await response.json();
+            localStorage.setItem(storageKey, status.upload_id);
         }
 
-        // Проверяем, что найдены действительные данные
-        if (validLines === 0) {
-            throw new Error("Файл не содержит действительных данных");
+        for (const [start, end] of status.missing) {
+            for (let offset = start; offset < end; offset += status.chunk_size) {
+                const chunk = await upload.slice(offset, Math.min(offset + status.chunk_size, end)).arrayBuffer();
+                const headers = { 'Content-Type': 'application/octet-stream' };
+                const checksum = await sha256Hex(chunk);
+                if (checksum) headers['X-Chunk-SHA256'] = checksum;
+
+                const response = await fetchWithRetry(`${base}/${status.upload_id}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers,
+                    body: chunk
+                });
+                if (!response.ok) throw new Error(`Ошибка загрузки части: ${response.status}`);
+                const progress = await response.json();
+                dropZone.querySelector('.upload-hint').textContent =
+                    `${file.name}: загружено ${Math.round(100 * progress.received_bytes / progress.size)}%`;
+            }
         }
 
-        // Сохраняем данные
-        experimentData.measurements = measurements;
+        localStorage.removeItem(storageKey);
+        return status.upload_id;
+    }
 
-        // Обновляем интерфейс
-        updateUI(measurements);
+    // Расширение без учёта сжатия: scan.txt.gz -> txt
+    function fileExtension(file) {
+        if (!file) return '';
+        const parts = file.name.toLowerCase().split('.');
+        if (parts[parts.length - 1] === 'gz') parts.pop();
+        return parts.length > 1 ? parts[parts.length - 1] : '';
+    }
 
-    } catch (error) {
-        // Обработка ошибки
-        handleParseError(error.message);
+    // Текстовый скан сжимаем gzip перед отправкой, если браузер это умеет
+    async function compressFile(file) {
+        if (typeof CompressionStream === 'undefined' || file.name.toLowerCase().endsWith('.gz')) {
+            return file;
+        }
+        if (fileExtension(file) !== 'txt') {
+            return file;
+        }
+        const stream = file.stream().pipeThrough(new CompressionStream('gzip'));
+        const blob = await new Response(stream).blob();
+        return new File([blob], `${file.name}.gz`, { type: 'application/gzip' });
     }
-}
 
 // Обработка ошибок парсинга
-function handleParseError(errorMessage) {
+function handleParseError(errorMessage, rowErrors) {
     // Восстанавливаем исходное состояние области загрузки
     dropZone.innerHTML = `
         <div class="upload-icon">❌</div>
         <div class="upload-text">Ошибка обработки файла</div>
         <div class="upload-hint">${errorMessage}</div>
         <button class="browse-button">Попробовать снова</button>
-        <input type="file" class="file-input" id="fileInput" accept=".txt">
+        <input type="file" class="file-input" id="fileInput" accept=".txt,.gz,.ply,.pcd,.las">
     `;
 
     // Обновляем обработчики
@@ -176,16 +256,30 @@ function handleParseError(errorMessage) {
     });
 
     // Сбрасываем данные
-    experimentData.measurements = [];
-
-    // Обновляем таблицу
-    dataTableBody.innerHTML = `
-        <tr>
-            <td colspan="3" style="text-align: center; padding: 30px; color: #999;">
-                Данные не загружены
-            </td>
-        </tr>
-    `;
+    experimentData.cloudFile = null;
+    experimentData.uploadId = null;
+
+    // В таблице показываем ошибочные строки, если сервер их вернул
+    if (rowErrors.length > 0) {
+        dataTableBody.innerHTML = '';
+        rowErrors.forEach(item => {
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td colspan="3" style="color: #cf1322;">
+                    ${item.line ? `Строка ${item.line}: ` : ''}${item.message}
+                </td>
+            `;
+            dataTableBody.appendChild(row);
+        });
+    } else {
+        dataTableBody.innerHTML = `
+            <tr>
+                <td colspan="3" style="text-align: center; padding: 30px; color: #999;">
+                    Данные не загружены
+                </td>
+            </tr>
+        `;
+    }
 
     // Скрываем информационную надпись
     dataPreviewInfo.style.display = 'none';
@@ -194,20 +288,23 @@ function handleParseError(errorMessage) {
     saveBtn.disabled = true;
 }
 
-    // Обновление интерфейса после загрузки данных
-    function updateUI(measurements) {
+    // Обновление интерфейса после проверки файла сервером
+    function updateUI(summary) {
         // Показываем успешное сообщение
         dropZone.innerHTML = `
             <div class="upload-icon">✅</div>
             <div class="upload-text">Файл успешно обработан</div>
-            <div class="upload-hint">Загружено ${measurements.length} строк данных</div>
+            <div class="upload-hint">
+                Загружено ${summary.count} строк данных, слоёв: ${summary.layers},
+                r: ${summary.min_r.toFixed(1)}–${summary.max_r.toFixed(1)} (среднее ${summary.avg_r.toFixed(1)})
+            </div>
         `;
 
           // Показываем информационную надпись
         dataPreviewInfo.style.display = 'block';
 
         // Отображаем первые 10 строк в таблице
-        renderDataTable(measurements);
+        renderDataTable(summary.preview);
 
         // Активируем кнопку сохранения
         saveBtn.disabled = false;
@@ -255,7 +352,7 @@ function handleParseError(errorMessage) {
         !experimentData.room ||
         !experimentData.address ||
         !experimentData.object ||
-        experimentData.measurements.length === 0
+        !experimentData.cloudFile
     ) {
         alert('Пожалуйста, заполните все поля и загрузите файл с данными');
         return;
@@ -267,14 +364,14 @@ function handleParseError(errorMessage) {
     formData.append('room_description', experimentData.room);
     formData.append('address', experimentData.address);
     formData.append('object_description', experimentData.object);
-    const jsonBlob = new Blob(
-        [ JSON.stringify({ measurements: experimentData.measurements }) ],
-        { type: 'application/json' }
-        );
-    formData.append('measurements_file', jsonBlob, 'measurements.json');
-
     const userId = getUserIdFromUrl();
-    const endpoint = `/${userId}/create/save`;
+    let endpoint;
+    if (experimentData.uploadId) {
+        endpoint = `/${userId}/create/uploads/${experimentData.uploadId}/finalize`;
+    } else {
+        formData.append('cloud_file', experimentData.cloudFile, experimentData.cloudFile.name);
+        endpoint = `/${userId}/create/import`;
+    }
 
     saveBtn.textContent = 'Сохранение...';
     saveBtn.disabled = true;
@@ -294,6 +391,12 @@ function handleParseError(errorMessage) {
 
         // здесь статус 2xx
         const data = await response.json();
+        if (data.status === 'error') {
+            throw new Error(data.message);
+        }
+
+        // Загрузка по частям завершена и удалена на сервере
+        experimentData.uploadId = null;
 
         successMessage.style.display = 'block';
         successMessage.textContent = 'Эксперимент успешно сохранён!';
@@ -1,16 +1,3 @@
-function polarToCartesianWithRotation(phi, r, theta) {
-    const alpha = (120 - theta) * Math.PI / 180;
-    const phiRad = phi * Math.PI / 180;
-
-    // Преобразование осей: y->x, x->z, z->y
-    const x = r * Math.sin(phiRad);
-    const y = -r * Math.cos(phiRad) * Math.sin(alpha) - 100 * Math.cos(alpha);
-    const z = -(r * Math.cos(phiRad) * Math.cos(alpha) - 100 * Math.sin(alpha));
-
-    return { x: x / 1000, y: y / 1000, z: z / 1000 };
-}
-
-
 // Функция для создания текстовой подписи (Sprite)
 function makeTextSprite(message, color = "#222", fontSize = 120) {
     const canvas = document.createElement('canvas');
@@ -43,7 +30,160 @@ function addAxisLabels(scene, axis, min, max, step, fixed = 0) {
     }
 }
 
-function createPointCloudVisualization(coordinates, containerId) {
+// Загрузка облака через Web Worker (static/js/cloud_worker.js): запрос и разбор
+// бинарного или JSON-ответа не занимают основной поток, в котором идёт отрисовка
+let cloudWorker = null;
+let workerSeq = 0;
+const workerRequests = new Map();
+
+function loadInWorker(url, format = 'bin') {
+    if (typeof Worker === 'undefined') {
+        return Promise.reject(new Error('Браузер не поддерживает Web Worker'));
+    }
+    if (!cloudWorker) {
+        cloudWorker = new Worker('/static/js/cloud_worker.js');
+        cloudWorker.onmessage = event => {
+            const request = workerRequests.get(event.data.id);
+            if (!request) return;
+            workerRequests.delete(event.data.id);
+            if (event.data.error) request.reject(new Error(event.data.error));
+            else request.resolve(event.data);
+        };
+    }
+    const id = ++workerSeq;
+    return new Promise((resolve, reject) => {
+        workerRequests.set(id, { resolve, reject });
+        cloudWorker.postMessage({ id, url, format });
+    });
+}
+
+// Выбор точек на сервере: допуск в пикселях и пауза курсора перед запросом
+const PICK_RADIUS_PX = 6;
+const HOVER_DELAY_MS = 150;
+
+// Узлы октодерева: как часто пересчитывать видимость, с какого экранного размера (пиксели)
+// показывать узел вместо превью, сколько узлов грузить параллельно и сколько точек держать на GPU
+const LOD_INTERVAL_MS = 200;
+const LOD_MIN_PIXELS = 80;
+const MAX_NODE_REQUESTS = 4;
+const POINT_BUDGET = 8000000;
+// Сетки по осям: не больше делений, даже если облако с выбросами очень большое
+const MAX_GRID_DIVISIONS = 100;
+
+// Выбор точки на GPU: видимые облака рисуются в float-текстуру (2R+1)x(2R+1) вокруг курсора,
+// в пикселе — номер объекта и номер точки в нём. null — нет WebGL2 или float-целей рендера
+function createGpuPicker(renderer, camera, pointSize) {
+    if (!renderer.capabilities.isWebGL2 || typeof THREE.GLSL3 === 'undefined' ||
+        !renderer.extensions.has('EXT_color_buffer_float')) {
+        return null;
+    }
+    const size = PICK_RADIUS_PX * 2 + 1;
+    const target = new THREE.WebGLRenderTarget(size, size, {
+        type: THREE.FloatType,
+        format: THREE.RGBAFormat,
+        minFilter: THREE.NearestFilter,
+        magFilter: THREE.NearestFilter
+    });
+    const pixels = new Float32Array(size * size * 4);
+    const pickScene = new THREE.Scene();
+    const baseMaterial = new THREE.ShaderMaterial({
+        glslVersion: THREE.GLSL3,
+        uniforms: { pointSize: { value: pointSize }, scale: { value: 1 }, objectId: { value: 0 } },
+        vertexShader: `
+            uniform float pointSize;
+            uniform float scale;
+            uniform float objectId;
+            flat out vec4 vPick;
+            void main() {
+                vec4 mvPosition = modelViewMatrix * vec4(position, 1.0);
+                gl_Position = projectionMatrix * mvPosition;
+                // Как у PointsMaterial с sizeAttenuation, но не меньше 2 пикселей
+                gl_PointSize = max(pointSize * scale / -mvPosition.z, 2.0);
+                vPick = vec4(objectId, float(gl_VertexID >> 16), float(gl_VertexID & 0xFFFF), 1.0);
+            }`,
+        fragmentShader: `
+            flat in vec4 vPick;
+            layout(location = 0) out highp vec4 pickColor;
+            void main() {
+                pickColor = vPick;
+            }`
+    });
+    const twins = new Map();
+    const byId = new Map();
+    let nextId = 1;
+    const clearColor = new THREE.Color();
+
+    function add(object) {
+        const material = baseMaterial.clone();
+        material.uniforms.objectId.value = nextId;
+        const twin = new THREE.Points(object.geometry, material);
+        twins.set(object, twin);
+        byId.set(nextId++, object);
+        pickScene.add(twin);
+    }
+
+    function remove(object) {
+        const twin = twins.get(object);
+        if (!twin) return;
+        pickScene.remove(twin);
+        twin.material.dispose();
+        twins.delete(object);
+        byId.delete(twin.material.uniforms.objectId.value);
+    }
+
+    // Ближайшая к курсору видимая точка: { object, index } или null
+    function pick(clientX, clientY) {
+        const rect = renderer.domElement.getBoundingClientRect();
+        const x = Math.round(clientX - rect.left);
+        const y = Math.round(clientY - rect.top);
+        twins.forEach((twin, object) => {
+            twin.visible = object.visible;
+            twin.material.uniforms.scale.value = rect.height / 2;
+        });
+
+        renderer.getClearColor(clearColor);
+        const clearAlpha = renderer.getClearAlpha();
+        camera.setViewOffset(rect.width, rect.height, x - PICK_RADIUS_PX, y - PICK_RADIUS_PX, size, size);
+        renderer.setRenderTarget(target);
+        renderer.setClearColor(0x000000, 0);
+        renderer.clear();
+        renderer.render(pickScene, camera);
+        renderer.setRenderTarget(null);
+        renderer.setClearColor(clearColor, clearAlpha);
+        camera.clearViewOffset();
+        renderer.readRenderTargetPixels(target, 0, 0, size, size, pixels);
+
+        let best = -1;
+        let bestDistance = Infinity;
+        for (let row = 0; row < size; row++) {
+            for (let col = 0; col < size; col++) {
+                const i = (row * size + col) * 4;
+                if (pixels[i + 3] === 0) continue;
+                const distance = (row - PICK_RADIUS_PX) ** 2 + (col - PICK_RADIUS_PX) ** 2;
+                if (distance < bestDistance) {
+                    bestDistance = distance;
+                    best = i;
+                }
+            }
+        }
+        if (best === -1) return null;
+        const object = byId.get(pixels[best]);
+        return object ? { object, index: pixels[best + 1] * 65536 + pixels[best + 2] } : null;
+    }
+
+    function dispose() {
+        twins.forEach(twin => twin.material.dispose());
+        twins.clear();
+        baseMaterial.dispose();
+        target.dispose();
+    }
+
+    return { add, remove, pick, dispose };
+}
+
+// positions: Float32Array x, y, z; bbox: предрассчитанные границы {min: [..], max: [..]} или null
+// spatialUrl = { base, source } — наведение и измерения через пространственный индекс сервера
+function createPointCloudVisualization(positions, containerId, bbox = null, spatialUrl = null) {
     if (typeof THREE === 'undefined') {
         console.error('Three.js не загружен');
         return;
@@ -64,12 +204,6 @@ function createPointCloudVisualization(coordinates, containerId) {
     renderer.setSize(width, height);
     container.appendChild(renderer.domElement);
 
-    // Преобразуем координаты
-    const positions = [];
-    coordinates.forEach(coord => {
-        const { x, y, z } = polarToCartesianWithRotation(coord.phi, coord.r, coord.theta);
-        positions.push(x, y, z);
-    });
     const geometry = new THREE.BufferGeometry();
     geometry.setAttribute('position', new THREE.Float32BufferAttribute(positions, 3));
     const material = new THREE.PointsMaterial({
@@ -80,10 +214,36 @@ function createPointCloudVisualization(coordinates, containerId) {
     });
     const points = new THREE.Points(geometry, material);
     scene.add(points);
+    // Объекты для наведения: базовое облако (превью), загруженные узлы октодерева, очищенное облако
+    const pickable = [points];
+    const gpuPicker = createGpuPicker(renderer, camera, material.size);
+    if (gpuPicker) gpuPicker.add(points);
+    // Очищенное облако (/filtered) — отдельный объект, показывается вместо исходного
+    let filtered = null;
 
-    geometry.computeBoundingBox();
-    const bbox = geometry.boundingBox;
-    const min = bbox.min, max = bbox.max;
+    // Поверхность (строится на сервере по запросу) и освещение для неё
+    let mesh = null;
+    const meshMaterial = new THREE.MeshLambertMaterial({
+        color: 0xb0b8c0,
+        side: THREE.DoubleSide
+    });
+    scene.add(new THREE.AmbientLight(0xffffff, 0.5));
+    const light = new THREE.DirectionalLight(0xffffff, 0.6);
+    light.position.set(5, 10, 7);
+    scene.add(light);
+
+    // Границы берём из сводки эксперимента, без прохода по всем точкам
+    let min, max;
+    if (bbox) {
+        min = new THREE.Vector3(...bbox.min);
+        max = new THREE.Vector3(...bbox.max);
+        geometry.boundingBox = new THREE.Box3(min.clone(), max.clone());
+        geometry.boundingSphere = geometry.boundingBox.getBoundingSphere(new THREE.Sphere());
+    } else {
+        geometry.computeBoundingBox();
+        min = geometry.boundingBox.min;
+        max = geometry.boundingBox.max;
+    }
 
     // Оси координат (красная=X, зеленая=Y, синяя=Z в Three.js)
     const axesHelper = new THREE.AxesHelper(Math.max(max.x - min.x, max.y - min.y, max.z - min.z) * 0.6);
@@ -95,21 +255,22 @@ function createPointCloudVisualization(coordinates, containerId) {
     const gridSizeZ = Math.ceil(max.z - min.z);
 
     // Плоскость XY (параллельна экрану при виде спереди, перпендикулярна Z)
+    const gridDivisions = size => Math.min(MAX_GRID_DIVISIONS, Math.max(10, Math.round(size * 2)));
     const sizeXY = Math.max(gridSizeX, gridSizeY);
-    const gridXY = new THREE.GridHelper(sizeXY, Math.max(10, Math.round(sizeXY * 2)), 0x888888, 0xcccccc);
+    const gridXY = new THREE.GridHelper(sizeXY, gridDivisions(sizeXY), 0x888888, 0xcccccc);
     gridXY.rotation.x = Math.PI / 2; // Поворачиваем в плоскость XY
     gridXY.position.set(0, 0, min.z);
     scene.add(gridXY);
 
     // Плоскость XZ (горизонтальная, перпендикулярна Y)
     const sizeXZ = Math.max(gridSizeX, gridSizeZ);
-    const gridXZ = new THREE.GridHelper(sizeXZ, Math.max(10, Math.round(sizeXZ * 2)), 0x888888, 0xcccccc);
+    const gridXZ = new THREE.GridHelper(sizeXZ, gridDivisions(sizeXZ), 0x888888, 0xcccccc);
     gridXZ.position.set(0, min.y, 0);
     scene.add(gridXZ);
 
     // Плоскость YZ (вертикальная боковая, перпендикулярна X)
     const sizeYZ = Math.max(gridSizeY, gridSizeZ);
-    const gridYZ = new THREE.GridHelper(sizeYZ, Math.max(10, Math.round(sizeYZ * 2)), 0x888888, 0xcccccc);
+    const gridYZ = new THREE.GridHelper(sizeYZ, gridDivisions(sizeYZ), 0x888888, 0xcccccc);
     gridYZ.rotation.z = Math.PI / 2; // Поворачиваем в плоскость YZ
     gridYZ.position.set(min.x, 0, 0);
     scene.add(gridYZ);
@@ -154,41 +315,157 @@ function createPointCloudVisualization(coordinates, containerId) {
     tooltip.style.zIndex = 10;
     container.appendChild(tooltip);
 
-    function onPointerMove(event) {
+    function showTooltip(html, clientX, clientY) {
+        tooltip.innerHTML = html;
+        let left = clientX + 10;
+        let top = clientY - 10;
+        const pad = 10;
+        setTimeout(() => {
+            const ttRect = tooltip.getBoundingClientRect();
+            if (left + ttRect.width > window.innerWidth - pad) {
+                left = window.innerWidth - ttRect.width - pad;
+            }
+            if (top + ttRect.height > window.innerHeight - pad) {
+                top = window.innerHeight - ttRect.height - pad;
+            }
+            if (top < pad) top = pad;
+            if (left < pad) left = pad;
+            tooltip.style.left = left + 'px';
+            tooltip.style.top = top + 'px';
+        }, 0);
+        tooltip.style.display = 'block';
+    }
+
+    function setRay(event) {
         const rect = renderer.domElement.getBoundingClientRect();
         mouse.x = ((event.clientX - rect.left) / rect.width) * 2 - 1;
         mouse.y = -((event.clientY - rect.top) / rect.height) * 2 + 1;
         raycaster.setFromCamera(mouse, camera);
-        const intersects = raycaster.intersectObject(points);
+    }
+
+    // Выбор точки на сервере по KD-дереву: луч передаём в осях отчёта (X = z, Y = x, Z = y)
+    function serverPick(event) {
+        setRay(event);
+        const { origin, direction } = raycaster.ray;
+        // Допуск — несколько пикселей на расстоянии до центра вращения
+        const distance = camera.position.distanceTo(controls.target);
+        const pixel = 2 * distance * Math.tan(THREE.MathUtils.degToRad(camera.fov / 2)) / renderer.domElement.clientHeight;
+        const radius = Math.min(5, Math.max(0.005, PICK_RADIUS_PX * pixel));
+        const query = `ox=${origin.z}&oy=${origin.x}&oz=${origin.y}` +
+            `&dx=${direction.z}&dy=${direction.x}&dz=${direction.y}&radius=${radius}`;
+        return fetch(`${spatialUrl.base}/pick?source=${spatialUrl.source}&${query}`)
+            .then(response => response.json())
+            .then(body => (body.ok ? body.point : null));
+    }
+
+    function showPointTooltip(positions, index, clientX, clientY) {
+        const idx = index * 3;
+        const threeX = positions[idx].toFixed(2);      // Three.js X (наш старый Y)
+        const threeY = positions[idx + 1].toFixed(2);  // Three.js Y (наш старый Z)
+        const threeZ = positions[idx + 2].toFixed(2);  // Three.js Z (наш старый X)
+        // Выводим в оригинальном порядке: X, Y, Z
+        showTooltip(`X=${threeZ} м<br>Y=${threeX} м<br>Z=${threeY} м`, clientX, clientY);
+    }
+
+    // Наведение с выбором на GPU: не чаще раза за кадр, после отрисовки (см. animate)
+    let pendingPick = null;
+    function gpuHover() {
+        const event = pendingPick;
+        pendingPick = null;
+        const hit = gpuPicker.pick(event.clientX, event.clientY);
+        if (!hit) {
+            tooltip.style.display = 'none';
+            return;
+        }
+        showPointTooltip(hit.object.geometry.attributes.position.array, hit.index, event.clientX, event.clientY);
+    }
+
+    let hoverTimer = null;
+    let hoverRequest = 0;
+    function onPointerMove(event) {
+        if (gpuPicker) {
+            pendingPick = event;
+            return;
+        }
+        if (spatialUrl) {
+            // Запрос уходит, когда курсор остановился
+            clearTimeout(hoverTimer);
+            tooltip.style.display = 'none';
+            const request = ++hoverRequest;
+            hoverTimer = setTimeout(() => {
+                serverPick(event).then(point => {
+                    if (request !== hoverRequest || !point) return;
+                    showTooltip(`X=${point.x.toFixed(2)} м<br>Y=${point.y.toFixed(2)} м<br>Z=${point.z.toFixed(2)} м`,
+                        event.clientX, event.clientY);
+                }).catch(() => {});
+            }, HOVER_DELAY_MS);
+            return;
+        }
+
+        setRay(event);
+        const intersects = raycaster.intersectObjects(pickable.filter(object => object.visible));
         if (intersects.length > 0) {
-            const idx = intersects[0].index * 3;
-            const threeX = positions[idx].toFixed(2);      // Three.js X (наш старый Y)
-            const threeY = positions[idx + 1].toFixed(2);  // Three.js Y (наш старый Z)
-            const threeZ = positions[idx + 2].toFixed(2);  // Three.js Z (наш старый X)
-            // Выводим в оригинальном порядке: X, Y, Z
-            tooltip.innerHTML = `X=${threeZ} м<br>Y=${threeX} м<br>Z=${threeY} м`;
-            let left = event.clientX + 10;
-            let top = event.clientY - 10;
-            const pad = 10;
-            setTimeout(() => {
-                const ttRect = tooltip.getBoundingClientRect();
-                if (left + ttRect.width > window.innerWidth - pad) {
-                    left = window.innerWidth - ttRect.width - pad;
-                }
-                if (top + ttRect.height > window.innerHeight - pad) {
-                    top = window.innerHeight - ttRect.height - pad;
-                }
-                if (top < pad) top = pad;
-                if (left < pad) left = pad;
-                tooltip.style.left = left + 'px';
-                tooltip.style.top = top + 'px';
-            }, 0);
-            tooltip.style.display = 'block';
+            showPointTooltip(intersects[0].object.geometry.attributes.position.array, intersects[0].index,
+                event.clientX, event.clientY);
         } else {
             tooltip.style.display = 'none';
         }
     }
+
+    // Измерение расстояния: два щелчка по точкам, третий начинает заново
+    const measurePoints = [];
+    let measureLine = null;
+    const measureMaterial = new THREE.LineBasicMaterial({ color: 0xff3300 });
+    const measureLabel = document.createElement('div');
+    measureLabel.style.cssText = 'position: absolute; left: 10px; top: 10px; background: rgba(255,255,255,0.95);' +
+        'border: 1px solid #888; padding: 4px 8px; font-size: 13px; display: none;';
+    container.style.position = 'relative';
+    container.appendChild(measureLabel);
+
+    let downX = 0, downY = 0;
+    function onPointerDown(event) {
+        downX = event.clientX;
+        downY = event.clientY;
+    }
+    function onPointerUp(event) {
+        // Перетаскивание — это вращение камеры, а не выбор точки
+        if (Math.hypot(event.clientX - downX, event.clientY - downY) > 3) return;
+        serverPick(event).then(point => {
+            if (!point) return;
+            if (measurePoints.length === 2) {
+                measurePoints.length = 0;
+                if (measureLine) {
+                    scene.remove(measureLine);
+                    measureLine.geometry.dispose();
+                    measureLine = null;
+                }
+            }
+            measurePoints.push(point);
+            if (measurePoints.length === 1) {
+                measureLabel.textContent = `Точка 1: X=${point.x.toFixed(2)}, Y=${point.y.toFixed(2)}, Z=${point.z.toFixed(2)} м`;
+                measureLabel.style.display = 'block';
+                return;
+            }
+            const [a, b] = measurePoints;
+            return fetch(`${spatialUrl.base}/distance?source=${spatialUrl.source}&a=${a.index}&b=${b.index}`)
+                .then(response => response.json())
+                .then(body => {
+                    if (!body.ok) return;
+                    const lineGeometry = new THREE.BufferGeometry().setFromPoints([
+                        new THREE.Vector3(a.y, a.z, a.x),
+                        new THREE.Vector3(b.y, b.z, b.x)
+                    ]);
+                    measureLine = new THREE.Line(lineGeometry, measureMaterial);
+                    scene.add(measureLine);
+                    measureLabel.textContent = `Расстояние: ${body.distance.toFixed(3)} м`;
+                });
+        }).catch(() => {});
+    }
     renderer.domElement.addEventListener('pointermove', onPointerMove);
+    if (spatialUrl) {
+        renderer.domElement.addEventListener('pointerdown', onPointerDown);
+        renderer.domElement.addEventListener('pointerup', onPointerUp);
+    }
 
     // Управление камерой
     const controls = new THREE.OrbitControls(camera, renderer.domElement);
@@ -211,80 +488,389 @@ function createPointCloudVisualization(coordinates, containerId) {
     }
     window.addEventListener('resize', setAspectRatio);
 
-    function animate() {
-        requestAnimationFrame(animate);
+    // Узлы октодерева (/tiles): у каждого своя геометрия с границами тайла, поэтому Three.js
+    // отсекает невидимые узлы по пирамиде камеры. Узел грузится, когда на экране он крупнее
+    // LOD_MIN_PIXELS, и прячется (остаётся превью), когда мельче; при нехватке POINT_BUDGET
+    // выгружаются давно не видимые и самые мелкие узлы
+    const nodes = [];
+    let nodeUrl = null;
+    let nodeRequests = 0;
+    let loadedPoints = 0;
+    let lastLod = 0;
+    let disposed = false;
+    const frustum = new THREE.Frustum();
+    const projScreenMatrix = new THREE.Matrix4();
+
+    function detailVisible() {
+        return !(filtered && filtered.visible);
+    }
+
+    function unloadNode(node) {
+        scene.remove(node.object);
+        node.object.geometry.dispose();
+        pickable.splice(pickable.indexOf(node.object), 1);
+        if (gpuPicker) gpuPicker.remove(node.object);
+        node.object = null;
+        node.state = 'idle';
+        loadedPoints -= node.count;
+    }
+
+    // Освободить место под узел, выгружая менее нужные; false — места нет
+    function makeRoom(node) {
+        const candidates = nodes
+            .filter(other => other.object && !other.object.visible)
+            .sort((a, b) => a.lastVisible - b.lastVisible)
+            .concat(nodes
+                .filter(other => other.object && other.object.visible && other.pixels < node.pixels)
+                .sort((a, b) => a.pixels - b.pixels));
+        while (loadedPoints + node.count > POINT_BUDGET && candidates.length) {
+            unloadNode(candidates.shift());
+        }
+        return loadedPoints + node.count <= POINT_BUDGET;
+    }
+
+    function loadNode(node) {
+        node.state = 'loading';
+        nodeRequests++;
+        loadedPoints += node.count;
+        loadInWorker(nodeUrl + encodeURIComponent(node.tile))
+            .then(({ positions }) => {
+                if (disposed) return;
+                const nodeGeometry = new THREE.BufferGeometry();
+                nodeGeometry.setAttribute('position', new THREE.Float32BufferAttribute(positions, 3));
+                // Границы известны заранее — без прохода по точкам
+                nodeGeometry.boundingBox = node.box.clone();
+                nodeGeometry.boundingSphere = node.sphere.clone();
+                node.object = new THREE.Points(nodeGeometry, material);
+                node.object.visible = false;
+                node.state = 'loaded';
+                scene.add(node.object);
+                pickable.push(node.object);
+                if (gpuPicker) gpuPicker.add(node.object);
+                lastLod = 0;
+            })
+            .catch(() => {
+                // Не загрузился — попробуем снова при следующем пересчёте
+                node.state = 'idle';
+                loadedPoints -= node.count;
+            })
+            .finally(() => { nodeRequests--; });
+    }
+
+    function updateLod(now) {
+        camera.updateMatrixWorld();
+        projScreenMatrix.multiplyMatrices(camera.projectionMatrix, camera.matrixWorldInverse);
+        frustum.setFromProjectionMatrix(projScreenMatrix);
+        // Радиус в пикселях на расстоянии d: radius * focal / d
+        const focal = renderer.domElement.clientHeight / (2 * Math.tan(THREE.MathUtils.degToRad(camera.fov / 2)));
+        const showDetail = detailVisible();
+        const wanted = [];
+        nodes.forEach(node => {
+            const inView = frustum.intersectsSphere(node.sphere);
+            const distance = Math.max(camera.position.distanceTo(node.sphere.center) - node.sphere.radius, camera.near);
+            node.pixels = inView ? node.sphere.radius * focal / distance : 0;
+            const needed = showDetail && node.pixels >= LOD_MIN_PIXELS;
+            if (node.object) {
+                node.object.visible = needed;
+                if (needed) node.lastVisible = now;
+            } else if (needed && node.state === 'idle') {
+                wanted.push(node);
+            }
+        });
+        // Сначала самые крупные на экране
+        wanted.sort((a, b) => b.pixels - a.pixels);
+        while (nodeRequests < MAX_NODE_REQUESTS && wanted.length) {
+            const node = wanted.shift();
+            if (!makeRoom(node)) break;
+            loadNode(node);
+        }
+    }
+
+    let frame = 0;
+    function animate(now) {
+        frame = requestAnimationFrame(animate);
         controls.update();
+        if (nodes.length && now - lastLod >= LOD_INTERVAL_MS) {
+            lastLod = now;
+            updateLod(now);
+        }
         renderer.render(scene, camera);
+        if (pendingPick) gpuHover();
     }
-    animate();
+    frame = requestAnimationFrame(animate);
 
     return {
+        // Узлы октодерева из /tiles; url + ключ тайла — бинарный кусок облака (/chunk?tile=)
+        setNodes: (tiles, url) => {
+            nodeUrl = url;
+            tiles.forEach(tile => {
+                const box = new THREE.Box3(new THREE.Vector3(...tile.bounds.min), new THREE.Vector3(...tile.bounds.max));
+                nodes.push({
+                    tile: tile.tile,
+                    count: tile.count,
+                    box,
+                    sphere: box.getBoundingSphere(new THREE.Sphere()),
+                    state: 'idle',
+                    object: null,
+                    pixels: 0,
+                    lastVisible: 0
+                });
+            });
+            lastLod = 0;
+        },
+        // Поверхность из /mesh: позиции, нормали и индексы треугольников
+        setMesh: (meshPositions, meshNormals, meshIndices) => {
+            if (mesh) {
+                scene.remove(mesh);
+                mesh.geometry.dispose();
+            }
+            const meshGeometry = new THREE.BufferGeometry();
+            meshGeometry.setAttribute('position', new THREE.Float32BufferAttribute(meshPositions, 3));
+            meshGeometry.setAttribute('normal', new THREE.Float32BufferAttribute(meshNormals, 3));
+            meshGeometry.setIndex(new THREE.BufferAttribute(meshIndices, 1));
+            mesh = new THREE.Mesh(meshGeometry, meshMaterial);
+            scene.add(mesh);
+        },
+        setMeshVisible: (visible) => {
+            if (mesh) mesh.visible = visible;
+        },
+        setFiltered: (filteredPositions) => {
+            if (filtered) {
+                scene.remove(filtered);
+                filtered.geometry.dispose();
+                pickable.splice(pickable.indexOf(filtered), 1);
+                if (gpuPicker) gpuPicker.remove(filtered);
+            }
+            const filteredGeometry = new THREE.BufferGeometry();
+            filteredGeometry.setAttribute('position', new THREE.Float32BufferAttribute(filteredPositions, 3));
+            filtered = new THREE.Points(filteredGeometry, material);
+            scene.add(filtered);
+            pickable.push(filtered);
+            if (gpuPicker) gpuPicker.add(filtered);
+            points.visible = false;
+            nodes.forEach(node => { if (node.object) node.object.visible = false; });
+        },
+        setFilteredVisible: (visible) => {
+            if (!filtered) return;
+            filtered.visible = visible;
+            points.visible = !visible;
+            lastLod = 0;
+        },
         cleanup: () => {
+            disposed = true;
+            cancelAnimationFrame(frame);
             window.removeEventListener('resize', setAspectRatio);
             renderer.domElement.removeEventListener('pointermove', onPointerMove);
+            renderer.domElement.removeEventListener('pointerdown', onPointerDown);
+            renderer.domElement.removeEventListener('pointerup', onPointerUp);
+            clearTimeout(hoverTimer);
+            if (measureLine) measureLine.geometry.dispose();
+            measureMaterial.dispose();
+            if (gpuPicker) gpuPicker.dispose();
             renderer.dispose();
             geometry.dispose();
+            nodes.forEach(node => { if (node.object) node.object.geometry.dispose(); });
             material.dispose();
+            if (mesh) mesh.geometry.dispose();
+            if (filtered) filtered.geometry.dispose();
+            meshMaterial.dispose();
         }
     };
 }
 
+function fetchPositions(url) {
+    return loadInWorker(url).then(({ positions }) => positions);
+}
+
+function renderVisualizationLayout(visualization, pointsCount) {
+    // Заголовок
+    const header = document.createElement('div');
+    header.style.cssText = 'text-align: center; margin-bottom: 20px; font-size: 18px; color: #006D75; font-weight: bold;';
+    header.textContent = `3D Облако точек (${pointsCount.toLocaleString()} точек)`;
+    visualization.appendChild(header);
+
+    // Контейнер для Three.js
+    const threeContainer = document.createElement('div');
+    threeContainer.id = 'three-container';
+    threeContainer.style.cssText = 'width: 100%; height: 500px; border: 1px solid #dee2e6; border-radius: 4px;';
+    visualization.appendChild(threeContainer);
+
+    // Футер
+    const pointCount = document.createElement('div');
+    pointCount.style.cssText = 'text-align: center; margin-top: 20px; font-size: 16px; color: #6c757d;';
+    pointCount.textContent = `Количество точек: ${pointsCount.toLocaleString()}`;
+    visualization.appendChild(pointCount);
+
+    const instructions = document.createElement('div');
+    instructions.style.cssText = 'text-align: center; margin-top: 10px; font-size: 14px; color: #6c757d;';
+    instructions.innerHTML = 'Используйте мышь для вращения, колесо мыши для масштабирования. Наведите на точку для просмотра координат, ' +
+        'щёлкните по двум точкам для измерения расстояния.';
+    visualization.appendChild(instructions);
+
+    return threeContainer.id;
+}
+
+// Текущий вьювер страницы (для догрузки поверхности)
+let currentViewer = null;
+
+// Примерно столько точек в узле октодерева; глубину подбираем по размеру облака
+const TILE_POINTS = 100000;
+const MAX_TILE_DEPTH = 6;
+
+function tileDepth(pointsCount) {
+    const depth = Math.ceil(Math.log(Math.max(pointsCount, 1) / TILE_POINTS) / Math.log(8));
+    return Math.min(MAX_TILE_DEPTH, Math.max(1, depth));
+}
+
+// Быстрый путь: готовые артефакты — сначала превью, затем узлы октодерева по мере приближения камеры
+function loadFromArtifacts(baseUrl, source, summary, visualization) {
+    const containerId = renderVisualizationLayout(visualization, summary.points_count);
+    return fetchPositions(`${baseUrl}/cartesian?source=${source}&preview=true`)
+        .then(preview => {
+            const viewer = createPointCloudVisualization(preview, containerId, summary.bbox, { base: baseUrl, source });
+            currentViewer = viewer;
+            if (!viewer) return;
+            return fetch(`${baseUrl}/tiles?source=${source}&depth=${tileDepth(summary.points_count)}`)
+                .then(response => {
+                    if (!response.ok) throw new Error(`Ошибка сервера: ${response.status}`);
+                    return response.json();
+                })
+                .then(body => viewer.setNodes(body.tiles, `${baseUrl}/chunk?source=${source}&tile=`));
+        });
+}
+
+// Запасной путь: JSON-измерения, пересчёт координат в воркере
+function loadFromMeasurements(baseUrl, source, visualization) {
+    return loadInWorker(`${baseUrl}/measurements?source=${source}`, 'json')
+        .then(({ positions, body }) => {
+            const containerId = renderVisualizationLayout(visualization, body.measurements_count);
+            currentViewer = createPointCloudVisualization(positions, containerId, null, { base: baseUrl, source });
+        });
+}
+
 function loadVisualization(userId, experimentId) {
     const loading = document.getElementById('loading');
     const error = document.getElementById('error');
     const visualization = document.getElementById('visualization');
     const urlParams = new URLSearchParams(window.location.search);
     const source = urlParams.get('source') || 'local'; 
+    const baseUrl = `/${userId}/api/experiments/${experimentId}`;
     loading.style.display = 'flex';
     error.style.display = 'none';
     visualization.innerHTML = '';
-    fetch(`/${userId}/api/experiments/${experimentId}/measurements?source=${source}`)
-        .then(response => {
-            // Сначала парсим JSON, независимо от status code, 
-            // так как сервер может вернуть {ok: false} с кодом 500/404
-            return response.json().then(data => ({ status: response.status, body: data }));
-        })
-        .then(({ status, body }) => {
-            // Проверяем логический флаг ok или статус ответа
-            if (!body.ok) {
-                // Если сервер вернул {ok: false, message: "..."}
-                throw new Error(body.message || `Ошибка сервера: ${status}`);
+    fetch(`${baseUrl}/summary?source=${source}`)
+        .then(response => response.json())
+        .catch(() => ({ ok: false }))
+        .then(body => {
+            const summary = body.ok ? body.summary : null;
+            if (summary && summary.status === 'ready') {
+                loading.style.display = 'none';
+                return loadFromArtifacts(baseUrl, source, summary, visualization);
             }
-            
-            // Если все ок, используем данные
-            const data = body;
-            
-            loading.style.display = 'none';
-            
-            // Заголовок
-            const header = document.createElement('div');
-            header.style.cssText = 'text-align: center; margin-bottom: 20px; font-size: 18px; color: #006D75; font-weight: bold;';
-            header.textContent = `3D Облако точек (${data.measurements_count.toLocaleString()} точек)`;
-            visualization.appendChild(header);
-            
-            // Контейнер для Three.js
-            const threeContainer = document.createElement('div');
-            threeContainer.id = 'three-container';
-            threeContainer.style.cssText = 'width: 100%; height: 500px; border: 1px solid #dee2e6; border-radius: 4px;';
-            visualization.appendChild(threeContainer);
-            
-            // Запуск отрисовки
-            createPointCloudVisualization(data.coordinates, 'three-container');
-            
-            // Футер
-            const pointCount = document.createElement('div');
-            pointCount.style.cssText = 'text-align: center; margin-top: 20px; font-size: 16px; color: #6c757d;';
-            pointCount.textContent = `Количество точек: ${data.measurements_count.toLocaleString()}`;
-            visualization.appendChild(pointCount);
-            
-            const instructions = document.createElement('div');
-            instructions.style.cssText = 'text-align: center; margin-top: 10px; font-size: 14px; color: #6c757d;';
-            instructions.innerHTML = 'Используйте мышь для вращения, колесо мыши для масштабирования. Наведите на точку для просмотра координат.';
-            visualization.appendChild(instructions);
+            return loadFromMeasurements(baseUrl, source, visualization)
+                .then(() => { loading.style.display = 'none'; });
         })
         .catch(err => {
             loading.style.display = 'none';
             error.style.display = 'block';
             error.textContent = 'Ошибка: ' + err.message;
         });
-}
\ No newline at end of file
+}
+
+// Поверхность: запуск построения на сервере, ожидание и загрузка бинарного файла
+const MESH_POLL_INTERVAL = 2000;
+
+function waitForMesh(baseUrl, source) {
+    return fetch(`${baseUrl}/mesh?source=${source}`, { method: 'POST' })
+        .then(response => response.json())
+        .then(function poll(state) {
+            if (state.status === 'ready') return state;
+            if (state.status === 'error' || !state.ok) {
+                throw new Error(state.message || 'Не удалось построить поверхность');
+            }
+            return new Promise(resolve => setTimeout(resolve, MESH_POLL_INTERVAL))
+                .then(() => fetch(`${baseUrl}/mesh/status?source=${source}`))
+                .then(response => response.json())
+                .then(poll);
+        });
+}
+
+function toggleMesh(userId, experimentId, button) {
+    const source = new URLSearchParams(window.location.search).get('source') || 'local';
+    const baseUrl = `/${userId}/api/experiments/${experimentId}`;
+    if (!currentViewer) return;
+
+    if (button.dataset.loaded) {
+        const visible = button.dataset.visible !== 'true';
+        currentViewer.setMeshVisible(visible);
+        button.dataset.visible = String(visible);
+        button.textContent = visible ? 'Скрыть поверхность' : 'Показать поверхность';
+        return;
+    }
+
+    button.disabled = true;
+    button.textContent = 'Построение поверхности...';
+    waitForMesh(baseUrl, source)
+        .then(() => fetch(`${baseUrl}/mesh?source=${source}`))
+        .then(response => {
+            if (!response.ok) throw new Error(`Ошибка сервера: ${response.status}`);
+            const headerSize = Number(response.headers.get('X-Header-Size'));
+            const vertices = Number(response.headers.get('X-Vertices-Count'));
+            const triangles = Number(response.headers.get('X-Triangles-Count'));
+            return response.arrayBuffer().then(buffer => {
+                const positions = new Float32Array(buffer, headerSize, vertices * 3);
+                const normals = new Float32Array(buffer, headerSize + vertices * 12, vertices * 3);
+                const indices = new Uint32Array(buffer, headerSize + vertices * 24, triangles * 3);
+                currentViewer.setMesh(positions, normals, indices);
+            });
+        })
+        .then(() => {
+            button.dataset.loaded = 'true';
+            button.dataset.visible = 'true';
+            button.textContent = 'Скрыть поверхность';
+        })
+        .catch(err => {
+            button.textContent = 'Построить поверхность';
+            alert('Ошибка: ' + err.message);
+        })
+        .finally(() => { button.disabled = false; });
+}
+
+// Очистка от шумов на сервере: статистический фильтр, фильтр по радиусу и артефакты движения
+const NOISE_FILTER = 'sor_neighbors=16&sor_std_ratio=2&ror_radius=0.05&ror_min_neighbors=4&motion_threshold=200';
+
+function toggleFilter(userId, experimentId, button) {
+    const source = new URLSearchParams(window.location.search).get('source') || 'local';
+    const baseUrl = `/${userId}/api/experiments/${experimentId}`;
+    if (!currentViewer) return;
+
+    if (button.dataset.loaded) {
+        const visible = button.dataset.visible !== 'true';
+        currentViewer.setFilteredVisible(visible);
+        button.dataset.visible = String(visible);
+        button.textContent = visible ? 'Показать исходное облако' : 'Убрать шумы';
+        return;
+    }
+
+    button.disabled = true;
+    button.textContent = 'Фильтрация...';
+    fetch(`${baseUrl}/filtered?source=${source}&${NOISE_FILTER}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`Ошибка сервера: ${response.status}`);
+            const removed = Number(response.headers.get('X-Removed-Count'));
+            return response.arrayBuffer().then(buffer => {
+                currentViewer.setFiltered(new Float32Array(buffer));
+                button.title = `Удалено точек: ${removed.toLocaleString()}`;
+            });
+        })
+        .then(() => {
+            button.dataset.loaded = 'true';
+            button.dataset.visible = 'true';
+            button.textContent = 'Показать исходное облако';
+        })
+        .catch(err => {
+            button.textContent = 'Убрать шумы';
+            alert('Ошибка: ' + err.message);
+        })
+        .finally(() => { button.disabled = false; });
+}